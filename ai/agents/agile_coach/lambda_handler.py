@@ -1,9 +1,17 @@
 import os
 import json
-from typing import Dict, Any
+from typing import Dict, Any, AsyncIterator
 import openai
 from dotenv import load_dotenv
 
+from ai.shared.logging_utils import get_logger, request_context, Payload
+from ai.shared.response_parser import parse_response
+from ai.shared.prompt_budget import PromptBudgetError
+from ai.shared.story_schema import AgileCoachOutput, structured_output_enabled, function_call_args, parse_function_call
+from ai.shared.llm_client import acreate_chat_completion, astream_chat_completion, create_chat_completion, run_sync
+
+logger = get_logger(__name__)
+
 # Load environment variables
 load_dotenv()
 
@@ -43,6 +51,38 @@ Additional Suggestions:
 
 Please ensure the improved story and acceptance criteria sections are clearly marked as they will be automatically extracted."""
 
+def build_agile_coach_request(story_text: str, acceptance_criteria: list, context: str) -> Dict[str, Any]:
+    """
+    Build the chat completion arguments used by both the buffered and streaming handlers
+    """
+    formatted_prompt = AGILE_COACH_PROMPT.format(
+        story=story_text,
+        acceptance_criteria="\n".join(f"- {ac}" for ac in acceptance_criteria),
+        context=context
+    )
+    return {
+        'model': "gpt-4",
+        'messages': [
+            {"role": "system", "content": "You are an experienced Agile Coach."},
+            {"role": "user", "content": formatted_prompt}
+        ],
+        'temperature': 0.7,
+        'max_tokens': 1000
+    }
+
+async def stream_analysis(story_text: str, acceptance_criteria: list, context: str) -> AsyncIterator[str]:
+    """
+    Stream the Agile Coach analysis as text fragments while GPT generates it
+    """
+    if not openai.api_key:
+        openai.api_key = os.getenv('OPENAI_API_KEY')
+        openai.organization = os.getenv('OPENAI_ORG_ID')
+    
+    async for fragment in astream_chat_completion(
+        **build_agile_coach_request(story_text, acceptance_criteria, context)
+    ):
+        yield fragment
+
 def analyze_story(story_text: str, acceptance_criteria: list, context: str) -> Dict[str, Any]:
     """
     Analyze and improve a user story using OpenAI's GPT model.
@@ -51,7 +91,7 @@ def analyze_story(story_text: str, acceptance_criteria: list, context: str) -> D
         # Format acceptance criteria for the prompt
         formatted_ac = "\n".join(f"- {ac}" for ac in acceptance_criteria) if acceptance_criteria else "None provided"
         
-        response = openai.ChatCompletion.create(
+        response = create_chat_completion(
             model="gpt-4",
             messages=[
                 {"role": "system", "content": "You are an experienced Agile Coach, with 10 years of experience leading scrum teams as a scrum master."},
@@ -77,19 +117,19 @@ def analyze_story(story_text: str, acceptance_criteria: list, context: str) -> D
         }
         
     except Exception as e:
-        print(f"Error in analyze_story: {str(e)}")  # Debug logging
+        logger.exception("Error in analyze_story: %s", e)
         return {
             'error': str(e),
             'status': 'error'
         }
 
-def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+async def async_lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     """
-    AWS Lambda handler for Agile Coach analysis
+    Agile Coach analysis as a coroutine, so the OpenAI call doesn't block the event loop
     """
     try:
-        print("AgileCoach Lambda started")
-        print(f"Event received: {json.dumps(event, indent=2)}")
+        logger.info("AgileCoach Lambda started")
+        logger.debug("Event received: %s", Payload(event))
         
         # Get the story details from the event body
         if isinstance(event.get('body'), str):
@@ -110,56 +150,32 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 })
             }
         
-        # Configure OpenAI
-        openai.api_key = os.getenv('OPENAI_API_KEY')
-        openai.organization = os.getenv('OPENAI_ORG_ID')
+        # Configure OpenAI unless credentials were already loaded at startup
+        if not openai.api_key:
+            openai.api_key = os.getenv('OPENAI_API_KEY')
+            openai.organization = os.getenv('OPENAI_ORG_ID')
         
-        formatted_prompt = AGILE_COACH_PROMPT.format(
-            story=story_text,
-            acceptance_criteria="\n".join(f"- {ac}" for ac in acceptance_criteria),
-            context=context
-        )
+        request = build_agile_coach_request(story_text, acceptance_criteria, context)
+        structured_mode = structured_output_enabled(body)
+        if structured_mode:
+            request.update(function_call_args(AgileCoachOutput))
         
         # Create the analysis
-        response = openai.ChatCompletion.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": "You are an experienced Agile Coach."},
-                {"role": "user", "content": formatted_prompt}
-            ],
-            temperature=0.7,
-            max_tokens=1000
-        )
-        
-        analysis = response.choices[0].message.content
-        print(f"OpenAI Response: {analysis}")
-        
-        # Extract improved story and acceptance criteria
-        improved_story = None
-        improved_ac = []
-        
-        story_marker = "\nImproved Story:\n"
-        ac_marker = "\nEnhanced Acceptance Criteria:\n"
+        response = await acreate_chat_completion(**request)
         
-        story_start = analysis.find(story_marker)
-        if story_start != -1:
-            story_start += len(story_marker)
-            story_end = analysis.find(ac_marker, story_start)
-            if story_end != -1:
-                improved_story = analysis[story_start:story_end].strip()
-        
-        ac_start = analysis.find(ac_marker)
-        if ac_start != -1:
-            ac_start += len(ac_marker)
-            ac_end = analysis.find("\nAdditional Suggestions:", ac_start)
-            if ac_end == -1:
-                ac_end = len(analysis)
-            ac_text = analysis[ac_start:ac_end].strip()
-            improved_ac = [
-                line.strip('- ').strip()
-                for line in ac_text.split('\n')
-                if line.strip('- ').strip()
-            ]
+        structured = parse_function_call(response, AgileCoachOutput) if structured_mode else None
+        if structured:
+            analysis = structured.to_text()
+            improved_story = structured.improved_story
+            improved_ac = structured.acceptance_criteria
+        else:
+            analysis = response.choices[0].message.content or ''
+            logger.debug("OpenAI Response: %s", Payload(analysis))
+            
+            # Extract improved story and acceptance criteria
+            parsed = parse_response(analysis)
+            improved_story = parsed.improved_story
+            improved_ac = parsed.acceptance_criteria
         
         return {
             'statusCode': 200,
@@ -171,15 +187,24 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'context': context,
                     'version': 1
                 } if improved_story else None,
+                'structured': structured.to_dict() if structured else None,
                 'suggestions': {},
                 'status': 'success'
             })
         }
         
+    except PromptBudgetError as e:
+        logger.warning("Rejected oversized prompt: %s", e)
+        return {
+            'statusCode': 413,
+            'body': json.dumps({
+                'error': str(e),
+                'status': 'error'
+            })
+        }
+        
     except Exception as e:
-        print(f"Lambda handler error: {str(e)}")
-        import traceback
-        print(f"Full traceback:\n{traceback.format_exc()}")
+        logger.exception("Lambda handler error: %s", e)
         return {
             'statusCode': 500,
             'body': json.dumps({
@@ -188,6 +213,13 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             })
         }
 
+def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    """
+    AWS Lambda handler for Agile Coach analysis
+    """
+    with request_context(getattr(context, 'aws_request_id', None)):
+        return run_sync(async_lambda_handler(event, context))
+
 if __name__ == '__main__':
     # Local testing
     test_event = {
@@ -4,6 +4,15 @@ from typing import Dict, Any
 import openai
 from dotenv import load_dotenv
 from pathlib import Path
+from functools import lru_cache
+
+from ai.shared.logging_utils import get_logger, request_context, Payload
+from ai.shared.prompt_budget import PromptBudgetError
+from ai.shared.story_schema import SeniorDevOutput, structured_output_enabled, function_call_args, parse_function_call
+from ai.shared.llm_client import acreate_chat_completion, run_sync
+from ai.shared.llm_backend import get_llm_backend
+
+logger = get_logger(__name__)
 
 SENIOR_DEV_PROMPT = """You are an experienced Senior Developer reviewing user stories.
 Given the following user story and acceptance criteria, please review it for technical feasibility and implementation details:
@@ -35,47 +44,46 @@ Implementation Details:
 - Security: [Security considerations]
 - Testing: [Testing approach]"""
 
+@lru_cache(maxsize=1)
 def get_openai_key():
-    """Get OpenAI key from env.json"""
+    """Get OpenAI key from env.json (read once per process)"""
     try:
         # Get project root (similar to test_feedback.py)
         project_root = Path(__file__).parents[3].absolute()
         env_path = project_root / 'env.json'
-        print(f"Looking for env.json at: {env_path}")
+        logger.debug("Looking for env.json at: %s", env_path)
         
         with open(env_path) as f:
             env_vars = json.load(f)
             return env_vars['SeniorDevFunction']['OPENAI_API_KEY']
     except Exception as e:
-        print(f"Error reading env.json: {e}")
+        logger.warning("Error reading env.json: %s", e)
         return None
 
-def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+async def async_lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     """
-    AWS Lambda handler for Senior Dev analysis
+    Senior Dev analysis as a coroutine, so the OpenAI call doesn't block the event loop
     """
     try:
-        print("SeniorDev Lambda started")
-        print(f"Event received: {json.dumps(event, indent=2)}")
+        logger.info("SeniorDev Lambda started")
+        logger.debug("Event received: %s", Payload(event))
         
-        # Configure OpenAI directly from file
-        openai.api_key = get_openai_key()
-        print(f"OpenAI Key loaded: {bool(openai.api_key)}")
+        # Configure OpenAI from file, keeping any key already loaded at startup
+        openai.api_key = get_openai_key() or openai.api_key
+        logger.debug("OpenAI Key loaded: %s", bool(openai.api_key))
         
         # Get the story details from the event body
         if isinstance(event.get('body'), str):
             body = json.loads(event.get('body', '{}'))
         else:
             body = event.get('body', {})
-            
-        print(f"Parsed body: {json.dumps(body, indent=2)}")
         
         story_text = body.get('story', '')
         acceptance_criteria = body.get('acceptance_criteria', [])
         context = body.get('context', '')
         
         if not story_text:
-            print("No story text provided")
+            logger.warning("No story text provided")
             return {
                 'statusCode': 400,
                 'body': json.dumps({
@@ -84,7 +92,7 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 })
             }
         
-        if not openai.api_key:
+        if not openai.api_key and get_llm_backend().requires_credentials:
             return {
                 'statusCode': 500,
                 'body': json.dumps({
@@ -93,12 +101,9 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 })
             }
         
-        print("Making OpenAI API call...")
-        
-        # Create the analysis
-        response = openai.ChatCompletion.create(
-            model="gpt-4",
-            messages=[
+        request = {
+            'model': "gpt-4",
+            'messages': [
                 {"role": "system", "content": "You are an experienced Senior Developer."},
                 {"role": "user", "content": SENIOR_DEV_PROMPT.format(
                     story=story_text,
@@ -106,31 +111,57 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     context=context
                 )}
             ],
-            temperature=0.7,
-            max_tokens=1000
-        )
+            'temperature': 0.7,
+            'max_tokens': 1000
+        }
+        structured_mode = structured_output_enabled(body)
+        if structured_mode:
+            request.update(function_call_args(SeniorDevOutput))
+        
+        # Create the analysis
+        response = await acreate_chat_completion(**request)
         
-        analysis = response.choices[0].message.content
-        print(f"OpenAI Response: {analysis}")
+        structured = parse_function_call(response, SeniorDevOutput) if structured_mode else None
+        if structured:
+            analysis = structured.to_text()
+        else:
+            analysis = response.choices[0].message.content or ''
+            logger.debug("OpenAI Response: %s", Payload(analysis))
         
         # Return the analysis in the correct format
         return {
             'statusCode': 200,
             'body': json.dumps({
                 'analysis': analysis,
+                'structured': structured.to_dict() if structured else None,
                 'suggestions': {},
                 'status': 'success'
             }, ensure_ascii=False)
         }
         
+    except PromptBudgetError as e:
+        logger.warning("Rejected oversized prompt: %s", e)
+        return {
+            'statusCode': 413,
+            'body': json.dumps({
+                'error': str(e),
+                'status': 'error'
+            })
+        }
+        
     except Exception as e:
-        print(f"Lambda handler error: {str(e)}")
-        import traceback
-        print(f"Full traceback:\n{traceback.format_exc()}")
+        logger.exception("Lambda handler error: %s", e)
         return {
             'statusCode': 500,
             'body': json.dumps({
                 'error': str(e),
                 'status': 'error'
             })
-        }
\ No newline at end of file
+        }
+
+def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    """
+    AWS Lambda handler for Senior Dev analysis
+    """
+    with request_context(getattr(context, 'aws_request_id', None)):
+        return run_sync(async_lambda_handler(event, context))
@@ -1,11 +1,26 @@
+import os
 from abc import ABC, abstractmethod
 from typing import Dict, Any, Optional
 import json
-import openai
+
+from ai.shared.llm_client import create_chat_completion
+from ai.shared.logging_utils import get_logger
+from ai.shared.metrics import traced
+from ai.shared.prompt_budget import PromptBudgetError, compact_context
+from ai.shared.prompt_layout import SHARED_PREFIX, POINT_OUTPUT_FORMAT, prompt_layout, build_estimation_messages
+from ai.shared.story_schema import PointEstimateOutput, structured_output_enabled, function_call_args, parse_function_call
+
+logger = get_logger(__name__)
+
+# Socket-level bound on each call; the fan-out enforces the same deadline (see ai.workflow.deadlines)
+REQUEST_TIMEOUT_S = float(os.getenv('ESTIMATION_PERSONA_TIMEOUT_S', 30))
 
 class BaseTeamMemberPoints(ABC):
     """Base class for all team members using story points"""
     
+    # Schema used when structured output is enabled
+    output_schema = PointEstimateOutput
+    
     def __init__(self, name: str, role: str, experience_years: int):
         self.name = name
         self.role = role
@@ -17,6 +32,8 @@ class BaseTeamMemberPoints(ABC):
         """Return the specific prompt for this team member"""
         pass
     
+    @traced('estimate_effort', labels=lambda self, *args, **kwargs: {'persona': self.name},
+            is_error=lambda response: response['statusCode'] != 200)
     def estimate_effort(self, event: Dict[str, Any], context: Any = None) -> Dict[str, Any]:
         """
         Estimate effort for the story based on team member's experience
@@ -31,25 +48,41 @@ class BaseTeamMemberPoints(ABC):
                 
             story_text = body.get('story', '')
             acceptance_criteria = body.get('acceptance_criteria', [])
-            context = body.get('context', '')
-            
-            # Get the specific prompt for this team member
-            prompt = self.get_prompt(story_text, acceptance_criteria, context)
+            # Only complexity, dependencies and risks of the technical review matter for estimates
+            context = compact_context(body.get('context', ''))
             
-            # Make OpenAI call
-            response = openai.ChatCompletion.create(
-                model="gpt-4",
-                messages=[
+            # Story content first so the whole team shares a cacheable prompt prefix
+            if prompt_layout() == SHARED_PREFIX:
+                guidance = (f"When estimating, you MUST use the Fibonacci sequence: {self.fibonacci_points} points. "
+                            "Choose the number that best represents the complexity and effort required.")
+                messages = build_estimation_messages(self, story_text, acceptance_criteria, context,
+                                                     POINT_OUTPUT_FORMAT, guidance)
+            else:
+                messages = [
                     {"role": "system", "content": f"""You are a {self.role} with {self.experience_years} years of experience.
                     When estimating, you MUST use the Fibonacci sequence: {self.fibonacci_points} points.
                     Choose the number that best represents the complexity and effort required."""},
-                    {"role": "user", "content": prompt}
-                ],
+                    {"role": "user", "content": self.get_prompt(story_text, acceptance_criteria, context)}
+                ]
+            
+            # Build the OpenAI request
+            request = dict(
+                model="gpt-4",
+                messages=messages,
                 temperature=0.7,
-                max_tokens=1000
+                max_tokens=1000,
+                request_timeout=REQUEST_TIMEOUT_S
             )
             
-            analysis = response.choices[0].message.content
+            structured_mode = structured_output_enabled(body)
+            if structured_mode:
+                request.update(function_call_args(self.output_schema))
+            
+            # Make OpenAI call
+            response = create_chat_completion(**request)
+            
+            structured = parse_function_call(response, self.output_schema) if structured_mode else None
+            analysis = structured.to_text() if structured else (response.choices[0].message.content or '')
             
             return {
                 'statusCode': 200,
@@ -60,12 +93,23 @@ class BaseTeamMemberPoints(ABC):
                         'experience': self.experience_years
                     },
                     'analysis': analysis,
+                    'structured': structured.to_dict() if structured else None,
                     'status': 'success'
                 })
             }
             
+        except PromptBudgetError as e:
+            logger.warning("Rejected oversized prompt: %s", e)
+            return {
+                'statusCode': 413,
+                'body': json.dumps({
+                    'error': str(e),
+                    'status': 'error'
+                })
+            }
+            
         except Exception as e:
-            print(f"Error in estimate_effort: {str(e)}")
+            logger.exception("Error in estimate_effort (%s): %s", self.name, e)
             return {
                 'statusCode': 500,
                 'body': json.dumps({
@@ -0,0 +1,127 @@
+import os
+import threading
+from typing import Dict, Any, Optional
+
+import aiohttp
+import openai
+import requests
+from requests.adapters import HTTPAdapter
+
+# Matches the person-day team fan-out in ai.workflow.story_handler_days
+DEFAULT_POOL_SIZE = int(os.getenv('OPENAI_POOL_SIZE', 8))
+MAX_CONNECTION_RETRIES = 2
+
+
+class SharedHTTPAdapter(HTTPAdapter):
+    """
+    HTTPAdapter whose connection pool outlives individual sessions.
+    openai keeps one session per thread and closes it periodically;
+    closing that session must not drop the shared keep-alive connections.
+    """
+
+    def close(self):
+        pass
+
+    def shutdown(self):
+        super().close()
+
+
+class OpenAIConnectionPool:
+    """Thread-safe keep-alive pool used by every synchronous OpenAI call"""
+
+    def __init__(self, maxsize: int = DEFAULT_POOL_SIZE):
+        self.maxsize = maxsize
+        self.sessions_created = 0
+        self._lock = threading.Lock()
+        self.adapter = SharedHTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=maxsize,
+            max_retries=MAX_CONNECTION_RETRIES
+        )
+        # aiohttp counters, filled in by the trace config below
+        self.async_connections_created = 0
+        self.async_connections_reused = 0
+
+    def session_factory(self) -> requests.Session:
+        """Create a per-thread session that sends through the shared adapter"""
+        session = requests.Session()
+        session.mount('https://', self.adapter)
+        session.mount('http://', self.adapter)
+        if openai.proxy:
+            session.proxies = openai.proxy if isinstance(openai.proxy, dict) else {'https': openai.proxy, 'http': openai.proxy}
+        with self._lock:
+            self.sessions_created += 1
+        return session
+
+    def trace_config(self) -> aiohttp.TraceConfig:
+        """aiohttp trace hooks that count new vs reused connections"""
+        async def on_create(session, ctx, params):
+            with self._lock:
+                self.async_connections_created += 1
+
+        async def on_reuse(session, ctx, params):
+            with self._lock:
+                self.async_connections_reused += 1
+
+        config = aiohttp.TraceConfig()
+        config.on_connection_create_end.append(on_create)
+        config.on_connection_reuseconn.append(on_reuse)
+        return config
+
+    def create_aiosession(self) -> aiohttp.ClientSession:
+        """Create an aiohttp session sized like the sync pool"""
+        return aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.maxsize),
+            trace_configs=[self.trace_config()]
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        hosts = []
+        pools = self.adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            try:
+                pool = pools[key]
+            except KeyError:
+                continue
+            hosts.append({
+                'host': pool.host,
+                'connections_created': pool.num_connections,
+                'requests': pool.num_requests,
+                'reused': max(pool.num_requests - pool.num_connections, 0),
+                'idle': pool.pool.qsize() if pool.pool else 0
+            })
+        return {
+            'maxsize': self.maxsize,
+            'sessions_created': self.sessions_created,
+            'hosts': hosts,
+            'async': {
+                'connections_created': self.async_connections_created,
+                'connections_reused': self.async_connections_reused
+            }
+        }
+
+    def close(self) -> None:
+        self.adapter.shutdown()
+
+
+_pool: Optional[OpenAIConnectionPool] = None
+_pool_lock = threading.Lock()
+
+
+def configure_http_pool(maxsize: int = DEFAULT_POOL_SIZE) -> OpenAIConnectionPool:
+    """Install a shared pool of the given size as openai's session source"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool.maxsize == maxsize:
+            return _pool
+        old_pool = _pool
+        _pool = OpenAIConnectionPool(maxsize)
+        openai.requestssession = _pool.session_factory
+    if old_pool is not None:
+        old_pool.close()
+    return _pool
+
+
+def get_http_pool() -> OpenAIConnectionPool:
+    """Return the shared pool, creating the default one on first use"""
+    return _pool or configure_http_pool()
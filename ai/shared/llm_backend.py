@@ -0,0 +1,335 @@
+import os
+import re
+import json
+import math
+import time
+import random
+import asyncio
+import hashlib
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Any, List, Optional, AsyncIterator
+
+import openai
+from openai.util import convert_to_openai_object
+
+from ai.shared.story_schema import FIBONACCI_POINTS, LEVELS, INVEST_KEYS
+from ai.shared.logging_utils import get_logger
+
+logger = get_logger(__name__)
+
+
+class LLMBackend(ABC):
+    """Where chat completions come from; llm_client routes every agent call through one of these"""
+    name = 'base'
+    # False for backends that don't talk to OpenAI, so credential checks can be skipped
+    requires_credentials = True
+
+    @abstractmethod
+    def create(self, **kwargs) -> Any:
+        """Blocking chat completion"""
+        pass
+
+    @abstractmethod
+    async def acreate(self, session=None, **kwargs) -> Any:
+        """Awaitable chat completion"""
+        pass
+
+    @abstractmethod
+    async def astream(self, session=None, **kwargs) -> AsyncIterator[Any]:
+        """Awaitable streaming chat completion yielding delta chunks"""
+        pass
+
+
+class OpenAIBackend(LLMBackend):
+    """The real OpenAI API via the openai 0.28 client"""
+    name = 'openai'
+
+    def create(self, **kwargs) -> Any:
+        return openai.ChatCompletion.create(**kwargs)
+
+    async def acreate(self, session=None, **kwargs) -> Any:
+        token = openai.aiosession.set(session)
+        try:
+            return await openai.ChatCompletion.acreate(**kwargs)
+        finally:
+            openai.aiosession.reset(token)
+
+    async def astream(self, session=None, **kwargs) -> AsyncIterator[Any]:
+        token = openai.aiosession.set(session)
+        try:
+            chunks = await openai.ChatCompletion.acreate(stream=True, **kwargs)
+        finally:
+            openai.aiosession.reset(token)
+        async for chunk in chunks:
+            yield chunk
+
+
+@dataclass
+class FakeLLMConfig:
+    """
+    Latency and failure model for FakeLLMBackend. Time to first token is drawn from
+    the latency distribution ('fixed', 'uniform' or 'lognormal' around latency_ms);
+    the rest of the completion is paced at tokens_per_second.
+    """
+    latency_ms: float = 800.0
+    latency_jitter_ms: float = 400.0
+    distribution: str = 'lognormal'
+    tokens_per_second: float = 40.0
+    error_rate: float = 0.0
+    rate_limit_share: float = 0.5  # share of injected errors that are 429s rather than 500s
+    prompt_cache_min_tokens: int = 1024  # shortest prefix reported as cached, as with OpenAI
+    seed: int = 0
+
+    @classmethod
+    def from_env(cls) -> "FakeLLMConfig":
+        return cls(
+            latency_ms=float(os.getenv('FAKE_LLM_LATENCY_MS', cls.latency_ms)),
+            latency_jitter_ms=float(os.getenv('FAKE_LLM_JITTER_MS', cls.latency_jitter_ms)),
+            distribution=os.getenv('FAKE_LLM_DISTRIBUTION', cls.distribution),
+            tokens_per_second=float(os.getenv('FAKE_LLM_TOKENS_PER_SECOND', cls.tokens_per_second)),
+            error_rate=float(os.getenv('FAKE_LLM_ERROR_RATE', cls.error_rate)),
+            prompt_cache_min_tokens=int(os.getenv('FAKE_LLM_PROMPT_CACHE_MIN_TOKENS', cls.prompt_cache_min_tokens)),
+            seed=int(os.getenv('FAKE_LLM_SEED', cls.seed))
+        )
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token) used by the fake backend"""
+    return max(1, len(text) // 4)
+
+
+class FakeLLMBackend(LLMBackend):
+    """
+    Offline stand-in for load and latency testing. Produces responses in the layouts
+    each agent's prompt asks for (so the response parser and estimate extraction work
+    unchanged), honours function calling for structured output, reports usage, and
+    injects latency and errors according to FakeLLMConfig. Content is deterministic
+    for a given request and seed.
+    """
+    name = 'fake'
+    requires_credentials = False
+
+    def __init__(self, config: Optional[FakeLLMConfig] = None):
+        self.config = config or FakeLLMConfig.from_env()
+        self._rng = random.Random(self.config.seed)
+        self._rng_lock = threading.Lock()
+        self.calls = 0
+        self._prefixes: "OrderedDict[str, None]" = OrderedDict()
+        self._prefixes_lock = threading.Lock()
+
+    # --- latency and errors ---
+
+    def _sample_latency(self) -> float:
+        """Seconds until the first token"""
+        c = self.config
+        with self._rng_lock:
+            if c.distribution == 'fixed':
+                ms = c.latency_ms
+            elif c.distribution == 'uniform':
+                ms = self._rng.uniform(c.latency_ms - c.latency_jitter_ms, c.latency_ms + c.latency_jitter_ms)
+            else:
+                # Lognormal with the configured median and a long right tail, like real API latency
+                sigma = min(math.log1p(c.latency_jitter_ms / c.latency_ms), 1.0) if c.latency_ms > 0 else 0
+                ms = c.latency_ms * self._rng.lognormvariate(0, sigma)
+        return max(ms, 0) / 1000
+
+    def _maybe_fail(self) -> None:
+        with self._rng_lock:
+            self.calls += 1
+            roll = self._rng.random()
+            rate_limited = self._rng.random() < self.config.rate_limit_share
+        if roll < self.config.error_rate:
+            if rate_limited:
+                raise openai.error.RateLimitError("Fake backend: rate limit reached", http_status=429)
+            raise openai.error.APIError("Fake backend: internal server error", http_status=500)
+
+    def _generation_time(self, text: str) -> float:
+        if self.config.tokens_per_second <= 0:
+            return 0
+        return estimate_tokens(text) / self.config.tokens_per_second
+
+    def _cached_prompt_tokens(self, messages: List[Dict[str, Any]]) -> int:
+        """
+        Simulate provider prompt caching: the longest whole-message prefix seen
+        before counts as cached, in 128-token steps from prompt_cache_min_tokens
+        """
+        cached = 0
+        tokens = 0
+        digest = hashlib.sha256()
+        with self._prefixes_lock:
+            for message in messages:
+                digest.update(json.dumps(message, sort_keys=True).encode('utf-8'))
+                tokens += estimate_tokens(message.get('content') or '')
+                key = digest.hexdigest()
+                if key in self._prefixes:
+                    self._prefixes.move_to_end(key)
+                    cached = tokens
+                else:
+                    self._prefixes[key] = None
+            while len(self._prefixes) > 10000:
+                self._prefixes.popitem(last=False)
+        if cached < self.config.prompt_cache_min_tokens:
+            return 0
+        return cached - cached % 128
+
+    # --- responses ---
+
+    def create(self, **kwargs) -> Any:
+        response, content = self._build(kwargs)
+        time.sleep(self._sample_latency() + self._generation_time(content))
+        self._maybe_fail()
+        return response
+
+    async def acreate(self, session=None, **kwargs) -> Any:
+        response, content = self._build(kwargs)
+        await asyncio.sleep(self._sample_latency() + self._generation_time(content))
+        self._maybe_fail()
+        return response
+
+    async def astream(self, session=None, **kwargs) -> AsyncIterator[Any]:
+        response, content = self._build(kwargs)
+        await asyncio.sleep(self._sample_latency())
+        self._maybe_fail()
+        pieces = re.findall(r'\S+\s*', content)
+        delay = 1 / self.config.tokens_per_second if self.config.tokens_per_second > 0 else 0
+        for i, piece in enumerate(pieces):
+            await asyncio.sleep(delay)
+            yield convert_to_openai_object({
+                'object': 'chat.completion.chunk',
+                'model': kwargs.get('model'),
+                'choices': [{'index': 0, 'delta': {'content': piece},
+                             'finish_reason': 'stop' if i == len(pieces) - 1 else None}]
+            })
+
+    def _build(self, request: Dict[str, Any]):
+        messages = request.get('messages', [])
+        prompt = "\n".join(m.get('content') or '' for m in messages)
+        digest = hashlib.sha256(f"{self.config.seed}:{prompt}".encode('utf-8')).digest()
+        rng = random.Random(digest)
+        fields = self._fields(prompt, rng)
+
+        message: Dict[str, Any] = {'role': 'assistant', 'content': fields['text']}
+        functions = request.get('functions')
+        if functions:
+            arguments = self._function_arguments(functions[0]['name'], fields, prompt, rng)
+            message = {'role': 'assistant', 'content': None,
+                       'function_call': {'name': functions[0]['name'], 'arguments': json.dumps(arguments)}}
+            content = message['function_call']['arguments']
+        else:
+            content = fields['text']
+
+        prompt_tokens = estimate_tokens(prompt)
+        completion_tokens = estimate_tokens(content)
+        cached_tokens = min(self._cached_prompt_tokens(messages), prompt_tokens)
+        response = convert_to_openai_object({
+            'id': f"fake-{digest.hex()[:12]}",
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': request.get('model'),
+            'choices': [{'index': 0, 'message': message,
+                         'finish_reason': 'function_call' if functions else 'stop'}],
+            'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+                      'total_tokens': prompt_tokens + completion_tokens,
+                      'prompt_tokens_details': {'cached_tokens': cached_tokens}}
+        })
+        return response, content
+
+    def _fields(self, prompt: str, rng: random.Random) -> Dict[str, Any]:
+        """Pick the agent from its prompt and generate matching content"""
+        story_match = re.search(r'Story:\s*\n?(.+)', prompt)
+        story = story_match.group(1).strip() if story_match else "the requested feature"
+        criteria = re.findall(r'^- (.+)$', prompt.split('Context')[0], re.MULTILINE)[:5] or ["The feature works as described"]
+        confidence = rng.choice(LEVELS)
+
+        if 'Story Points' in prompt or 'story point' in prompt.lower():
+            points = rng.choice(FIBONACCI_POINTS[1:6])
+            return {'kind': 'points', 'story_points': points, 'confidence': confidence, 'text': (
+                f"Story Points: {points}\nConfidence Level: {confidence}\n\n"
+                f"Technical Considerations:\n- Validation and persistence for: {story[:80]}\n\n"
+                f"Risk Factors:\n- Integration with existing services\n\n"
+                f"Explanation:\nSimulated estimate of {points} points.")}
+
+        if 'person-days' in prompt.lower():
+            days = round(rng.uniform(1, 10) * 2) / 2
+            return {'kind': 'days', 'person_days': days, 'confidence': confidence, 'text': (
+                f"Effort Estimate:\n- Person-days: {days}\n- Confidence Level: {confidence}\n\n"
+                f"Technical Considerations:\n- Validation and persistence for: {story[:80]}\n\n"
+                f"Risk Factors:\n- Integration with existing services\n\n"
+                f"Explanation:\nSimulated estimate of {days} person-days.")}
+
+        enhanced = [f"{ac} and the result is confirmed to the user" for ac in criteria]
+        if 'technical feasibility' in prompt.lower():
+            feasibility, complexity = rng.choice(LEVELS), rng.choice(LEVELS)
+            return {'kind': 'technical', 'feasibility': feasibility, 'complexity': complexity,
+                    'story': story, 'criteria': enhanced, 'text': (
+                f"Technical Analysis:\n- Feasibility: {feasibility}\n- Complexity: {complexity}\n"
+                f"- Dependencies: API service, database\n- Technical Risks: Input validation edge cases\n\n"
+                f"Improved version of the story:\n{story}\n\n"
+                f"Enhanced acceptance criteria:\n" + "\n".join(f"- {ac}" for ac in enhanced) + "\n\n"
+                "Implementation Details:\n- Architecture: Service endpoint and UI form\n"
+                "- Data Flow: Client to API to database\n- Security: Authenticated users only\n"
+                "- Testing: Unit and integration tests")}
+
+        return {'kind': 'agile', 'story': story, 'criteria': enhanced, 'text': (
+            "INVEST Analysis:\n" + "\n".join(f"- {k.capitalize()}: Simulated assessment." for k in INVEST_KEYS) + "\n\n"
+            f"Improved Story:\n{story}\n\n"
+            f"Enhanced Acceptance Criteria:\n" + "\n".join(f"- {ac}" for ac in enhanced) + "\n\n"
+            "Additional Suggestions:\nThis response was generated by the offline fake backend.")}
+
+    def _function_arguments(self, function_name: str, fields: Dict[str, Any], prompt: str = '',
+                            rng: Optional[random.Random] = None) -> Dict[str, Any]:
+        """Arguments for the structured-output function the agent asked for"""
+        estimate = {'confidence': fields.get('confidence', 'Medium'), 'technical_considerations': ['Simulated'],
+                    'risk_factors': ['Simulated'], 'explanation': 'Simulated estimate.'}
+        if function_name in ('submit_team_day_estimates', 'submit_team_point_estimates'):
+            # Panel prompts list each persona as "### Name (Role, N years)"
+            rng = rng or random.Random(self.config.seed)
+            names = re.findall(r'^### (.+?) \(', prompt, re.MULTILINE)
+            if function_name == 'submit_team_day_estimates':
+                return {'estimates': [{'name': name, 'person_days': round(rng.uniform(1, 10) * 2) / 2, **estimate}
+                                      for name in names]}
+            return {'estimates': [{'name': name, 'story_points': rng.choice(FIBONACCI_POINTS[1:6]), **estimate}
+                                  for name in names]}
+        if function_name == 'submit_day_estimate':
+            return {'person_days': fields.get('person_days', 3.0), **estimate}
+        if function_name == 'submit_point_estimate':
+            return {'story_points': fields.get('story_points', 3), **estimate}
+        if function_name == 'submit_technical_review':
+            return {'feasibility': fields.get('feasibility', 'High'), 'complexity': fields.get('complexity', 'Medium'),
+                    'dependencies': ['API service', 'database'], 'technical_risks': ['Input validation edge cases'],
+                    'acceptance_criteria': fields.get('criteria', []),
+                    'implementation_details': {'architecture': 'Service endpoint and UI form'}}
+        return {'invest_analysis': {k: 'Simulated assessment.' for k in INVEST_KEYS},
+                'improved_story': fields.get('story', ''), 'acceptance_criteria': fields.get('criteria', []),
+                'additional_suggestions': 'Generated by the offline fake backend.'}
+
+
+_backend: Optional[LLMBackend] = None
+_backend_lock = threading.Lock()
+
+
+def build_backend_from_env() -> LLMBackend:
+    """LLM_BACKEND=fake selects the offline backend; anything else uses OpenAI"""
+    if os.getenv('LLM_BACKEND', 'openai').lower() == 'fake':
+        logger.info("Using offline fake LLM backend")
+        return FakeLLMBackend()
+    return OpenAIBackend()
+
+
+def get_llm_backend() -> LLMBackend:
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = build_backend_from_env()
+    return _backend
+
+
+def set_llm_backend(backend: LLMBackend) -> None:
+    """Install a backend for every agent (e.g. FakeLLMBackend in load tests)"""
+    global _backend
+    with _backend_lock:
+        _backend = backend
@@ -0,0 +1,243 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+from ai.shared.logging_utils import get_logger
+
+logger = get_logger(__name__)
+
+# Request fields that change transport behaviour but not the completion itself
+NON_SEMANTIC_FIELDS = {'request_timeout', 'api_key', 'organization', 'api_base', 'headers', 'stream'}
+
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+DEFAULT_MAX_ENTRIES = 512
+
+
+def make_cache_key(request: Dict[str, Any], backend: str = 'openai') -> str:
+    """
+    Build a content-addressed key for a chat completion request.
+    Message text is whitespace-trimmed and keys are sorted so equivalent
+    requests hash the same regardless of formatting. backend (an LLMBackend
+    name) is part of the key, so simulated completions never answer a real call.
+    """
+    normalized = {k: v for k, v in request.items() if k not in NON_SEMANTIC_FIELDS}
+    normalized['backend'] = backend
+    normalized['messages'] = [
+        {'role': m.get('role'), 'content': (m.get('content') or '').strip()}
+        for m in request.get('messages', [])
+    ]
+    if 'temperature' in normalized:
+        normalized['temperature'] = float(normalized['temperature'])
+    payload = json.dumps(normalized, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class LLMCache(ABC):
+    """Base class for LLM response caches"""
+
+    def __init__(self, ttl_seconds: float = DEFAULT_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+
+    @abstractmethod
+    def _get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the stored response or None if missing or expired"""
+        pass
+
+    @abstractmethod
+    def _set(self, key: str, value: Dict[str, Any]) -> None:
+        """Store a response"""
+        pass
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        value = self._get(key)
+        with self._stats_lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        self._set(key, value)
+
+    def _expired(self, stored_at: float) -> bool:
+        return self.ttl_seconds is not None and time.time() - stored_at > self.ttl_seconds
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            'type': type(self).__name__,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 3) if total else 0.0
+        }
+
+
+class MemoryLRUCache(LLMCache):
+    """In-process LRU cache with TTL eviction"""
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, ttl_seconds: float = DEFAULT_TTL_SECONDS):
+        super().__init__(ttl_seconds)
+        self.max_entries = max_entries
+        self.evictions = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, value = entry
+            if self._expired(stored_at):
+                del self._entries[key]
+                self.evictions += 1
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def _set(self, key: str, value: Dict[str, Any]) -> None:
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        stats.update({'entries': len(self._entries), 'evictions': self.evictions})
+        return stats
+
+
+class SQLiteCache(LLMCache):
+    """On-disk cache so responses survive restarts and are shared between workers"""
+
+    def __init__(self, path: str, ttl_seconds: float = DEFAULT_TTL_SECONDS):
+        super().__init__(ttl_seconds)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS llm_cache ('
+            'key TEXT PRIMARY KEY, stored_at REAL NOT NULL, response TEXT NOT NULL)'
+        )
+
+    def _get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT stored_at, response FROM llm_cache WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            stored_at, response = row
+            if self._expired(stored_at):
+                self._conn.execute('DELETE FROM llm_cache WHERE key = ?', (key,))
+                return None
+        return json.loads(response)
+
+    def _set(self, key: str, value: Dict[str, Any]) -> None:
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO llm_cache (key, stored_at, response) VALUES (?, ?, ?)',
+                (key, time.time(), json.dumps(value))
+            )
+
+    def purge_expired(self) -> int:
+        """Delete all expired rows and return how many were removed"""
+        if self.ttl_seconds is None:
+            return 0
+        with self._lock:
+            cursor = self._conn.execute(
+                'DELETE FROM llm_cache WHERE stored_at < ?', (time.time() - self.ttl_seconds,)
+            )
+            return cursor.rowcount
+
+
+class TieredCache(LLMCache):
+    """Memory LRU in front of a disk cache; disk hits are promoted to memory"""
+
+    def __init__(self, memory: MemoryLRUCache, disk: LLMCache):
+        super().__init__(memory.ttl_seconds)
+        self.memory = memory
+        self.disk = disk
+
+    def _get(self, key: str) -> Optional[Dict[str, Any]]:
+        value = self.memory.get(key)
+        if value is None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.set(key, value)
+        return value
+
+    def _set(self, key: str, value: Dict[str, Any]) -> None:
+        self.memory.set(key, value)
+        self.disk.set(key, value)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        stats.update({'memory': self.memory.stats(), 'disk': self.disk.stats()})
+        return stats
+
+
+_cache: Optional[LLMCache] = None
+_cache_configured = False
+_cache_lock = threading.Lock()
+
+
+def build_cache_from_env() -> Optional[LLMCache]:
+    """
+    Build the cache described by the environment:
+    - LLM_CACHE: "tiered" (default), "memory" or "off"
+    - LLM_CACHE_TTL: entry lifetime in seconds
+    - LLM_CACHE_MAX_ENTRIES: in-memory LRU size
+    - LLM_CACHE_PATH: SQLite file for the disk tier
+    """
+    mode = os.getenv('LLM_CACHE', 'tiered').lower()
+    if mode in ('off', 'none', '0', 'false'):
+        return None
+
+    ttl = float(os.getenv('LLM_CACHE_TTL', DEFAULT_TTL_SECONDS))
+    memory = MemoryLRUCache(
+        max_entries=int(os.getenv('LLM_CACHE_MAX_ENTRIES', DEFAULT_MAX_ENTRIES)),
+        ttl_seconds=ttl
+    )
+    if mode == 'memory':
+        return memory
+
+    path = os.getenv('LLM_CACHE_PATH', os.path.join(tempfile.gettempdir(), 'agilestories_llm_cache.sqlite3'))
+    try:
+        return TieredCache(memory, SQLiteCache(path, ttl_seconds=ttl))
+    except sqlite3.Error as e:
+        logger.warning("Could not open LLM cache at %s, using memory only: %s", path, e)
+        return memory
+
+
+def get_llm_cache() -> Optional[LLMCache]:
+    """Return the process-wide LLM cache (None when caching is disabled)"""
+    global _cache, _cache_configured
+    if not _cache_configured:
+        with _cache_lock:
+            if not _cache_configured:
+                _cache = build_cache_from_env()
+                _cache_configured = True
+    return _cache
+
+
+def set_llm_cache(cache: Optional[LLMCache]) -> None:
+    """Install a custom cache implementation, or None to disable caching"""
+    global _cache, _cache_configured
+    with _cache_lock:
+        _cache = cache
+        _cache_configured = True
@@ -0,0 +1,245 @@
+import atexit
+import asyncio
+import contextvars
+import threading
+import weakref
+from typing import Any, AsyncIterator, Awaitable, Dict, Optional, Tuple, TypeVar
+
+import aiohttp
+from openai.util import convert_to_openai_object
+
+from ai.shared.llm_cache import get_llm_cache, make_cache_key
+from ai.shared.http_pool import get_http_pool
+from ai.shared.llm_backend import OpenAIBackend, get_llm_backend, estimate_tokens
+from ai.shared.metrics import span
+from ai.shared.usage import record_usage
+from ai.shared.prompt_budget import fit_request, count_request_tokens
+from ai.shared.rate_limiter import get_rate_limiter, call_with_retries, acall_with_retries, retry_delay
+from ai.shared.scheduler import get_scheduler
+
+T = TypeVar('T')
+
+# One aiohttp session per event loop so concurrent requests on the same loop
+# share a connection pool instead of opening a new session per call.
+_aiosessions: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, aiohttp.ClientSession]" = weakref.WeakKeyDictionary()
+_aiosessions_lock = threading.Lock()
+
+
+def get_aiosession() -> aiohttp.ClientSession:
+    """Return the shared aiohttp session for the running event loop, creating it if needed"""
+    loop = asyncio.get_running_loop()
+    with _aiosessions_lock:
+        session = _aiosessions.get(loop)
+        if session is None or session.closed:
+            session = get_http_pool().create_aiosession()
+            _aiosessions[loop] = session
+        return session
+
+
+async def close_aiosession() -> None:
+    """Close the shared aiohttp session bound to the running event loop"""
+    loop = asyncio.get_running_loop()
+    with _aiosessions_lock:
+        session = _aiosessions.pop(loop, None)
+    if session is not None and not session.closed:
+        await session.close()
+
+
+def _cache_lookup(kwargs: Dict[str, Any]) -> Tuple[Optional[str], Any]:
+    """Return (cache key, cached response) for a request; both None when caching doesn't apply"""
+    cache = get_llm_cache()
+    if cache is None or kwargs.get('stream'):
+        return None, None
+    key = make_cache_key(kwargs, get_llm_backend().name)
+    cached = cache.get(key)
+    return key, convert_to_openai_object(cached) if cached is not None else None
+
+
+def _cache_store(key: Optional[str], response: Any) -> None:
+    cache = get_llm_cache()
+    if key is not None and cache is not None:
+        cache.set(key, response.to_dict_recursive())
+
+
+def _reservation(kwargs: Dict[str, Any]) -> int:
+    """Tokens to budget for a request: the prompt plus everything it may generate"""
+    return count_request_tokens(kwargs) + (kwargs.get('max_tokens') or 0)
+
+
+def _used_tokens(response: Any) -> Optional[int]:
+    usage = response.get('usage')
+    return usage.get('total_tokens') if usage else None
+
+
+def create_chat_completion(**kwargs) -> Any:
+    """
+    Chat completion from the configured LLM backend with the shared response
+    cache in front. All synchronous agent calls go through here. Raises
+    PromptBudgetError before sending a prompt that can't fit the model; waits
+    for a dispatch slot (by priority, see ai.shared.scheduler) and the
+    process-wide rate limiter, and retries transient errors.
+    """
+    kwargs = fit_request(kwargs)
+    key, cached = _cache_lookup(kwargs)
+    if cached is not None:
+        return cached
+    backend = get_llm_backend()
+    if isinstance(backend, OpenAIBackend):
+        get_http_pool()  # make sure openai sends through the shared keep-alive pool
+    scheduler = get_scheduler()
+    limiter = get_rate_limiter()
+    reserved = _reservation(kwargs)
+
+    def attempt():
+        with scheduler.slot(reserved):
+            limiter.acquire(reserved)
+            with span('llm_call', model=kwargs.get('model')):
+                return backend.create(**kwargs)
+
+    response = call_with_retries(attempt)
+    limiter.settle(reserved, _used_tokens(response))
+    record_usage(kwargs.get('model'), response.get('usage'))
+    _cache_store(key, response)
+    return response
+
+
+async def acreate_chat_completion(session: Optional[aiohttp.ClientSession] = None, **kwargs) -> Any:
+    """
+    Awaitable equivalent of create_chat_completion.
+    Uses the shared per-loop aiohttp session unless one is passed in.
+    """
+    kwargs = fit_request(kwargs)
+    key, cached = _cache_lookup(kwargs)
+    if cached is not None:
+        return cached
+    backend = get_llm_backend()
+    if isinstance(backend, OpenAIBackend):
+        session = session or get_aiosession()
+    scheduler = get_scheduler()
+    limiter = get_rate_limiter()
+    reserved = _reservation(kwargs)
+
+    async def attempt():
+        async with scheduler.aslot(reserved):
+            await limiter.aacquire(reserved)
+            with span('llm_call', model=kwargs.get('model')):
+                return await backend.acreate(session=session, **kwargs)
+
+    response = await acall_with_retries(attempt)
+    limiter.settle(reserved, _used_tokens(response))
+    record_usage(kwargs.get('model'), response.get('usage'))
+    _cache_store(key, response)
+    return response
+
+
+async def astream_chat_completion(session: Optional[aiohttp.ClientSession] = None, **kwargs) -> AsyncIterator[str]:
+    """
+    Stream the content of a chat completion as it is generated.
+    A cached response is yielded in one piece; a completed stream is written
+    back to the cache so later buffered calls for the same request hit it.
+    """
+    kwargs.pop('stream', None)
+    kwargs = fit_request(kwargs)
+    key, cached = _cache_lookup(kwargs)
+    if cached is not None:
+        yield cached.choices[0].message.content
+        return
+
+    backend = get_llm_backend()
+    if isinstance(backend, OpenAIBackend):
+        session = session or get_aiosession()
+
+    scheduler = get_scheduler()
+    limiter = get_rate_limiter()
+    reserved = _reservation(kwargs)
+
+    parts = []
+    finish_reason = None
+    attempt = 0
+    while True:
+        try:
+            async with scheduler.aslot(reserved):
+                await limiter.aacquire(reserved)
+                async for chunk in backend.astream(session=session, **kwargs):
+                    choice = chunk.choices[0]
+                    fragment = choice.delta.get('content')
+                    finish_reason = choice.get('finish_reason') or finish_reason
+                    if fragment:
+                        parts.append(fragment)
+                        yield fragment
+            break
+        except Exception as e:
+            # Only retry before anything has reached the caller
+            delay = None if parts else retry_delay(e, attempt)
+            if delay is None:
+                raise
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    # Streamed chunks carry no usage, so count it locally
+    content = ''.join(parts)
+    prompt_tokens = sum(estimate_tokens(m.get('content') or '') for m in kwargs.get('messages', []))
+    usage = {'prompt_tokens': prompt_tokens, 'completion_tokens': estimate_tokens(content),
+             'total_tokens': prompt_tokens + estimate_tokens(content)}
+    limiter.settle(reserved, usage['total_tokens'])
+    record_usage(kwargs.get('model'), usage)
+
+    _cache_store(key, convert_to_openai_object({
+        'object': 'chat.completion',
+        'model': kwargs.get('model'),
+        'choices': [{
+            'index': 0,
+            'message': {'role': 'assistant', 'content': content},
+            'finish_reason': finish_reason
+        }],
+        'usage': usage
+    }))
+
+
+_background_loop: Optional[asyncio.AbstractEventLoop] = None
+_background_lock = threading.Lock()
+
+
+def _get_background_loop() -> asyncio.AbstractEventLoop:
+    """Start (once) the long-lived event loop that serves synchronous callers"""
+    global _background_loop
+    with _background_lock:
+        if _background_loop is None or _background_loop.is_closed():
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name='llm-event-loop', daemon=True).start()
+            _background_loop = loop
+        return _background_loop
+
+
+@atexit.register
+def _close_background_loop() -> None:
+    loop = _background_loop
+    if loop is not None and loop.is_running():
+        try:
+            asyncio.run_coroutine_threadsafe(close_aiosession(), loop).result(timeout=5)
+        except Exception:
+            pass
+        loop.call_soon_threadsafe(loop.stop)
+
+
+def run_sync(coro: Awaitable[T]) -> T:
+    """
+    Run a coroutine to completion from synchronous code (Lambda entry points, scripts,
+    estimator threads). Everything runs on one background event loop, so its aiohttp
+    session keeps connections alive between calls.
+    """
+    loop = _get_background_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        raise RuntimeError("run_sync called from the background LLM loop; await the coroutine instead")
+    return asyncio.run_coroutine_threadsafe(_in_context(coro, contextvars.copy_context()), loop).result()
+
+
+async def _in_context(coro: Awaitable[T], context: contextvars.Context) -> T:
+    """Carry the caller's context (correlation id, span labels) onto the background loop"""
+    for var, value in context.items():
+        var.set(value)
+    return await coro
@@ -0,0 +1,177 @@
+"""
+Leveled, sampled logging with per-request correlation IDs.
+
+Configured from the environment:
+    LOG_LEVEL              DEBUG, INFO (default), WARNING, ...
+    LOG_FORMAT             text (default) or json (one object per line, for CloudWatch)
+    LOG_SAMPLE_RATE        share of requests whose DEBUG/INFO records are kept (default 1.0);
+                           WARNING and above are always kept
+    LOG_MAX_PAYLOAD_CHARS  truncation limit for Payload() arguments (default 2000)
+
+Use %-style arguments and wrap events, bodies and model output in Payload():
+they are only serialized if the record is actually emitted, so at INFO a
+logger.debug("Event: %s", Payload(event)) costs a level check.
+"""
+import os
+import sys
+import json
+import uuid
+import zlib
+import random
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Iterator, Optional
+
+ROOT_LOGGER = 'agilestories'
+NO_REQUEST_ID = '-'
+
+_request_id: ContextVar[str] = ContextVar('agilestories_request_id', default=NO_REQUEST_ID)
+_configure_lock = threading.Lock()
+_handler: Optional[logging.Handler] = None
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def get_request_id() -> str:
+    return _request_id.get()
+
+
+@contextmanager
+def request_context(request_id: Optional[str] = None) -> Iterator[str]:
+    """
+    Tag every record logged inside the block (and tasks it spawns) with
+    request_id; without one, keeps the enclosing request's id or makes a new one
+    """
+    if not request_id:
+        current = _request_id.get()
+        request_id = current if current != NO_REQUEST_ID else new_request_id()
+    token = _request_id.set(request_id)
+    try:
+        yield request_id
+    finally:
+        _request_id.reset(token)
+
+
+def truncate(text: str, limit: int) -> str:
+    if limit <= 0 or len(text) <= limit:
+        return text
+    return f"{text[:limit]}... [{len(text) - limit} more chars]"
+
+
+class Payload:
+    """Deferred, truncated rendering of a log argument"""
+    __slots__ = ('value', 'limit')
+
+    def __init__(self, value: Any, limit: Optional[int] = None):
+        self.value = value
+        self.limit = limit
+
+    def __str__(self) -> str:
+        value = self.value
+        if not isinstance(value, str):
+            try:
+                value = json.dumps(value, default=str)
+            except (TypeError, ValueError):
+                value = repr(value)
+        limit = self.limit if self.limit is not None else int(os.getenv('LOG_MAX_PAYLOAD_CHARS', '2000'))
+        return truncate(value, limit)
+
+
+class RequestContextFilter(logging.Filter):
+    """
+    Stamps records with the current request id and samples DEBUG/INFO
+    records per request, so a request's trace is kept or dropped as a whole
+    """
+
+    def __init__(self, sample_rate: float = 1.0):
+        super().__init__()
+        self.sample_rate = sample_rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        request_id = _request_id.get()
+        record.request_id = request_id
+        if record.levelno >= logging.WARNING or self.sample_rate >= 1.0:
+            return True
+        if request_id == NO_REQUEST_ID:
+            return random.random() < self.sample_rate
+        return zlib.crc32(request_id.encode()) / 2**32 < self.sample_rate
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'request_id': getattr(record, 'request_id', NO_REQUEST_ID),
+            'message': record.getMessage()
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
+def configure_logging(level: Optional[str] = None, fmt: Optional[str] = None,
+                      sample_rate: Optional[float] = None) -> logging.Logger:
+    """(Re)configure the shared handler; arguments override the environment"""
+    global _handler
+    level = (level or os.getenv('LOG_LEVEL', 'INFO')).upper()
+    fmt = (fmt or os.getenv('LOG_FORMAT', 'text')).lower()
+    if sample_rate is None:
+        sample_rate = float(os.getenv('LOG_SAMPLE_RATE', '1.0'))
+
+    handler = logging.StreamHandler(sys.stdout)
+    if fmt == 'json':
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s'))
+    handler.addFilter(RequestContextFilter(sample_rate))
+
+    root = logging.getLogger(ROOT_LOGGER)
+    with _configure_lock:
+        if _handler is not None:
+            root.removeHandler(_handler)
+        root.addHandler(handler)
+        root.setLevel(level)
+        root.propagate = False
+        _handler = handler
+    return root
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Logger under the shared 'agilestories' hierarchy, configuring it on first use"""
+    if _handler is None:
+        with _configure_lock:
+            needs_config = _handler is None
+        if needs_config:
+            configure_logging()
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+class RequestIdMiddleware:
+    """
+    ASGI middleware that runs each HTTP request in its own request_context,
+    taking the id from an incoming X-Request-ID header and echoing it back
+    """
+    HEADER = b'x-request-id'
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        incoming = dict(scope.get('headers') or []).get(self.HEADER, b'').decode('latin-1')[:64]
+        with request_context(incoming or new_request_id()) as request_id:
+            async def send_with_id(message):
+                if message['type'] == 'http.response.start':
+                    message.setdefault('headers', [])
+                    message['headers'] = list(message['headers']) + [(self.HEADER, request_id.encode('latin-1'))]
+                await send(message)
+
+            await self.app(scope, receive, send_with_id)
@@ -0,0 +1,301 @@
+"""
+In-process metrics and timing spans.
+
+A small thread-safe registry of counters, gauges and histograms rendered in
+the Prometheus text format (served at /metrics by the backend), plus span()
+/ @traced for timing workflow stages. Every span records a latency histogram,
+an in-flight gauge and an error counter labelled by span, agent, persona and
+model; nested spans inherit agent/persona/model from their parent, so an LLM
+call made inside an estimator is attributed to that persona.
+
+Setting OTEL_EXPORTER_OTLP_ENDPOINT also exports spans over OTLP/HTTP when
+opentelemetry-sdk and opentelemetry-exporter-otlp are installed.
+"""
+import os
+import time
+import asyncio
+import functools
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager, ExitStack
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from ai.shared.logging_utils import get_logger
+
+logger = get_logger(__name__)
+
+# Seconds; LLM calls range from sub-second (cache, fake backend) to a minute
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Metric(ABC):
+    """Base for labelled metrics; one value per combination of label values"""
+    type = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple('' if labels.get(n) is None else str(labels[n]) for n in self.labelnames)
+
+    @abstractmethod
+    def samples(self) -> List[str]:
+        pass
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        return '\n'.join(lines + self.samples())
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in items]
+
+
+class Gauge(Counter):
+    type = 'gauge'
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key) or ([0] * (len(self.buckets) + 1), 0.0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+            self._values[key] = (counts, total + value)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = [(k, list(counts), total) for k, (counts, total) in self._values.items()]
+        lines = []
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else _format_value(bound)
+                bucket_labels = _format_labels(self.labelnames, key, 'le="' + le + '"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Get-or-create access to named metrics, so modules can declare them independently"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name: str, documentation: str, labelnames: Sequence[str], **kwargs) -> Any:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} already registered as a {metric.type}")
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._get(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._get(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return '\n'.join(m.render() for m in metrics) + '\n'
+
+
+_registry = MetricsRegistry()
+
+
+def get_metrics_registry() -> MetricsRegistry:
+    return _registry
+
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+SPAN_LABELS = ('span', 'agent', 'persona', 'model')
+INHERITED_LABELS = ('agent', 'persona', 'model')
+
+SPAN_DURATION = _registry.histogram('agilestories_span_duration_seconds', 'Duration of workflow stages and LLM calls', SPAN_LABELS)
+SPAN_IN_FLIGHT = _registry.gauge('agilestories_span_in_flight', 'Workflow stages and LLM calls currently running', SPAN_LABELS)
+SPAN_ERRORS = _registry.counter('agilestories_span_errors_total', 'Workflow stages and LLM calls that failed', SPAN_LABELS)
+
+_span_labels: ContextVar[Dict[str, str]] = ContextVar('agilestories_span_labels', default={})
+
+
+def current_span_labels() -> Dict[str, str]:
+    """agent/persona/model labels of the innermost enclosing span"""
+    return _span_labels.get()
+
+
+class SpanState:
+    """Handed to the body of a span; set failed for errors that are handled rather than raised"""
+    __slots__ = ('name', 'labels', 'failed')
+
+    def __init__(self, name: str, labels: Dict[str, str]):
+        self.name = name
+        self.labels = labels
+        self.failed = False
+
+
+@contextmanager
+def span(name: str, **labels) -> Iterator[SpanState]:
+    """Time a block, recording its latency, in-flight count and errors"""
+    labels = {**_span_labels.get(), **{k: str(v) for k, v in labels.items() if v is not None}}
+    series = {'span': name, **labels}
+    state = SpanState(name, labels)
+    token = _span_labels.set({k: labels[k] for k in INHERITED_LABELS if k in labels})
+    SPAN_IN_FLIGHT.inc(**series)
+    started = time.perf_counter()
+    with ExitStack() as stack:
+        otel_span = _start_otel_span(stack, name, series)
+        try:
+            yield state
+        except Exception:
+            state.failed = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            _span_labels.reset(token)
+            SPAN_IN_FLIGHT.dec(**series)
+            SPAN_DURATION.observe(elapsed, **series)
+            if state.failed:
+                SPAN_ERRORS.inc(**series)
+                _mark_otel_error(otel_span)
+            logger.debug("span %s %.1fms%s %s", name, elapsed * 1000, ' failed' if state.failed else '', labels)
+
+
+def traced(name: str, is_error: Optional[Callable[[Any], bool]] = None,
+           labels: Optional[Callable[..., Dict[str, Any]]] = None, **static_labels):
+    """
+    Decorator running a sync or async function inside span(name). is_error flags
+    returned error results (handlers that return a status instead of raising);
+    labels computes extra labels from the call arguments, e.g. the persona from self.
+    """
+    def decorate(fn):
+        def span_for(args, kwargs):
+            return span(name, **static_labels, **(labels(*args, **kwargs) if labels else {}))
+
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span_for(args, kwargs) as state:
+                    result = await fn(*args, **kwargs)
+                    state.failed = bool(is_error and is_error(result))
+                    return result
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span_for(args, kwargs) as state:
+                result = fn(*args, **kwargs)
+                state.failed = bool(is_error and is_error(result))
+                return result
+        return wrapper
+    return decorate
+
+
+# --- Optional OTLP export ---
+
+_tracer = None
+_tracer_checked = False
+_tracer_lock = threading.Lock()
+
+
+def _get_tracer():
+    global _tracer, _tracer_checked
+    if _tracer_checked:
+        return _tracer
+    with _tracer_lock:
+        if not _tracer_checked and os.getenv('OTEL_EXPORTER_OTLP_ENDPOINT'):
+            try:
+                from opentelemetry import trace
+                from opentelemetry.sdk.resources import Resource
+                from opentelemetry.sdk.trace import TracerProvider
+                from opentelemetry.sdk.trace.export import BatchSpanProcessor
+                from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+
+                provider = TracerProvider(resource=Resource.create({
+                    'service.name': os.getenv('OTEL_SERVICE_NAME', 'agilestories')
+                }))
+                provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+                trace.set_tracer_provider(provider)
+                _tracer = trace.get_tracer('agilestories')
+                logger.info("Exporting spans to %s", os.getenv('OTEL_EXPORTER_OTLP_ENDPOINT'))
+            except ImportError:
+                logger.warning("OTEL_EXPORTER_OTLP_ENDPOINT is set but opentelemetry-sdk/exporter-otlp is not installed")
+        _tracer_checked = True
+    return _tracer
+
+
+def _start_otel_span(stack: ExitStack, name: str, attributes: Dict[str, str]):
+    tracer = _get_tracer()
+    if tracer is None:
+        return None
+    return stack.enter_context(tracer.start_as_current_span(name, attributes=attributes))
+
+
+def _mark_otel_error(otel_span) -> None:
+    if otel_span is not None:
+        from opentelemetry.trace import Status, StatusCode
+        otel_span.set_status(Status(StatusCode.ERROR))
@@ -0,0 +1,148 @@
+"""
+Token budgeting for LLM requests.
+
+count_tokens() counts locally: with tiktoken when it is installed, otherwise
+with the same ~4 characters/token heuristic the fake backend uses.
+fit_request() is applied by llm_client to every call before it is sent. It
+rejects prompts that don't leave LLM_MIN_COMPLETION_TOKENS of the model's
+context window, and lowers max_tokens to what remains.
+
+compact_context() cuts the Senior Dev review that estimators receive as
+context down to complexity, dependencies and risks. It truncates anything
+else to ESTIMATOR_CONTEXT_MAX_TOKENS.
+"""
+import os
+import re
+import json
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+from ai.shared.llm_backend import estimate_tokens
+
+# Context window sizes by model prefix (longest prefix wins)
+CONTEXT_WINDOWS = {
+    'gpt-4': 8192,
+    'gpt-4-32k': 32768,
+    'gpt-4-turbo': 128000,
+    'gpt-4-1106-preview': 128000,
+    'gpt-4o': 128000,
+    'gpt-3.5-turbo': 16385,
+}
+# Per-message framing tokens and reply priming in the chat format
+TOKENS_PER_MESSAGE = 3
+REPLY_PRIMING_TOKENS = 3
+
+MIN_COMPLETION_TOKENS = int(os.getenv('LLM_MIN_COMPLETION_TOKENS', 256))
+ESTIMATOR_CONTEXT_MAX_TOKENS = int(os.getenv('ESTIMATOR_CONTEXT_MAX_TOKENS', 300))
+TRUNCATION_MARKER = ' [truncated]'
+
+# "- Complexity: Medium", "Dependencies: ...", "- Technical Risks: ..."
+_ESTIMATOR_FIELD_RE = re.compile(
+    r'^[ \t]*(?:[-*•][ \t]*)?(?:\*\*)?(?P<name>complexity|dependencies|technical[ \t]+risks|risks)(?:\*\*)?[ \t]*:[ \t]*(?P<value>[^\n]+)$',
+    re.IGNORECASE | re.MULTILINE
+)
+
+
+class PromptBudgetError(ValueError):
+    """The prompt doesn't fit the model's context window with room for a response"""
+
+    def __init__(self, message: str, prompt_tokens: int, limit: int):
+        super().__init__(message)
+        self.prompt_tokens = prompt_tokens
+        self.limit = limit
+
+
+@lru_cache(maxsize=16)
+def _encoding(model: str):
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding('cl100k_base')
+
+
+def count_tokens(text: str, model: str = 'gpt-4') -> int:
+    encoding = _encoding(model)
+    return len(encoding.encode(text)) if encoding else estimate_tokens(text)
+
+
+def count_request_tokens(request: Dict[str, Any]) -> int:
+    """Prompt tokens of a chat completion request, including function definitions"""
+    model = request.get('model') or 'gpt-4'
+    total = REPLY_PRIMING_TOKENS
+    for message in request.get('messages', []):
+        total += TOKENS_PER_MESSAGE + count_tokens(message.get('content') or '', model)
+    if request.get('functions'):
+        total += count_tokens(json.dumps(request['functions']), model)
+    return total
+
+
+def context_window(model: Optional[str]) -> Optional[int]:
+    if not model:
+        return None
+    matches = [prefix for prefix in CONTEXT_WINDOWS if model.startswith(prefix)]
+    return CONTEXT_WINDOWS[max(matches, key=len)] if matches else None
+
+
+def fit_request(request: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Preflight a chat completion request: raise PromptBudgetError if the prompt
+    leaves less than MIN_COMPLETION_TOKENS, otherwise cap max_tokens at the
+    remaining budget. Requests for unknown models pass through unchanged.
+    """
+    window = context_window(request.get('model'))
+    if window is None:
+        return request
+    prompt_tokens = count_request_tokens(request)
+    available = window - prompt_tokens
+    if available < MIN_COMPLETION_TOKENS:
+        raise PromptBudgetError(
+            f"Prompt is {prompt_tokens} tokens; {request['model']} allows {window} "
+            f"including at least {MIN_COMPLETION_TOKENS} for the response",
+            prompt_tokens, window - MIN_COMPLETION_TOKENS
+        )
+    requested = request.get('max_tokens') or available
+    if requested <= available:
+        return request
+    return {**request, 'max_tokens': available}
+
+
+def truncate_to_tokens(text: str, max_tokens: int, model: str = 'gpt-4') -> str:
+    """Keep the first max_tokens tokens of text, marking the cut"""
+    encoding = _encoding(model)
+    if encoding:
+        tokens = encoding.encode(text)
+        if len(tokens) <= max_tokens:
+            return text
+        return encoding.decode(tokens[:max_tokens]).rstrip() + TRUNCATION_MARKER
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    return text[:max_tokens * 4].rstrip() + TRUNCATION_MARKER
+
+
+def _join(value: Any) -> str:
+    return ', '.join(str(v) for v in value) if isinstance(value, list) else str(value)
+
+
+def compact_context(context: Any, max_tokens: int = ESTIMATOR_CONTEXT_MAX_TOKENS) -> str:
+    """
+    Reduce estimator context to complexity, dependencies and risks. Accepts the
+    Senior Dev review as text or as its structured dict; context without those
+    fields (e.g. a one-line note from the user) is kept, truncated to max_tokens.
+    """
+    if not context:
+        return ''
+    if isinstance(context, dict):
+        lines: List[str] = [f"{label}: {_join(context[key])}"
+                            for key, label in (('complexity', 'Complexity'), ('dependencies', 'Dependencies'),
+                                               ('technical_risks', 'Technical Risks'))
+                            if context.get(key)]
+        compacted = '\n'.join(lines) if lines else json.dumps(context)
+    else:
+        lines = [f"{' '.join(m.group('name').split()).title()}: {m.group('value').strip()}"
+                 for m in _ESTIMATOR_FIELD_RE.finditer(context)]
+        compacted = '\n'.join(lines) if lines else context.strip()
+    return truncate_to_tokens(compacted, max_tokens)
@@ -0,0 +1,127 @@
+"""
+Shared-prefix prompt assembly for team estimators.
+
+Each persona's get_prompt() puts its own preamble ahead of the story, so no two
+persona requests in a fan-out share a leading prefix and provider-side prompt
+caching never applies. build_estimation_messages() reorders the same content:
+a system message that is identical for every persona on the team (task, story,
+acceptance criteria, context and output format), followed by a user message
+with the persona's own instructions, taken from its get_prompt() template.
+
+OpenAI caches prompt prefixes of 1024 tokens and more; the cached part shows
+up as usage.prompt_tokens_details.cached_tokens (see ai.shared.usage).
+
+PROMPT_LAYOUT=persona_first restores the original per-persona prompts.
+"""
+import os
+import re
+import textwrap
+from dataclasses import dataclass
+from typing import Any, Dict, List
+
+SHARED_PREFIX = 'shared_prefix'
+PERSONA_FIRST = 'persona_first'
+PROMPT_LAYOUTS = (SHARED_PREFIX, PERSONA_FIRST)
+
+# Placeholders rendered into get_prompt() to find where the story content sits
+_STORY_SLOT = '\x00story\x00'
+_CONTEXT_SLOT = '\x00context\x00'
+
+_STORY_HEADER_RE = re.compile(r'^[ \t]*Story:', re.MULTILINE)
+# Where a persona prompt stops describing the persona and starts on the output format
+OUTPUT_FORMAT_RE = re.compile(r'^\s*(?:please provide|provide your estimate)', re.IGNORECASE | re.MULTILINE)
+
+SHARED_PROMPT = """You are a member of an Agile team estimating a user story. Every team member receives the same story below and estimates it independently from their own role and experience, which follow in the next message.
+
+Story:
+{story}
+
+Acceptance Criteria:
+{acceptance_criteria}
+
+Context:
+{context}
+
+{guidance}Please provide your response in the following format:
+
+{output_format}"""
+
+DAY_OUTPUT_FORMAT = """Effort Estimate:
+- Person-days: [X.X]
+- Confidence Level: [High/Medium/Low]
+
+Technical Considerations:
+[List key technical or testing factors affecting the estimate]
+
+Risk Factors:
+[List potential risks that could impact the timeline]
+
+Explanation:
+[Brief justification of your estimate]"""
+
+POINT_OUTPUT_FORMAT = """Story Points: [Choose from: 1, 2, 3, 5, 8, 13, 21]
+Confidence Level: [High/Medium/Low]
+
+Technical Considerations:
+[List key technical or testing factors affecting the estimate]
+
+Risk Factors:
+[List potential risks or challenges]
+
+Explanation:
+[Brief justification of your story points estimate]"""
+
+
+def prompt_layout() -> str:
+    layout = os.getenv('PROMPT_LAYOUT', SHARED_PREFIX).lower()
+    return layout if layout in PROMPT_LAYOUTS else SHARED_PREFIX
+
+
+@dataclass
+class PersonaPrompt:
+    """The persona-specific parts of a get_prompt() template"""
+    preamble: str
+    focus: str
+    output_format: str
+
+    @property
+    def instructions(self) -> str:
+        return '\n\n'.join(part for part in (self.preamble, self.focus) if part)
+
+
+def _block(text: str) -> str:
+    return textwrap.dedent(text).strip()
+
+
+def split_persona_prompt(member: Any) -> PersonaPrompt:
+    """Split a persona's prompt into preamble, focus (after the context) and output format"""
+    prompt = member.get_prompt(_STORY_SLOT, [], _CONTEXT_SLOT)
+    header = _STORY_HEADER_RE.search(prompt)
+    preamble = prompt[:header.start()] if header else prompt[:prompt.find(_STORY_SLOT)]
+    tail = prompt[prompt.find(_CONTEXT_SLOT) + len(_CONTEXT_SLOT):]
+    marker = OUTPUT_FORMAT_RE.search(tail)
+    end = marker.start() if marker else len(tail)
+    return PersonaPrompt(preamble=_block(preamble), focus=_block(tail[:end]), output_format=_block(tail[end:]))
+
+
+def shared_block(story: str, acceptance_criteria: List[str], context: str,
+                 output_format: str, guidance: str = '') -> str:
+    """The persona-independent leading block; byte-identical for every member of a team"""
+    return SHARED_PROMPT.format(
+        story=story,
+        acceptance_criteria="\n".join(f"- {ac}" for ac in acceptance_criteria),
+        context=context,
+        guidance=f"{guidance}\n\n" if guidance else '',
+        output_format=output_format
+    )
+
+
+def build_estimation_messages(member: Any, story: str, acceptance_criteria: List[str], context: str,
+                              output_format: str, guidance: str = '') -> List[Dict[str, str]]:
+    """Shared block first, then who this member is and what they focus on"""
+    persona = split_persona_prompt(member)
+    return [
+        {"role": "system", "content": shared_block(story, acceptance_criteria, context, output_format, guidance)},
+        {"role": "user", "content": f"You are {member.name}, a {member.role} with {member.experience_years} "
+                                    f"years of experience.\n\n{persona.instructions}"}
+    ]
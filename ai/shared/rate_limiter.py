@@ -0,0 +1,216 @@
+"""
+Process-wide rate limiting and retries for LLM calls.
+
+Every chat completion in llm_client first reserves capacity from a shared
+RateLimiter. This works the same way for sync callers (estimator threads)
+and async ones (the agents on an event loop). The limiter has two token
+buckets:
+- requests per minute (LLM_RPM_LIMIT)
+- tokens per minute (LLM_TPM_LIMIT), charged the prompt's estimated size
+  plus max_tokens, which is how OpenAI counts them
+The unused part of max_tokens is credited back once the real usage is known.
+A limit of 0 turns that bucket off. The limits apply per process, so with
+several workers divide the account's limits between them.
+
+Calls failing with 429 or 5xx (and timeouts and connection errors) are
+retried up to LLM_MAX_RETRIES times. Backoff is exponential with full jitter
+(LLM_BACKOFF_BASE_S, capped at LLM_BACKOFF_MAX_S), and a Retry-After header
+is honoured when present. Each retry goes through the limiter again.
+"""
+import os
+import time
+import random
+import asyncio
+import threading
+from typing import Awaitable, Callable, Optional, TypeVar
+
+import openai
+
+from ai.shared.logging_utils import get_logger
+from ai.shared.metrics import get_metrics_registry
+
+logger = get_logger(__name__)
+
+T = TypeVar('T')
+
+RPM_LIMIT = float(os.getenv('LLM_RPM_LIMIT', 500))
+TPM_LIMIT = float(os.getenv('LLM_TPM_LIMIT', 300000))
+MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', 4))
+BACKOFF_BASE_S = float(os.getenv('LLM_BACKOFF_BASE_S', 0.5))
+BACKOFF_MAX_S = float(os.getenv('LLM_BACKOFF_MAX_S', 20))
+
+_registry = get_metrics_registry()
+QUEUE_DEPTH = _registry.gauge('agilestories_llm_limiter_queue_depth', 'LLM calls waiting for rate limit capacity')
+WAIT_SECONDS = _registry.histogram('agilestories_llm_limiter_wait_seconds', 'Time LLM calls waited for rate limit capacity')
+RETRIES_TOTAL = _registry.counter('agilestories_llm_retries_total', 'LLM calls retried after a transient error',
+                                  ('reason',))
+QUEUE_DEPTH.set(0)
+
+RETRYABLE_ERRORS = (
+    openai.error.RateLimitError,
+    openai.error.ServiceUnavailableError,
+    openai.error.Timeout,
+    openai.error.APIConnectionError,
+    openai.error.TryAgain,
+)
+
+
+class TokenBucket:
+    """
+    A bucket refilled continuously at rate_per_minute, holding up to one minute's
+    worth. reserve() takes capacity immediately, letting the balance go negative,
+    and returns how long the caller must wait before its share is actually available.
+    That keeps callers in arrival order without a condition variable, for threads
+    and coroutines alike.
+    """
+
+    def __init__(self, rate_per_minute: float):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = rate_per_minute
+        self.available = rate_per_minute
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float) -> float:
+        # A request larger than the whole bucket would otherwise never fit
+        amount = min(amount, self.capacity)
+        with self._lock:
+            self._refill(time.monotonic())
+            self.available -= amount
+            return 0.0 if self.available >= 0 else -self.available / self.rate
+
+    def refund(self, amount: float) -> None:
+        with self._lock:
+            self._refill(time.monotonic())
+            self.available = min(self.capacity, self.available + amount)
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute budgets shared by every LLM call in the process"""
+
+    def __init__(self, rpm: float = RPM_LIMIT, tpm: float = TPM_LIMIT):
+        self.requests = TokenBucket(rpm) if rpm > 0 else None
+        self.tokens = TokenBucket(tpm) if tpm > 0 else None
+
+    def _reserve(self, tokens: int) -> float:
+        delays = [0.0]
+        if self.requests is not None:
+            delays.append(self.requests.reserve(1))
+        if self.tokens is not None:
+            delays.append(self.tokens.reserve(tokens))
+        return max(delays)
+
+    def acquire(self, tokens: int) -> float:
+        """Block until the call fits the budgets; returns the seconds waited"""
+        delay = self._reserve(tokens)
+        if delay > 0:
+            QUEUE_DEPTH.inc()
+            try:
+                time.sleep(delay)
+            finally:
+                QUEUE_DEPTH.dec()
+        WAIT_SECONDS.observe(delay)
+        return delay
+
+    async def aacquire(self, tokens: int) -> float:
+        """Awaitable acquire() that doesn't block the event loop"""
+        delay = self._reserve(tokens)
+        if delay > 0:
+            QUEUE_DEPTH.inc()
+            try:
+                await asyncio.sleep(delay)
+            finally:
+                QUEUE_DEPTH.dec()
+        WAIT_SECONDS.observe(delay)
+        return delay
+
+    def settle(self, reserved_tokens: int, used_tokens: Optional[int]) -> None:
+        """Credit back the part of a token reservation the call didn't use"""
+        if self.tokens is not None and used_tokens is not None and used_tokens < reserved_tokens:
+            self.tokens.refund(reserved_tokens - used_tokens)
+
+
+_limiter: Optional[RateLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = RateLimiter()
+    return _limiter
+
+
+def set_rate_limiter(limiter: RateLimiter) -> None:
+    """Replace the process-wide limiter (tests, benchmarks)"""
+    global _limiter
+    with _limiter_lock:
+        _limiter = limiter
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, RETRYABLE_ERRORS):
+        return True
+    status = getattr(error, 'http_status', None)
+    return isinstance(error, openai.error.APIError) and (status is None or status >= 500)
+
+
+def backoff_delay(attempt: int, error: Optional[Exception] = None) -> float:
+    """Full-jitter exponential backoff, or the server's Retry-After when it gives one"""
+    headers = getattr(error, 'headers', None) or {}
+    retry_after = headers.get('retry-after') or headers.get('Retry-After')
+    if retry_after:
+        try:
+            return min(float(retry_after), BACKOFF_MAX_S)
+        except ValueError:
+            pass
+    return random.uniform(0, min(BACKOFF_MAX_S, BACKOFF_BASE_S * 2 ** attempt))
+
+
+def _retry_reason(error: Exception) -> str:
+    status = getattr(error, 'http_status', None)
+    return str(status) if status else type(error).__name__
+
+
+def retry_delay(error: Exception, attempt: int, max_retries: int = MAX_RETRIES) -> Optional[float]:
+    """Seconds to wait before retrying after error, or None if it shouldn't be retried"""
+    if attempt >= max_retries or not is_retryable(error):
+        return None
+    delay = backoff_delay(attempt, error)
+    RETRIES_TOTAL.inc(reason=_retry_reason(error))
+    logger.warning("LLM call failed (%s), retry %d/%d in %.2fs", error, attempt + 1, max_retries, delay)
+    return delay
+
+
+def call_with_retries(fn: Callable[[], T], max_retries: int = MAX_RETRIES) -> T:
+    """Call fn, retrying transient OpenAI errors with backoff"""
+    attempt = 0
+    while True:
+        try:
+            return fn()
+        except Exception as e:
+            delay = retry_delay(e, attempt, max_retries)
+            if delay is None:
+                raise
+            time.sleep(delay)
+            attempt += 1
+
+
+async def acall_with_retries(fn: Callable[[], Awaitable[T]], max_retries: int = MAX_RETRIES) -> T:
+    """Awaitable call_with_retries"""
+    attempt = 0
+    while True:
+        try:
+            return await fn()
+        except Exception as e:
+            delay = retry_delay(e, attempt, max_retries)
+            if delay is None:
+                raise
+            await asyncio.sleep(delay)
+            attempt += 1
@@ -0,0 +1,125 @@
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+# Canonical section name -> heading variants the agents' prompts produce
+SECTION_ALIASES = {
+    'invest_analysis': ['INVEST Analysis'],
+    'improved_story': ['Improved Story', 'Improved User Story', 'Enhanced Story', 'Improved version of the story'],
+    'acceptance_criteria': ['Enhanced Acceptance Criteria', 'Acceptance Criteria'],
+    'additional_suggestions': ['Additional Suggestions'],
+    'technical_analysis': ['Technical Analysis'],
+    'implementation_details': ['Implementation Details'],
+    'effort_estimate': ['Effort Estimate'],
+    'technical_considerations': ['Technical Considerations'],
+    'risk_factors': ['Risk Factors'],
+    'explanation': ['Explanation'],
+}
+
+# Typed "Key: value" fields -> canonical field name
+FIELD_ALIASES = {
+    'person-days': 'person_days',
+    'person days': 'person_days',
+    'story points': 'story_points',
+    'confidence level': 'confidence',
+    'confidence': 'confidence',
+    'feasibility': 'feasibility',
+    'complexity': 'complexity',
+}
+
+_HEADING_LOOKUP = {alias.lower(): name for name, aliases in SECTION_ALIASES.items() for alias in aliases}
+
+
+def _alternation(words) -> str:
+    # Longest first so "Enhanced Acceptance Criteria" wins over "Acceptance Criteria"
+    return '|'.join(re.escape(w).replace(r'\ ', r'[ \t]+') for w in sorted(words, key=len, reverse=True))
+
+
+# One pattern, one pass: every line is either a section heading, a typed field, or body text.
+# Headings may carry markdown decoration (#, **) and inline content after the colon.
+_TOKEN_RE = re.compile(
+    r'^[ \t]*(?:'
+    r'(?:\#{1,6}[ \t]*)?(?:\*\*)?(?P<heading>' + _alternation(_HEADING_LOOKUP) + r')(?:\*\*)?[ \t]*:(?:\*\*)?[ \t]*(?P<inline>[^\n]*)'
+    r'|'
+    r'(?:[-*•][ \t]*)?(?:\*\*)?(?P<field>' + _alternation(FIELD_ALIASES) + r')(?:\*\*)?[ \t]*:(?:\*\*)?[ \t]*(?P<value>[^\n]*)'
+    r')$',
+    re.IGNORECASE | re.MULTILINE
+)
+_NUMBER_RE = re.compile(r'\d+(?:\.\d+)?')
+_LEVEL_RE = re.compile(r'high|medium|low', re.IGNORECASE)
+_BULLET_RE = re.compile(r'^[ \t]*(?:[-*•]|\d+[.)])[ \t]*')
+
+
+@dataclass
+class ParsedResponse:
+    """Named sections and typed fields extracted from one LLM response"""
+    sections: Dict[str, str] = field(default_factory=dict)
+    person_days: Optional[float] = None
+    story_points: Optional[float] = None
+    confidence: Optional[str] = None
+    feasibility: Optional[str] = None
+    complexity: Optional[str] = None
+
+    @property
+    def improved_story(self) -> Optional[str]:
+        text = self.sections.get('improved_story', '').strip()
+        return text or None
+
+    @property
+    def acceptance_criteria(self) -> List[str]:
+        return bullet_items(self.sections.get('acceptance_criteria', ''))
+
+
+def bullet_items(text: str) -> List[str]:
+    """Split a list section into items, dropping bullet markers and blank lines"""
+    items = []
+    for line in text.split('\n'):
+        item = _BULLET_RE.sub('', line).strip()
+        if item:
+            items.append(item)
+    return items
+
+
+def _parse_number(value: str) -> Optional[float]:
+    match = _NUMBER_RE.search(value)
+    return float(match.group()) if match else None
+
+
+def _parse_level(value: str) -> Optional[str]:
+    match = _LEVEL_RE.search(value)
+    return match.group().capitalize() if match else None
+
+
+def parse_response(text: str) -> ParsedResponse:
+    """
+    Tokenize an agent response in a single regex pass.
+    The first occurrence of each section and field wins; a section runs until the next heading.
+    """
+    parsed = ParsedResponse()
+    if not text:
+        return parsed
+
+    current = None
+    start = 0
+    for match in _TOKEN_RE.finditer(text):
+        heading = match.group('heading')
+        if heading is not None:
+            if current is not None and current not in parsed.sections:
+                parsed.sections[current] = text[start:match.start()].strip()
+            current = _HEADING_LOOKUP[' '.join(heading.lower().split())]
+            inline = match.group('inline').strip()
+            # Inline content ("Improved Story: As a ...") belongs to the section body
+            start = match.start('inline') if inline else match.end()
+            continue
+
+        name = FIELD_ALIASES[' '.join(match.group('field').lower().split())]
+        if getattr(parsed, name) is None:
+            value = match.group('value')
+            if name in ('person_days', 'story_points'):
+                setattr(parsed, name, _parse_number(value))
+            else:
+                setattr(parsed, name, _parse_level(value))
+
+    if current is not None and current not in parsed.sections:
+        parsed.sections[current] = text[start:].strip()
+    return parsed
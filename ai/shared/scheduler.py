@@ -0,0 +1,237 @@
+"""
+Priority-aware dispatch of LLM calls.
+
+Every chat completion in llm_client takes one of LLM_MAX_CONCURRENCY dispatch
+slots before it reaches the rate limiter and the backend. When calls are
+waiting for a slot, the next one is chosen by priority class:
+
+- interactive: analyze and feedback (the default)
+- estimation: interactive team estimation
+- batch: background batch analysis
+
+Interactive calls preempt at dispatch time: a waiting interactive call gets
+the next free slot ahead of any queued estimation or batch call. Calls
+already in flight are never interrupted. Estimation and batch share the
+remaining capacity by weighted fair queuing. Each call is tagged with a
+virtual finish time advanced by its token cost divided by its class weight,
+so batch work keeps moving without crowding out estimation. Batch may also
+hold at most LLM_BATCH_MAX_SHARE of the slots, which keeps slots free for
+interactive calls arriving while a backlog import runs.
+
+The class comes from the caller's context; wrap work in priority(...). A
+nested priority can only lower the class, so estimator calls made during a
+batch job stay batch.
+"""
+import os
+import time
+import asyncio
+import threading
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import AsyncIterator, Deque, Dict, Iterator, Optional
+
+from ai.shared.logging_utils import get_logger
+from ai.shared.metrics import get_metrics_registry
+
+logger = get_logger(__name__)
+
+
+@dataclass(frozen=True)
+class PriorityClass:
+    name: str
+    rank: int  # 0 is the highest priority
+    weight: float
+    max_share: float = 1.0  # share of dispatch slots the class may hold at once
+
+
+INTERACTIVE = PriorityClass('interactive', rank=0, weight=8)
+ESTIMATION = PriorityClass('estimation', rank=1, weight=4)
+BATCH = PriorityClass('batch', rank=2, weight=1, max_share=float(os.getenv('LLM_BATCH_MAX_SHARE', 0.5)))
+PRIORITY_CLASSES = (INTERACTIVE, ESTIMATION, BATCH)
+
+MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', 16))
+
+_registry = get_metrics_registry()
+QUEUED = _registry.gauge('agilestories_llm_scheduler_queued', 'LLM calls waiting for a dispatch slot', ('priority',))
+IN_FLIGHT = _registry.gauge('agilestories_llm_scheduler_in_flight', 'LLM calls holding a dispatch slot', ('priority',))
+WAIT_SECONDS = _registry.histogram('agilestories_llm_scheduler_wait_seconds', 'Time LLM calls waited for a dispatch slot',
+                                   ('priority',))
+for _cls in PRIORITY_CLASSES:
+    QUEUED.set(0, priority=_cls.name)
+    IN_FLIGHT.set(0, priority=_cls.name)
+
+_priority: ContextVar[PriorityClass] = ContextVar('agilestories_priority', default=INTERACTIVE)
+
+
+def current_priority() -> PriorityClass:
+    return _priority.get()
+
+
+@contextmanager
+def priority(cls: PriorityClass) -> Iterator[PriorityClass]:
+    """Run the block's LLM calls at cls, or at the enclosing class if that is lower"""
+    effective = max(cls, _priority.get(), key=lambda c: c.rank)
+    token = _priority.set(effective)
+    try:
+        yield effective
+    finally:
+        _priority.reset(token)
+
+
+class _Waiter:
+    """A queued call, woken by a threading.Event (sync callers) or a future on its loop (async)"""
+    __slots__ = ('cls', 'finish_tag', 'event', 'future', 'loop', 'granted')
+
+    def __init__(self, cls: PriorityClass, finish_tag: float, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.cls = cls
+        self.finish_tag = finish_tag
+        self.loop = loop
+        self.future = loop.create_future() if loop else None
+        self.event = None if loop else threading.Event()
+        self.granted = False
+
+    def grant(self) -> None:
+        self.granted = True
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(lambda: self.future.done() or self.future.set_result(None))
+        else:
+            self.event.set()
+
+
+class LLMScheduler:
+    """Dispatch slots shared by every LLM call in the process, handed out by priority"""
+
+    def __init__(self, slots: int = MAX_CONCURRENCY):
+        self.slots = max(1, slots)
+        self.in_flight: Dict[str, int] = {cls.name: 0 for cls in PRIORITY_CLASSES}
+        self._queues: Dict[str, Deque[_Waiter]] = {cls.name: deque() for cls in PRIORITY_CLASSES}
+        self._last_finish: Dict[str, float] = {cls.name: 0.0 for cls in PRIORITY_CLASSES}
+        self._virtual_time = 0.0
+        self._lock = threading.Lock()
+
+    def _has_room(self, cls: PriorityClass) -> bool:
+        return (sum(self.in_flight.values()) < self.slots
+                and self.in_flight[cls.name] < max(1, int(self.slots * cls.max_share)))
+
+    def _tag(self, cls: PriorityClass, cost: float) -> float:
+        start = max(self._virtual_time, self._last_finish[cls.name])
+        self._last_finish[cls.name] = start + max(cost, 1.0) / cls.weight
+        return self._last_finish[cls.name]
+
+    def _take(self, cls: PriorityClass, finish_tag: float) -> None:
+        self.in_flight[cls.name] += 1
+        self._virtual_time = max(self._virtual_time, finish_tag)
+        IN_FLIGHT.inc(priority=cls.name)
+
+    def _next_waiter(self) -> Optional[_Waiter]:
+        """Highest-priority waiting class first; otherwise the earliest virtual finish tag"""
+        candidates = [queue[0] for name, queue in self._queues.items() if queue and self._has_room(queue[0].cls)]
+        if not candidates:
+            return None
+        top = min(candidates, key=lambda w: w.cls.rank)
+        if top.cls.rank == 0:
+            return top
+        return min(candidates, key=lambda w: w.finish_tag)
+
+    def _dispatch(self) -> None:
+        while True:
+            waiter = self._next_waiter()
+            if waiter is None:
+                return
+            self._queues[waiter.cls.name].popleft()
+            QUEUED.dec(priority=waiter.cls.name)
+            self._take(waiter.cls, waiter.finish_tag)
+            waiter.grant()
+
+    def _enqueue(self, cls: PriorityClass, cost: float, loop=None) -> Optional[_Waiter]:
+        """Take a slot straight away if nothing is queued ahead, otherwise queue a waiter"""
+        with self._lock:
+            tag = self._tag(cls, cost)
+            ahead = any(self._queues[c.name] for c in PRIORITY_CLASSES if c.rank <= cls.rank)
+            if not ahead and self._has_room(cls):
+                self._take(cls, tag)
+                return None
+            waiter = _Waiter(cls, tag, loop)
+            self._queues[cls.name].append(waiter)
+            QUEUED.inc(priority=cls.name)
+            return waiter
+
+    def _abandon(self, waiter: _Waiter) -> None:
+        """A waiter gave up (cancelled): leave the queue, or hand back a slot it was just given"""
+        with self._lock:
+            if waiter.granted:
+                self._release_locked(waiter.cls)
+                return
+            self._queues[waiter.cls.name].remove(waiter)
+            QUEUED.dec(priority=waiter.cls.name)
+
+    def _release_locked(self, cls: PriorityClass) -> None:
+        self.in_flight[cls.name] -= 1
+        IN_FLIGHT.dec(priority=cls.name)
+        self._dispatch()
+
+    def release(self, cls: PriorityClass) -> None:
+        with self._lock:
+            self._release_locked(cls)
+
+    def acquire(self, cost: float = 1.0, cls: Optional[PriorityClass] = None) -> PriorityClass:
+        """Block until a slot is granted; returns the class to release()"""
+        cls = cls or current_priority()
+        started = time.monotonic()
+        waiter = self._enqueue(cls, cost)
+        if waiter is not None:
+            waiter.event.wait()
+        WAIT_SECONDS.observe(time.monotonic() - started, priority=cls.name)
+        return cls
+
+    async def aacquire(self, cost: float = 1.0, cls: Optional[PriorityClass] = None) -> PriorityClass:
+        """Awaitable acquire()"""
+        cls = cls or current_priority()
+        started = time.monotonic()
+        waiter = self._enqueue(cls, cost, asyncio.get_running_loop())
+        if waiter is not None:
+            try:
+                await waiter.future
+            except asyncio.CancelledError:
+                self._abandon(waiter)
+                raise
+        WAIT_SECONDS.observe(time.monotonic() - started, priority=cls.name)
+        return cls
+
+    @contextmanager
+    def slot(self, cost: float = 1.0) -> Iterator[PriorityClass]:
+        cls = self.acquire(cost)
+        try:
+            yield cls
+        finally:
+            self.release(cls)
+
+    @asynccontextmanager
+    async def aslot(self, cost: float = 1.0) -> AsyncIterator[PriorityClass]:
+        cls = await self.aacquire(cost)
+        try:
+            yield cls
+        finally:
+            self.release(cls)
+
+
+_scheduler: Optional[LLMScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> LLMScheduler:
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = LLMScheduler()
+    return _scheduler
+
+
+def set_scheduler(scheduler: LLMScheduler) -> None:
+    """Replace the process-wide scheduler (tests, benchmarks)"""
+    global _scheduler
+    with _scheduler_lock:
+        _scheduler = scheduler
@@ -1,21 +1,19 @@
 import os
 import json
-import sys
 import boto3
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, AsyncIterator, Tuple
 from dataclasses import dataclass, asdict
 from datetime import datetime
 from enum import Enum
-import traceback
 
-# Debug logging
-print("StoryAnalyzer: Python path:", sys.path)
-print("StoryAnalyzer: Current directory:", os.getcwd())
-try:
-    import openai
-    print("StoryAnalyzer: OpenAI package found:", openai.__file__)
-except Exception as e:
-    print("StoryAnalyzer: Error importing openai:", str(e))
+from ai.shared.llm_client import run_sync
+from ai.shared.logging_utils import get_logger, Payload
+from ai.shared.metrics import traced
+from ai.shared.usage import tracks_usage, usage_context
+from ai.shared.response_parser import parse_response
+from ai.shared.prompt_budget import PromptBudgetError
+
+logger = get_logger(__name__)
 
 @dataclass
 class Story:
@@ -44,6 +42,10 @@ class AnalysisResult:
     suggestions: Dict[str, Any]
     status: AnalysisStatus
     timestamp: str = datetime.now().isoformat()
+    usage: Optional[Dict[str, Any]] = None  # token/cost summary of the LLM calls behind this result
+    story_id: Optional[str] = None  # set once stored (see ai.shared.story_store)
+    analysis_id: Optional[str] = None
+    status_code: Optional[int] = None  # handler statusCode of a failed stage, e.g. 413 for an oversized prompt
     
     def to_dict(self) -> Dict:
         return {
@@ -52,9 +54,19 @@ class AnalysisResult:
             'analysis': self.analysis,
             'suggestions': self.suggestions,
             'status': self.status.value,
-            'timestamp': self.timestamp
+            'timestamp': self.timestamp,
+            'usage': self.usage,
+            'story_id': self.story_id,
+            'analysis_id': self.analysis_id,
+            'status_code': self.status_code
         }
 
+def handler_error(body: Any, status_code: int) -> str:
+    """The error message of a non-200 handler response"""
+    if isinstance(body, dict) and (body.get('error') or body.get('message')):
+        return body.get('error') or body.get('message')
+    return f"Handler returned status {status_code}"
+
 class StoryAnalyzer:
     """Handles sequential story analysis workflow"""
     
@@ -70,22 +82,25 @@ class StoryAnalyzer:
         # No need for Lambda client if we're calling functions directly
         self.agile_coach = __import__('ai.agents.agile_coach.lambda_handler', fromlist=['lambda_handler']).lambda_handler
         self.senior_dev = __import__('ai.agents.senior_dev.lambda_handler', fromlist=['lambda_handler']).lambda_handler
+        self.agile_coach_async = __import__('ai.agents.agile_coach.lambda_handler', fromlist=['async_lambda_handler']).async_lambda_handler
+        self.senior_dev_async = __import__('ai.agents.senior_dev.lambda_handler', fromlist=['async_lambda_handler']).async_lambda_handler
+        self.agile_coach_stream = __import__('ai.agents.agile_coach.lambda_handler', fromlist=['stream_analysis']).stream_analysis
     
     def start_analysis(self, story: Story) -> AnalysisResult:
         """
         Start the analysis workflow with Agile Coach review
         """
+        return run_sync(self.start_analysis_async(story))
+    
+    @traced('start_analysis', agent='agile_coach', is_error=lambda r: r.status == AnalysisStatus.ERROR)
+    @tracks_usage
+    async def start_analysis_async(self, story: Story) -> AnalysisResult:
+        """
+        Awaitable start_analysis for use from async request handlers
+        """
         try:
-            print(f"StoryAnalyzer.start_analysis: Starting with story: {story}")
-            # Add more detailed logging here
-            try:
-                import openai
-                print("OpenAI import successful in start_analysis")
-            except Exception as e:
-                print(f"OpenAI import failed in start_analysis: {str(e)}")
-                print(f"Current sys.path: {sys.path}")
-            
-            print(f"Starting analysis for story: {story.text}")
+            logger.info("Starting analysis (version %s)", story.version)
+            logger.debug("Story: %s", Payload(story.text))
             
             # Create the event structure for Lambda
             event = {
@@ -96,14 +111,13 @@ class StoryAnalyzer:
                 }
             }
             
-            # Call the Agile Coach Lambda handler
-            from ai.agents.agile_coach.lambda_handler import lambda_handler
-            response = lambda_handler(event, None)
+            # Call the Agile Coach handler
+            response = await self.agile_coach_async(event, None)
             
             return self._parse_lambda_response(response, story, AnalysisStatus.AGILE_REVIEW)
             
         except Exception as e:
-            print(f"Error in start_analysis: {str(e)}")
+            logger.exception("Error in start_analysis: %s", e)
             return AnalysisResult(
                 original_story=story,
                 improved_story=None,
@@ -112,6 +126,34 @@ class StoryAnalyzer:
                 status=AnalysisStatus.ERROR
             )
     
+    async def stream_analysis(self, story: Story) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Stream the Agile Coach review: yields ('token', text) as GPT generates it,
+        then ('result', AnalysisResult) parsed from the complete analysis
+        """
+        with usage_context() as usage:
+            parts = []
+            try:
+                async for fragment in self.agile_coach_stream(story.text, story.acceptance_criteria, story.context):
+                    parts.append(fragment)
+                    yield 'token', fragment
+                
+                response = {'body': {'analysis': ''.join(parts), 'suggestions': {}}}
+                result = self._parse_lambda_response(response, story, AnalysisStatus.AGILE_REVIEW)
+                result.usage = usage.summary()
+                yield 'result', result
+                
+            except Exception as e:
+                logger.exception("Error in stream_analysis: %s", e)
+                yield 'result', AnalysisResult(
+                    original_story=story,
+                    improved_story=None,
+                    analysis=str(e),
+                    status_code=413 if isinstance(e, PromptBudgetError) else None,
+                    suggestions={},
+                    status=AnalysisStatus.ERROR
+                )
+    
     def _get_value(self, obj, key, default=None):
         """Get value from either object attribute or dictionary key"""
         if hasattr(obj, key):
@@ -122,11 +164,15 @@ class StoryAnalyzer:
     
     def process_user_feedback(self, analysis_result, approved: bool) -> Dict[str, Any]:
         """Process user feedback on analysis"""
+        return run_sync(self.process_user_feedback_async(analysis_result, approved))
+    
+    @traced('process_user_feedback', agent='senior_dev', is_error=lambda r: r.get('status') == 'error')
+    @tracks_usage
+    async def process_user_feedback_async(self, analysis_result, approved: bool) -> Dict[str, Any]:
+        """Awaitable process_user_feedback for use from async request handlers"""
         try:
-            print("\n=== Processing User Feedback ===")
-            print("Analysis Result:")
-            print("- Status:", self._get_value(analysis_result, 'status'))
-            print("- Has improved story:", bool(self._get_value(analysis_result, 'improved_story')))
+            logger.info("Processing user feedback (approved=%s, status=%s)",
+                        approved, self._get_value(analysis_result, 'status'))
             
             if approved:
                 # Extract story from the analysis result
@@ -149,17 +195,29 @@ class StoryAnalyzer:
                 
                 try:
                     # Call Senior Dev function directly
-                    print("Calling Senior Dev function...")
-                    result = self.senior_dev(event, None)
-                    print("Raw Senior Dev result:", result)
-                    print("Result type:", type(result))
+                    result = await self.senior_dev_async(event, None)
                     
                     if isinstance(result, str):
                         result = json.loads(result)
                     if isinstance(result.get('body'), str):
                         result['body'] = json.loads(result['body'])
                     
-                    print("Processed Senior Dev result:", json.dumps(result, indent=2))
+                    logger.debug("Senior Dev result: %s", Payload(result))
+                    
+                    status_code = result.get('statusCode', 200)
+                    if status_code != 200:
+                        error = handler_error(result.get('body'), status_code)
+                        logger.warning("Senior Dev rejected the story (%s): %s", status_code, error)
+                        return {
+                            'status': 'error',
+                            'status_code': status_code,
+                            'message': error,
+                            'original_story': story_data.to_dict(),
+                            'improved_story': None,
+                            'analysis': '',
+                            'suggestions': {},
+                            'timestamp': datetime.now().isoformat()
+                        }
                     
                     return {
                         'original_story': story_data.to_dict(),
@@ -171,11 +229,7 @@ class StoryAnalyzer:
                     }
                     
                 except Exception as e:
-                    print("\nError in Senior Dev call:")
-                    print("Exception:", str(e))
-                    print("Event data:", json.dumps(event, indent=2))
-                    import traceback
-                    print("Full traceback:", traceback.format_exc())
+                    logger.error("Error in Senior Dev call: %s (event: %s)", e, Payload(event))
                     raise
                     
             else:
@@ -190,11 +244,7 @@ class StoryAnalyzer:
                 }
                 
         except Exception as e:
-            print("\nError in process_user_feedback:")
-            print("Exception:", str(e))
-            print("Raw analysis_result:", json.dumps(analysis_result, indent=2))
-            import traceback
-            print("Full traceback:", traceback.format_exc())
+            logger.exception("Error in process_user_feedback: %s (analysis_result: %s)", e, Payload(analysis_result))
             return {
                 'status': 'error',
                 'message': str(e),
@@ -209,8 +259,17 @@ class StoryAnalyzer:
         """
         Perform technical review with Senior Dev
         """
+        return run_sync(self.technical_review_async(story))
+    
+    @traced('technical_review', agent='senior_dev', is_error=lambda r: r.status == AnalysisStatus.ERROR)
+    @tracks_usage
+    async def technical_review_async(self, story: Story) -> AnalysisResult:
+        """
+        Awaitable technical_review for use from async request handlers
+        """
         try:
-            print(f"\nStarting technical review with story: {story.text}")
+            logger.info("Starting technical review (version %s)", story.version)
+            logger.debug("Story: %s", Payload(story.text))
             
             # Create the event structure
             event = {
@@ -221,14 +280,13 @@ class StoryAnalyzer:
                 }
             }
             
-            # Import and call the Lambda handler directly
-            from ai.agents.senior_dev.lambda_handler import lambda_handler
-            tech_response = lambda_handler(event, None)
+            # Call the Senior Dev handler directly
+            tech_response = await self.senior_dev_async(event, None)
             
             return self._parse_lambda_response(tech_response, story, AnalysisStatus.TECHNICAL_REVIEW)
             
         except Exception as e:
-            print(f"Error in technical_review: {str(e)}")
+            logger.exception("Error in technical_review: %s", e)
             return AnalysisResult(
                 original_story=story,
                 improved_story=None,
@@ -242,7 +300,7 @@ class StoryAnalyzer:
         Invoke a Lambda function and return its response
         """
         try:
-            print(f"Invoking {function_name} with event: {json.dumps(event, indent=2)}")
+            logger.debug("Invoking %s with event: %s", function_name, Payload(event))
             
             response = self.lambda_client.invoke(
                 FunctionName=function_name,
@@ -253,7 +311,7 @@ class StoryAnalyzer:
             return json.loads(response['Payload'].read().decode())
             
         except Exception as e:
-            print(f"Error invoking {function_name}: {str(e)}")
+            logger.exception("Error invoking %s: %s", function_name, e)
             return {
                 'statusCode': 500,
                 'body': json.dumps({
@@ -262,6 +320,7 @@ class StoryAnalyzer:
                 })
             }
     
+    @traced('parse_response', is_error=lambda r: r.status == AnalysisStatus.ERROR)
     def _parse_lambda_response(self, lambda_response: Dict, original_story: Story, status: AnalysisStatus) -> AnalysisResult:
         """
         Parse the Lambda response into an AnalysisResult
@@ -273,11 +332,33 @@ class StoryAnalyzer:
             else:
                 body = lambda_response.get('body', {})
             
-            print(f"Parsed Lambda response body: {json.dumps(body, indent=2)}")
+            logger.debug("Parsed Lambda response body: %s", Payload(body))
             
-            # Extract improved story from the analysis
-            improved_story = self._extract_improved_story(body.get('analysis', ''), original_story)
-            print(f"Extracted improved story: {improved_story.text if improved_story else 'None'}")  # Debug log
+            status_code = lambda_response.get('statusCode', 200)
+            if status_code != 200:
+                error = handler_error(body, status_code)
+                logger.warning("Handler rejected the story (%s): %s", status_code, error)
+                return AnalysisResult(
+                    original_story=original_story,
+                    improved_story=None,
+                    analysis=error,
+                    suggestions={},
+                    status=AnalysisStatus.ERROR,
+                    status_code=status_code
+                )
+            
+            # Use validated structured output when the agent returned it, otherwise parse the text
+            structured = body.get('structured')
+            if structured and structured.get('improved_story') and structured.get('acceptance_criteria'):
+                improved_story = Story(
+                    text=structured['improved_story'],
+                    acceptance_criteria=structured['acceptance_criteria'],
+                    context=original_story.context,
+                    version=original_story.version + 1
+                )
+            else:
+                improved_story = self._extract_improved_story(body.get('analysis', ''), original_story)
+            logger.debug("Extracted improved story: %s", Payload(improved_story.text if improved_story else None))
             
             return AnalysisResult(
                 original_story=original_story,
@@ -288,7 +369,7 @@ class StoryAnalyzer:
             )
             
         except Exception as e:
-            print(f"Error parsing Lambda response: {str(e)}")
+            logger.exception("Error parsing Lambda response: %s", e)
             return AnalysisResult(
                 original_story=original_story,
                 improved_story=None,
@@ -300,97 +381,21 @@ class StoryAnalyzer:
     def _extract_improved_story(self, analysis: str, original_story: Story) -> Optional[Story]:
         """Extract improved story from analysis text."""
         try:
-            print("\n=== Extracting Improved Story ===")
-            print("Full analysis text:")
-            print(analysis)
-            
-            # Look for improved story section with flexible matching
-            possible_markers = [
-                "\nImproved Story:\n",
-                "Improved Story:",
-                "\nImproved User Story:\n",
-                "\nEnhanced Story:\n",
-                "\nIMPROVED STORY:\n"
-            ]
-            
-            # Find the story section
-            story_start = -1
-            for marker in possible_markers:
-                story_start = analysis.find(marker)
-                if story_start != -1:
-                    print(f"Found marker: '{marker}' at position {story_start}")
-                    story_start += len(marker)
-                    break
-            
-            if story_start == -1:
-                print("No story marker found in text:")
-                print("---")
-                print(analysis)
-                print("---")
-                return None
-                
-            # Find acceptance criteria section
-            possible_ac_markers = [
-                "\nEnhanced Acceptance Criteria:\n",
-                "\nAcceptance Criteria:\n",
-                "Enhanced Acceptance Criteria:",
-                "Acceptance Criteria:",
-                "\nACCEPTANCE CRITERIA:\n"
-            ]
-            
-            story_end = -1
-            for marker in possible_ac_markers:
-                story_end = analysis.find(marker, story_start)
-                if story_end != -1:
-                    print(f"Found AC marker: '{marker}' at position {story_end}")
-                    break
-            
-            if story_end == -1:
-                story_end = len(analysis)
-                
-            # Extract and clean the story text
-            story_text = analysis[story_start:story_end].strip()
-            print(f"\nExtracted story text: '{story_text}'")
-            
-            # Extract acceptance criteria
-            ac_start = -1
-            for marker in possible_ac_markers:
-                ac_start = analysis.find(marker)
-                if ac_start != -1:
-                    print(f"Found AC marker for extraction: '{marker}'")
-                    ac_start += len(marker)
-                    break
-            
-            acceptance_criteria = []
-            if ac_start != -1:
-                ac_end = analysis.find("\nAdditional Suggestions:", ac_start)
-                if ac_end == -1:
-                    ac_end = len(analysis)
-                
-                ac_text = analysis[ac_start:ac_end].strip()
-                print(f"\nRaw AC text:\n{ac_text}")
-                
-                acceptance_criteria = [
-                    criterion.strip('- ').strip()
-                    for criterion in ac_text.split('\n')
-                    if criterion.strip('- ').strip()
-                ]
-                print(f"\nExtracted acceptance criteria: {acceptance_criteria}")
+            parsed = parse_response(analysis)
+            story_text = parsed.improved_story
+            acceptance_criteria = parsed.acceptance_criteria
             
             if story_text and acceptance_criteria:
-                improved_story = Story(
+                return Story(
                     text=story_text,
                     acceptance_criteria=acceptance_criteria,
                     context=original_story.context,
                     version=original_story.version + 1
                 )
-                print(f"\nCreated improved story: {improved_story}")
-                return improved_story
                 
-            print("\nMissing story text or acceptance criteria")
+            logger.warning("Missing story text or acceptance criteria (sections found: %s)", list(parsed.sections))
             return None
             
         except Exception as e:
-            print(f"Error extracting improved story: {str(e)}")
-            print(f"Full traceback: {traceback.format_exc()}")
-            return None 
\ No newline at end of file
+            logger.exception("Error extracting improved story: %s", e)
+            return None
@@ -0,0 +1,363 @@
+import os
+import json
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, asdict, field
+from typing import Dict, Any, List, Optional, Type, TypeVar
+
+from ai.shared.logging_utils import get_logger
+
+logger = get_logger(__name__)
+
+LEVELS = ['High', 'Medium', 'Low']
+FIBONACCI_POINTS = [1, 2, 3, 5, 8, 13, 21]
+INVEST_KEYS = ['independent', 'negotiable', 'valuable', 'estimable', 'small', 'testable']
+
+T = TypeVar('T', bound='StructuredOutput')
+
+
+class SchemaValidationError(ValueError):
+    """Structured LLM output didn't match the agent's schema"""
+    pass
+
+
+def structured_output_enabled(body: Optional[Dict[str, Any]] = None) -> bool:
+    """Per-request 'structured' flag, falling back to LLM_STRUCTURED_OUTPUT"""
+    if body and body.get('structured') is not None:
+        return bool(body['structured'])
+    return os.getenv('LLM_STRUCTURED_OUTPUT', '').lower() in ('1', 'true', 'yes')
+
+
+def _string(data: Dict[str, Any], key: str, required: bool = True) -> str:
+    value = data.get(key)
+    if value is None and not required:
+        return ''
+    if not isinstance(value, str) or (required and not value.strip()):
+        raise SchemaValidationError(f"'{key}' must be a non-empty string")
+    return value.strip()
+
+
+def _string_list(data: Dict[str, Any], key: str) -> List[str]:
+    value = data.get(key) or []
+    if not isinstance(value, list) or not all(isinstance(v, str) for v in value):
+        raise SchemaValidationError(f"'{key}' must be a list of strings")
+    return [v.strip() for v in value if v.strip()]
+
+
+def _level(data: Dict[str, Any], key: str) -> str:
+    value = str(data.get(key, '')).strip().capitalize()
+    if value not in LEVELS:
+        raise SchemaValidationError(f"'{key}' must be one of {LEVELS}")
+    return value
+
+
+def _bullets(items: List[str]) -> str:
+    return "\n".join(f"- {item}" for item in items)
+
+
+class StructuredOutput(ABC):
+    """Base for agent output schemas; FUNCTION is the OpenAI function definition"""
+    FUNCTION: Dict[str, Any] = {}
+
+    @classmethod
+    @abstractmethod
+    def from_dict(cls: Type[T], data: Dict[str, Any]) -> T:
+        pass
+
+    @abstractmethod
+    def to_text(self) -> str:
+        """Render in the free-text layout the prompts ask for, for display and older consumers"""
+        pass
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+@dataclass
+class AgileCoachOutput(StructuredOutput):
+    invest_analysis: Dict[str, str]
+    improved_story: str
+    acceptance_criteria: List[str]
+    additional_suggestions: str = ''
+
+    FUNCTION = {
+        'name': 'submit_story_review',
+        'description': 'Submit the INVEST analysis and the improved user story',
+        'parameters': {
+            'type': 'object',
+            'properties': {
+                'invest_analysis': {
+                    'type': 'object',
+                    'properties': {k: {'type': 'string'} for k in INVEST_KEYS},
+                    'required': INVEST_KEYS
+                },
+                'improved_story': {'type': 'string', 'description': 'Improved story in As a/I want/So that format'},
+                'acceptance_criteria': {'type': 'array', 'items': {'type': 'string'}},
+                'additional_suggestions': {'type': 'string'}
+            },
+            'required': ['invest_analysis', 'improved_story', 'acceptance_criteria']
+        }
+    }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "AgileCoachOutput":
+        invest = data.get('invest_analysis') or {}
+        if not isinstance(invest, dict):
+            raise SchemaValidationError("'invest_analysis' must be an object")
+        criteria = _string_list(data, 'acceptance_criteria')
+        if not criteria:
+            raise SchemaValidationError("'acceptance_criteria' must not be empty")
+        return cls(
+            invest_analysis={k: str(invest.get(k, '')).strip() for k in INVEST_KEYS},
+            improved_story=_string(data, 'improved_story'),
+            acceptance_criteria=criteria,
+            additional_suggestions=_string(data, 'additional_suggestions', required=False)
+        )
+
+    def to_text(self) -> str:
+        invest = "\n".join(f"- {k.capitalize()}: {self.invest_analysis.get(k, '')}" for k in INVEST_KEYS)
+        return (f"INVEST Analysis:\n{invest}\n\n"
+                f"Improved Story:\n{self.improved_story}\n\n"
+                f"Enhanced Acceptance Criteria:\n{_bullets(self.acceptance_criteria)}\n\n"
+                f"Additional Suggestions:\n{self.additional_suggestions}")
+
+
+@dataclass
+class SeniorDevOutput(StructuredOutput):
+    feasibility: str
+    complexity: str
+    dependencies: List[str]
+    technical_risks: List[str]
+    acceptance_criteria: List[str]
+    implementation_details: Dict[str, str]
+    improved_story: Optional[str] = None
+
+    FUNCTION = {
+        'name': 'submit_technical_review',
+        'description': 'Submit the technical feasibility review of the story',
+        'parameters': {
+            'type': 'object',
+            'properties': {
+                'feasibility': {'type': 'string', 'enum': LEVELS},
+                'complexity': {'type': 'string', 'enum': LEVELS},
+                'dependencies': {'type': 'array', 'items': {'type': 'string'}},
+                'technical_risks': {'type': 'array', 'items': {'type': 'string'}},
+                'improved_story': {'type': 'string', 'description': 'Only if technical clarifications are needed'},
+                'acceptance_criteria': {'type': 'array', 'items': {'type': 'string'}},
+                'implementation_details': {
+                    'type': 'object',
+                    'properties': {k: {'type': 'string'} for k in ['architecture', 'data_flow', 'security', 'testing']}
+                }
+            },
+            'required': ['feasibility', 'complexity', 'dependencies', 'technical_risks', 'acceptance_criteria']
+        }
+    }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "SeniorDevOutput":
+        details = data.get('implementation_details') or {}
+        if not isinstance(details, dict):
+            raise SchemaValidationError("'implementation_details' must be an object")
+        return cls(
+            feasibility=_level(data, 'feasibility'),
+            complexity=_level(data, 'complexity'),
+            dependencies=_string_list(data, 'dependencies'),
+            technical_risks=_string_list(data, 'technical_risks'),
+            acceptance_criteria=_string_list(data, 'acceptance_criteria'),
+            implementation_details={k: str(v).strip() for k, v in details.items()},
+            improved_story=_string(data, 'improved_story', required=False) or None
+        )
+
+    def to_text(self) -> str:
+        details = "\n".join(f"- {k.replace('_', ' ').title()}: {v}" for k, v in self.implementation_details.items())
+        return (f"Technical Analysis:\n"
+                f"- Feasibility: {self.feasibility}\n"
+                f"- Complexity: {self.complexity}\n"
+                f"- Dependencies: {', '.join(self.dependencies)}\n"
+                f"- Technical Risks: {'; '.join(self.technical_risks)}\n\n"
+                f"Improved version of the story:\n{self.improved_story or 'No technical clarifications needed.'}\n\n"
+                f"Enhanced acceptance criteria:\n{_bullets(self.acceptance_criteria)}\n\n"
+                f"Implementation Details:\n{details}")
+
+
+@dataclass
+class EstimateOutput(StructuredOutput):
+    """Fields shared by person-day and story point estimates"""
+    confidence: str
+    technical_considerations: List[str] = field(default_factory=list)
+    risk_factors: List[str] = field(default_factory=list)
+    explanation: str = ''
+
+    ESTIMATE_PROPERTIES = {
+        'confidence': {'type': 'string', 'enum': LEVELS},
+        'technical_considerations': {'type': 'array', 'items': {'type': 'string'}},
+        'risk_factors': {'type': 'array', 'items': {'type': 'string'}},
+        'explanation': {'type': 'string'}
+    }
+
+    @property
+    @abstractmethod
+    def estimate(self) -> float:
+        """The estimate itself, in the schema's unit"""
+        pass
+
+    def _details_text(self) -> str:
+        return (f"Technical Considerations:\n{_bullets(self.technical_considerations)}\n\n"
+                f"Risk Factors:\n{_bullets(self.risk_factors)}\n\n"
+                f"Explanation:\n{self.explanation}")
+
+
+@dataclass
+class DayEstimateOutput(EstimateOutput):
+    person_days: float = 0.0
+
+    FUNCTION = {
+        'name': 'submit_day_estimate',
+        'description': 'Submit an effort estimate in person-days',
+        'parameters': {
+            'type': 'object',
+            'properties': {
+                'person_days': {'type': 'number', 'minimum': 0},
+                **EstimateOutput.ESTIMATE_PROPERTIES
+            },
+            'required': ['person_days', 'confidence', 'explanation']
+        }
+    }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "DayEstimateOutput":
+        try:
+            person_days = float(data.get('person_days'))
+        except (TypeError, ValueError):
+            raise SchemaValidationError("'person_days' must be a number")
+        if person_days < 0:
+            raise SchemaValidationError("'person_days' must not be negative")
+        return cls(
+            person_days=person_days,
+            confidence=_level(data, 'confidence'),
+            technical_considerations=_string_list(data, 'technical_considerations'),
+            risk_factors=_string_list(data, 'risk_factors'),
+            explanation=_string(data, 'explanation', required=False)
+        )
+
+    @property
+    def estimate(self) -> float:
+        return self.person_days
+
+    def to_text(self) -> str:
+        return (f"Effort Estimate:\n- Person-days: {self.person_days}\n- Confidence Level: {self.confidence}\n\n"
+                + self._details_text())
+
+
+@dataclass
+class PointEstimateOutput(EstimateOutput):
+    story_points: int = 0
+
+    FUNCTION = {
+        'name': 'submit_point_estimate',
+        'description': 'Submit a story point estimate from the Fibonacci sequence',
+        'parameters': {
+            'type': 'object',
+            'properties': {
+                'story_points': {'type': 'integer', 'enum': FIBONACCI_POINTS},
+                **EstimateOutput.ESTIMATE_PROPERTIES
+            },
+            'required': ['story_points', 'confidence', 'explanation']
+        }
+    }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "PointEstimateOutput":
+        try:
+            points = int(data.get('story_points'))
+        except (TypeError, ValueError):
+            raise SchemaValidationError("'story_points' must be an integer")
+        if points not in FIBONACCI_POINTS:
+            raise SchemaValidationError(f"'story_points' must be one of {FIBONACCI_POINTS}")
+        return cls(
+            story_points=points,
+            confidence=_level(data, 'confidence'),
+            technical_considerations=_string_list(data, 'technical_considerations'),
+            risk_factors=_string_list(data, 'risk_factors'),
+            explanation=_string(data, 'explanation', required=False)
+        )
+
+    @property
+    def estimate(self) -> float:
+        return self.story_points
+
+    def to_text(self) -> str:
+        return (f"Story Points: {self.story_points}\nConfidence Level: {self.confidence}\n\n"
+                + self._details_text())
+
+
+def function_call_args(output_cls: Type[StructuredOutput]) -> Dict[str, Any]:
+    """Chat completion arguments that force the model to answer through the schema's function"""
+    return {
+        'functions': [output_cls.FUNCTION],
+        'function_call': {'name': output_cls.FUNCTION['name']}
+    }
+
+
+def parse_function_call(response: Any, output_cls: Type[T]) -> Optional[T]:
+    """
+    Validate the function call arguments of a chat completion into output_cls.
+    Returns None (and logs why) if the model didn't call the function or the
+    arguments don't match, so callers can fall back to the text content.
+    """
+    try:
+        message = response.choices[0].message
+        function_call = message.get('function_call')
+        if not function_call:
+            logger.warning("No function call in structured response for %s", output_cls.__name__)
+            return None
+        return output_cls.from_dict(json.loads(function_call['arguments']))
+    except (json.JSONDecodeError, SchemaValidationError, KeyError, TypeError) as e:
+        logger.warning("Invalid structured output for %s: %s", output_cls.__name__, e)
+        return None
+
+
+def panel_function(output_cls: Type[EstimateOutput]) -> Dict[str, Any]:
+    """Function definition for one call returning output_cls estimates for several named personas"""
+    item = output_cls.FUNCTION['parameters']
+    return {
+        'name': output_cls.FUNCTION['name'].replace('submit_', 'submit_team_', 1) + 's',
+        'description': 'Submit one estimate per team member',
+        'parameters': {
+            'type': 'object',
+            'properties': {
+                'estimates': {
+                    'type': 'array',
+                    'items': {
+                        'type': 'object',
+                        'properties': {'name': {'type': 'string'}, **item['properties']},
+                        'required': ['name'] + item['required']
+                    }
+                }
+            },
+            'required': ['estimates']
+        }
+    }
+
+
+def parse_panel_function_call(response: Any, output_cls: Type[T]) -> Dict[str, T]:
+    """
+    Validate a panel function call into {persona name: output_cls}. Entries that
+    don't match the schema are dropped (and logged) so the others still count.
+    """
+    try:
+        function_call = response.choices[0].message.get('function_call')
+        if not function_call:
+            logger.warning("No function call in panel response for %s", output_cls.__name__)
+            return {}
+        entries = json.loads(function_call['arguments']).get('estimates') or []
+    except (json.JSONDecodeError, KeyError, TypeError, AttributeError) as e:
+        logger.warning("Invalid panel output for %s: %s", output_cls.__name__, e)
+        return {}
+
+    estimates = {}
+    for entry in entries:
+        try:
+            estimates[str(entry['name']).strip()] = output_cls.from_dict(entry)
+        except (SchemaValidationError, KeyError, TypeError) as e:
+            logger.warning("Dropping invalid panel estimate %s: %s", entry, e)
+    return estimates
@@ -0,0 +1,454 @@
+"""
+Persistent store for stories and the results of each workflow stage.
+
+Every analysis, technical review and team estimation is recorded against a
+story id and version, so later calls can send those ids instead of sending
+the whole previous response back:
+- /analyze returns story_id and analysis_id
+- /analyze/feedback accepts analysis_id in place of analysis_result
+- /estimate/days accepts story_id (and optionally version) in place of story
+
+SQLite is the default backend; the schema lives in db/schemas/stories.sql.
+Another database plugs in by subclassing StoryStore and installing it with
+set_story_store().
+
+Configuration:
+- STORY_STORE: "sqlite" (default), "memory" (SQLite in memory) or "off"
+- STORY_STORE_PATH: SQLite file, default db/agilestories.sqlite3
+"""
+import os
+import json
+import uuid
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+from ai.shared.logging_utils import get_logger
+from ai.shared.story_analyzer import AnalysisResult, AnalysisStatus, Story
+
+logger = get_logger(__name__)
+
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+SCHEMA_PATH = os.path.join(project_root, 'db', 'schemas', 'stories.sql')
+
+AGILE_REVIEW = AnalysisStatus.AGILE_REVIEW.value
+TECHNICAL_REVIEW = AnalysisStatus.TECHNICAL_REVIEW.value
+
+ERROR = AnalysisStatus.ERROR.value
+# A rejection returns the story to input: its status changes but there is no analysis to keep
+REJECTED = 'input'
+
+
+def _now() -> str:
+    return datetime.now().isoformat()
+
+
+def _new_id() -> str:
+    return uuid.uuid4().hex
+
+
+def _story_dict(story: Union[Story, Dict[str, Any]]) -> Dict[str, Any]:
+    data = story.to_dict() if isinstance(story, Story) else story
+    return {
+        'text': data['text'],
+        'acceptance_criteria': list(data.get('acceptance_criteria') or []),
+        'context': data.get('context') or '',
+        'version': int(data.get('version') or 1)
+    }
+
+
+class StoryStore(ABC):
+    """
+    Base class for story stores. Backends implement the row-level methods;
+    the record_*/load_* helpers map workflow responses onto them.
+    """
+
+    @abstractmethod
+    def create_story(self, story: Story) -> str:
+        """Store a new story at story.version and return its id"""
+        pass
+
+    @abstractmethod
+    def add_version(self, story_id: str, story: Story) -> int:
+        """
+        Store story as a version of story_id and return its version number.
+        Content identical to an existing version reuses that version; otherwise
+        story.version is kept if free, else the next number is used.
+        """
+        pass
+
+    @abstractmethod
+    def get_story(self, story_id: str, version: Optional[int] = None) -> Optional[Story]:
+        """A stored version, or the current one when version is None"""
+        pass
+
+    @abstractmethod
+    def get_status(self, story_id: str) -> Optional[str]:
+        pass
+
+    @abstractmethod
+    def set_status(self, story_id: str, status: str) -> None:
+        pass
+
+    @abstractmethod
+    def insert_analysis(self, row: Dict[str, Any]) -> None:
+        """Store one analysis_results row (see stories.sql for the columns)"""
+        pass
+
+    @abstractmethod
+    def get_analysis(self, analysis_id: str) -> Optional[Dict[str, Any]]:
+        """One analysis_results row, with JSON columns decoded"""
+        pass
+
+    @abstractmethod
+    def list_analyses(self, story_id: str, version: Optional[int] = None,
+                      stage: Optional[str] = None) -> List[Dict[str, Any]]:
+        pass
+
+    @abstractmethod
+    def insert_estimates(self, rows: List[Dict[str, Any]]) -> None:
+        """Store the estimates rows of one estimation run"""
+        pass
+
+    @abstractmethod
+    def list_estimates(self, story_id: str, version: Optional[int] = None) -> List[Dict[str, Any]]:
+        pass
+
+    @abstractmethod
+    def insert_session(self, row: Dict[str, Any]) -> None:
+        """Store one workflow_sessions row"""
+        pass
+
+    @abstractmethod
+    def get_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+        pass
+
+    @abstractmethod
+    def update_session(self, session_id: str, expected_status: str, **fields: Any) -> bool:
+        """
+        Update a session only if its status is still expected_status, so two
+        decisions on one session can't both advance it. False if it had moved on
+        """
+        pass
+
+    def save_story(self, story: Story, story_id: Optional[str] = None) -> Tuple[str, int]:
+        """Store story as a new story, or as a version of story_id; returns (story_id, version)"""
+        if story_id is None:
+            return self.create_story(story), story.version
+        return story_id, self.add_version(story_id, story)
+
+    def record_analysis(self, result: Union[AnalysisResult, Dict[str, Any]], story_id: Optional[str] = None,
+                        stage: str = AGILE_REVIEW) -> Union[AnalysisResult, Dict[str, Any]]:
+        """
+        Store an analysis or technical review and set story_id/analysis_id on it.
+        Without story_id the analysed story is stored as a new story. The
+        suggested rewrite, if any, becomes a new version. Rejections only
+        update the story's status; failed stages aren't stored at all.
+        """
+        data = result.to_dict() if isinstance(result, AnalysisResult) else result
+        if not data.get('original_story') or data['status'] == ERROR:
+            return result
+        original = _story_dict(data['original_story'])
+        story_id, version = self.save_story(Story(**original), story_id)
+
+        analysis_id = None
+        if data['status'] == REJECTED:
+            self.set_status(story_id, data['status'])
+        else:
+            improved_version = None
+            if data.get('improved_story'):
+                improved_version = self.add_version(story_id, Story(**_story_dict(data['improved_story'])))
+            analysis_id = _new_id()
+            self.insert_analysis({
+                'id': analysis_id,
+                'story_id': story_id,
+                'version': version,
+                'stage': stage,
+                'status': data['status'],
+                'improved_version': improved_version,
+                'analysis': data.get('analysis') or '',
+                'suggestions': data.get('suggestions') or {},
+                'usage': data.get('usage'),
+                'created_at': _now()
+            })
+            self.set_status(story_id, data['status'])
+            if improved_version is not None and improved_version != data['improved_story'].get('version'):
+                logger.debug("Stored suggested rewrite as version %d", improved_version)
+                if isinstance(result, AnalysisResult):
+                    result.improved_story.version = improved_version
+                else:
+                    result['improved_story'] = {**data['improved_story'], 'version': improved_version}
+
+        if isinstance(result, AnalysisResult):
+            result.original_story.version = version
+            result.story_id = story_id
+            result.analysis_id = analysis_id
+        else:
+            result['original_story'] = {**original, 'version': version}
+            result['story_id'] = story_id
+            result['analysis_id'] = analysis_id
+        return result
+
+    def load_analysis(self, analysis_id: str) -> Optional[Dict[str, Any]]:
+        """A stored analysis in the AnalysisResult.to_dict() shape, ready for process_user_feedback"""
+        row = self.get_analysis(analysis_id)
+        if row is None:
+            return None
+        original = self.get_story(row['story_id'], row['version'])
+        improved = self.get_story(row['story_id'], row['improved_version']) if row['improved_version'] else None
+        return {
+            'original_story': original.to_dict(),
+            'improved_story': improved.to_dict() if improved else None,
+            'analysis': row['analysis'],
+            'suggestions': row['suggestions'],
+            'status': row['status'],
+            'timestamp': row['created_at'],
+            'usage': row['usage'],
+            'story_id': row['story_id'],
+            'analysis_id': row['id']
+        }
+
+    def record_estimates(self, summary: Dict[str, Any], story_id: str, version: int, unit: str = 'days') -> str:
+        """Store the per-persona estimates of a team summary; returns the run id"""
+        run_id = _new_id()
+        created_at = _now()
+        self.insert_estimates([
+            {
+                'id': _new_id(),
+                'run_id': run_id,
+                'story_id': story_id,
+                'version': version,
+                'unit': unit,
+                'persona': entry['name'],
+                'role': entry.get('role', ''),
+                'estimate': entry.get('estimate'),
+                'justification': entry.get('justification'),
+                'status': entry.get('status') or ('complete' if entry.get('estimate') is not None else 'error'),
+                'created_at': created_at
+            }
+            for entry in summary.get('team_estimates', [])
+        ])
+        self.set_status(story_id, AnalysisStatus.COMPLETE.value)
+        return run_id
+
+    def history(self, story_id: str) -> Optional[Dict[str, Any]]:
+        """Everything stored about a story: current status and version, analyses and estimates"""
+        status = self.get_status(story_id)
+        if status is None:
+            return None
+        current = self.get_story(story_id)
+        return {
+            'story_id': story_id,
+            'status': status,
+            'story': current.to_dict(),
+            'analyses': self.list_analyses(story_id),
+            'estimates': self.list_estimates(story_id)
+        }
+
+
+class SQLiteStoryStore(StoryStore):
+    """Store backed by one SQLite database, shared between the workers on a host"""
+
+    def __init__(self, path: str, schema_path: str = SCHEMA_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        if path != ':memory:':
+            self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA busy_timeout=5000')
+        with open(schema_path, 'r') as f:
+            self._conn.executescript(f.read())
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._conn.execute('COMMIT')
+
+    def _query(self, sql: str, params: tuple = ()) -> List[sqlite3.Row]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    @staticmethod
+    def _insert_version(conn: sqlite3.Connection, story_id: str, version: int, story: Story, now: str) -> None:
+        conn.execute(
+            'INSERT INTO story_versions (story_id, version, text, acceptance_criteria, context, created_at) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            (story_id, version, story.text, json.dumps(story.acceptance_criteria), story.context or '', now)
+        )
+
+    def create_story(self, story: Story) -> str:
+        story_id = _new_id()
+        now = _now()
+        with self._transaction() as conn:
+            conn.execute(
+                'INSERT INTO stories (id, current_version, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?)',
+                (story_id, story.version, AnalysisStatus.PENDING.value, now, now)
+            )
+            self._insert_version(conn, story_id, story.version, story, now)
+        return story_id
+
+    def add_version(self, story_id: str, story: Story) -> int:
+        now = _now()
+        with self._transaction() as conn:
+            if conn.execute('SELECT 1 FROM stories WHERE id = ?', (story_id,)).fetchone() is None:
+                raise KeyError(f"Story {story_id} not found")
+            rows = conn.execute(
+                'SELECT version, text, acceptance_criteria, context FROM story_versions WHERE story_id = ?',
+                (story_id,)
+            ).fetchall()
+            for row in rows:
+                if (row['text'], json.loads(row['acceptance_criteria']), row['context']) == \
+                        (story.text, story.acceptance_criteria, story.context or ''):
+                    return row['version']
+            taken = {row['version'] for row in rows}
+            version = story.version if story.version not in taken else max(taken) + 1
+            self._insert_version(conn, story_id, version, story, now)
+            conn.execute(
+                'UPDATE stories SET current_version = MAX(current_version, ?), updated_at = ? WHERE id = ?',
+                (version, now, story_id)
+            )
+        return version
+
+    def get_story(self, story_id: str, version: Optional[int] = None) -> Optional[Story]:
+        if version is None:
+            rows = self._query(
+                'SELECT v.* FROM story_versions v JOIN stories s ON s.id = v.story_id '
+                'WHERE v.story_id = ? AND v.version = s.current_version', (story_id,)
+            )
+        else:
+            rows = self._query('SELECT * FROM story_versions WHERE story_id = ? AND version = ?', (story_id, version))
+        if not rows:
+            return None
+        row = rows[0]
+        return Story(text=row['text'], acceptance_criteria=json.loads(row['acceptance_criteria']),
+                     context=row['context'], version=row['version'])
+
+    def get_status(self, story_id: str) -> Optional[str]:
+        rows = self._query('SELECT status FROM stories WHERE id = ?', (story_id,))
+        return rows[0]['status'] if rows else None
+
+    def set_status(self, story_id: str, status: str) -> None:
+        with self._lock:
+            self._conn.execute('UPDATE stories SET status = ?, updated_at = ? WHERE id = ?', (status, _now(), story_id))
+
+    def insert_analysis(self, row: Dict[str, Any]) -> None:
+        with self._lock:
+            self._conn.execute(
+                'INSERT INTO analysis_results (id, story_id, version, stage, status, improved_version, analysis, '
+                'suggestions, usage, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (row['id'], row['story_id'], row['version'], row['stage'], row['status'], row['improved_version'],
+                 row['analysis'], json.dumps(row['suggestions']),
+                 json.dumps(row['usage']) if row['usage'] is not None else None, row['created_at'])
+            )
+
+    @staticmethod
+    def _analysis(row: sqlite3.Row) -> Dict[str, Any]:
+        data = dict(row)
+        data['suggestions'] = json.loads(data['suggestions'])
+        data['usage'] = json.loads(data['usage']) if data['usage'] else None
+        return data
+
+    def get_analysis(self, analysis_id: str) -> Optional[Dict[str, Any]]:
+        rows = self._query('SELECT * FROM analysis_results WHERE id = ?', (analysis_id,))
+        return self._analysis(rows[0]) if rows else None
+
+    def list_analyses(self, story_id: str, version: Optional[int] = None,
+                      stage: Optional[str] = None) -> List[Dict[str, Any]]:
+        sql = 'SELECT * FROM analysis_results WHERE story_id = ?'
+        params: list = [story_id]
+        if version is not None:
+            sql += ' AND version = ?'
+            params.append(version)
+        if stage is not None:
+            sql += ' AND stage = ?'
+            params.append(stage)
+        return [self._analysis(row) for row in self._query(sql + ' ORDER BY created_at', tuple(params))]
+
+    def insert_estimates(self, rows: List[Dict[str, Any]]) -> None:
+        with self._transaction() as conn:
+            conn.executemany(
+                'INSERT INTO estimates (id, run_id, story_id, version, unit, persona, role, estimate, justification, '
+                'status, created_at) VALUES (:id, :run_id, :story_id, :version, :unit, :persona, :role, :estimate, '
+                ':justification, :status, :created_at)',
+                rows
+            )
+
+    def list_estimates(self, story_id: str, version: Optional[int] = None) -> List[Dict[str, Any]]:
+        sql = 'SELECT * FROM estimates WHERE story_id = ?'
+        params: list = [story_id]
+        if version is not None:
+            sql += ' AND version = ?'
+            params.append(version)
+        return [dict(row) for row in self._query(sql + ' ORDER BY created_at, persona', tuple(params))]
+
+    def insert_session(self, row: Dict[str, Any]) -> None:
+        with self._lock:
+            self._conn.execute(
+                'INSERT INTO workflow_sessions (id, story_id, status, version, analysis_id, error, created_at, '
+                'updated_at) VALUES (:id, :story_id, :status, :version, :analysis_id, :error, :created_at, '
+                ':updated_at)',
+                row
+            )
+
+    def get_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+        rows = self._query('SELECT * FROM workflow_sessions WHERE id = ?', (session_id,))
+        return dict(rows[0]) if rows else None
+
+    def update_session(self, session_id: str, expected_status: str, **fields: Any) -> bool:
+        fields['updated_at'] = _now()
+        columns = ', '.join(f'{name} = ?' for name in fields)
+        with self._lock:
+            cursor = self._conn.execute(
+                f'UPDATE workflow_sessions SET {columns} WHERE id = ? AND status = ?',
+                (*fields.values(), session_id, expected_status)
+            )
+            return cursor.rowcount == 1
+
+
+_store: Optional[StoryStore] = None
+_store_configured = False
+_store_lock = threading.Lock()
+
+
+def build_store_from_env() -> Optional[StoryStore]:
+    mode = os.getenv('STORY_STORE', 'sqlite').lower()
+    if mode in ('off', 'none', '0', 'false'):
+        return None
+    if mode == 'memory':
+        return SQLiteStoryStore(':memory:')
+
+    path = os.getenv('STORY_STORE_PATH', os.path.join(project_root, 'db', 'agilestories.sqlite3'))
+    try:
+        return SQLiteStoryStore(path)
+    except sqlite3.Error as e:
+        logger.warning("Could not open story store at %s, keeping it in memory: %s", path, e)
+        return SQLiteStoryStore(':memory:')
+
+
+def get_story_store() -> Optional[StoryStore]:
+    """Return the process-wide story store (None when storage is disabled)"""
+    global _store, _store_configured
+    if not _store_configured:
+        with _store_lock:
+            if not _store_configured:
+                _store = build_store_from_env()
+                _store_configured = True
+    return _store
+
+
+def set_story_store(store: Optional[StoryStore]) -> None:
+    """Install a custom store implementation, or None to disable storage"""
+    global _store, _store_configured
+    with _store_lock:
+        _store = store
+        _store_configured = True
@@ -0,0 +1,222 @@
+"""
+Token usage and cost accounting for LLM calls.
+
+llm_client records the `usage` of every completion it gets from the backend
+(cache hits cost nothing and aren't counted). Each call is attributed to the
+current request's UsageTracker (see usage_context), to a workflow stage and
+persona taken from the enclosing metrics span, and to process-wide totals and
+Prometheus counters.
+
+Prices are USD per 1K tokens and can be overridden with LLM_PRICES, a JSON
+object of {"model-prefix": [prompt_price, completion_price]}. Prompt tokens the
+provider served from its prompt cache (usage.prompt_tokens_details.cached_tokens)
+are counted separately and billed at LLM_CACHED_PROMPT_DISCOUNT off.
+"""
+import os
+import json
+import asyncio
+import functools
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from ai.shared.logging_utils import get_logger
+from ai.shared.metrics import current_span_labels, get_metrics_registry
+
+logger = get_logger(__name__)
+
+DEFAULT_PRICES: Dict[str, Tuple[float, float]] = {
+    'gpt-4-32k': (0.06, 0.12),
+    'gpt-4-turbo': (0.01, 0.03),
+    'gpt-4-1106-preview': (0.01, 0.03),
+    'gpt-4o-mini': (0.00015, 0.0006),
+    'gpt-4o': (0.005, 0.015),
+    'gpt-4': (0.03, 0.06),
+    'gpt-3.5-turbo': (0.0005, 0.0015),
+}
+
+# Stage names are AnalysisStatus values; persona estimates happen after the final review
+STAGE_BY_AGENT = {
+    'agile_coach': 'agile_review',
+    'senior_dev': 'technical_review',
+}
+ESTIMATION_STAGE = 'estimation'
+
+# Share of the prompt price saved on cached prompt tokens
+CACHED_PROMPT_DISCOUNT = float(os.getenv('LLM_CACHED_PROMPT_DISCOUNT', 0.5))
+
+_registry = get_metrics_registry()
+TOKENS_TOTAL = _registry.counter('agilestories_llm_tokens_total', 'LLM tokens used',
+                                 ('stage', 'persona', 'model', 'kind'))
+COST_TOTAL = _registry.counter('agilestories_llm_cost_usd_total', 'Estimated LLM spend in USD',
+                               ('stage', 'persona', 'model'))
+
+
+def load_prices() -> Dict[str, Tuple[float, float]]:
+    prices = dict(DEFAULT_PRICES)
+    override = os.getenv('LLM_PRICES')
+    if override:
+        try:
+            prices.update({model: tuple(value) for model, value in json.loads(override).items()})
+        except (ValueError, TypeError) as e:
+            logger.warning("Ignoring invalid LLM_PRICES: %s", e)
+    return prices
+
+
+_prices = load_prices()
+
+
+def price_for(model: Optional[str]) -> Tuple[float, float]:
+    """Per-1K prices for the longest matching model prefix, (0, 0) if unknown"""
+    if not model:
+        return 0.0, 0.0
+    matches = [prefix for prefix in _prices if model.startswith(prefix)]
+    return _prices[max(matches, key=len)] if matches else (0.0, 0.0)
+
+
+def compute_cost(model: Optional[str], prompt_tokens: int, completion_tokens: int,
+                 cached_tokens: int = 0) -> float:
+    """USD cost; cached_tokens are the part of prompt_tokens served from the provider's prompt cache"""
+    prompt_price, completion_price = price_for(model)
+    prompt_cost = (prompt_tokens - cached_tokens * CACHED_PROMPT_DISCOUNT) * prompt_price
+    return (prompt_cost + completion_tokens * completion_price) / 1000
+
+
+@dataclass
+class TokenUsage:
+    calls: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0
+    cost_usd: float = 0.0
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    def add(self, prompt_tokens: int, completion_tokens: int, cost_usd: float, cached_tokens: int = 0) -> None:
+        self.calls += 1
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+        self.cached_tokens += cached_tokens
+        self.cost_usd += cost_usd
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {**asdict(self), 'total_tokens': self.total_tokens, 'cost_usd': round(self.cost_usd, 6)}
+
+
+class UsageTracker:
+    """Usage rolled up in total and by stage, persona and model; safe to share across threads"""
+
+    def __init__(self):
+        self.total = TokenUsage()
+        self.by_stage: Dict[str, TokenUsage] = {}
+        self.by_persona: Dict[str, TokenUsage] = {}
+        self.by_model: Dict[str, TokenUsage] = {}
+        self._lock = threading.Lock()
+
+    def record(self, model: str, prompt_tokens: int, completion_tokens: int, cost_usd: float,
+               stage: str, persona: Optional[str] = None, cached_tokens: int = 0) -> None:
+        counts = (prompt_tokens, completion_tokens, cost_usd, cached_tokens)
+        with self._lock:
+            self.total.add(*counts)
+            self.by_stage.setdefault(stage, TokenUsage()).add(*counts)
+            self.by_model.setdefault(model, TokenUsage()).add(*counts)
+            if persona:
+                self.by_persona.setdefault(persona, TokenUsage()).add(*counts)
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self.total.to_dict(),
+                'by_stage': {k: v.to_dict() for k, v in self.by_stage.items()},
+                'by_persona': {k: v.to_dict() for k, v in self.by_persona.items()},
+                'by_model': {k: v.to_dict() for k, v in self.by_model.items()}
+            }
+
+
+_current: ContextVar[Optional[UsageTracker]] = ContextVar('agilestories_usage', default=None)
+_totals = UsageTracker()
+
+
+def get_usage_totals() -> UsageTracker:
+    """Process-wide usage since startup"""
+    return _totals
+
+
+@contextmanager
+def usage_context() -> Iterator[UsageTracker]:
+    """Collect usage of the calls made inside the block, joining the enclosing request's tracker if any"""
+    tracker = _current.get()
+    if tracker is not None:
+        yield tracker
+        return
+    tracker = UsageTracker()
+    token = _current.set(tracker)
+    try:
+        yield tracker
+    finally:
+        _current.reset(token)
+
+
+def _field(usage: Any, key: str) -> int:
+    value = usage.get(key) if hasattr(usage, 'get') else getattr(usage, key, 0)
+    return int(value or 0)
+
+
+def _cached_tokens(usage: Any) -> int:
+    details = usage.get('prompt_tokens_details') if hasattr(usage, 'get') else getattr(usage, 'prompt_tokens_details', None)
+    return _field(details, 'cached_tokens') if details else 0
+
+
+def record_usage(model: Optional[str], usage: Any) -> None:
+    """Attribute one completion's usage (response.usage or an equivalent dict)"""
+    if not usage:
+        return
+    model = model or 'unknown'
+    prompt_tokens = _field(usage, 'prompt_tokens')
+    completion_tokens = _field(usage, 'completion_tokens')
+    cached_tokens = _cached_tokens(usage)
+    cost = compute_cost(model, prompt_tokens, completion_tokens, cached_tokens)
+
+    labels = current_span_labels()
+    persona = labels.get('persona')
+    stage = STAGE_BY_AGENT.get(labels.get('agent')) or (ESTIMATION_STAGE if persona else 'other')
+
+    _totals.record(model, prompt_tokens, completion_tokens, cost, stage, persona, cached_tokens)
+    tracker = _current.get()
+    if tracker is not None:
+        tracker.record(model, prompt_tokens, completion_tokens, cost, stage, persona, cached_tokens)
+
+    series = {'stage': stage, 'persona': persona, 'model': model}
+    TOKENS_TOTAL.inc(prompt_tokens, kind='prompt', **series)
+    TOKENS_TOTAL.inc(completion_tokens, kind='completion', **series)
+    if cached_tokens:
+        TOKENS_TOTAL.inc(cached_tokens, kind='cached_prompt', **series)
+    COST_TOTAL.inc(cost, **series)
+
+
+def _attach(result: Any, tracker: UsageTracker) -> Any:
+    if isinstance(result, dict):
+        result['usage'] = tracker.summary()
+    elif hasattr(result, 'usage'):
+        result.usage = tracker.summary()
+    return result
+
+
+def tracks_usage(fn):
+    """Run fn inside usage_context and attach the summary to its result ('usage' key or attribute)"""
+    if asyncio.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            with usage_context() as tracker:
+                return _attach(await fn(*args, **kwargs), tracker)
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with usage_context() as tracker:
+            return _attach(fn(*args, **kwargs), tracker)
+    return wrapper
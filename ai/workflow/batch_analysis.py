@@ -0,0 +1,113 @@
+import os
+import uuid
+import asyncio
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Any, Optional
+
+from ai.shared.story_analyzer import StoryAnalyzer, Story, AnalysisResult
+from ai.shared.logging_utils import get_logger
+from ai.shared.scheduler import BATCH, priority
+
+logger = get_logger(__name__)
+
+DEFAULT_BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', 4))
+MAX_BATCH_CONCURRENCY = int(os.getenv('BATCH_MAX_CONCURRENCY', 16))
+# Batches larger than this run in the background and return a job handle
+BATCH_SYNC_LIMIT = int(os.getenv('BATCH_SYNC_LIMIT', 20))
+MAX_RETAINED_JOBS = 100
+
+
+async def analyze_batch(analyzer: StoryAnalyzer, stories: List[Story], concurrency: int = DEFAULT_BATCH_CONCURRENCY,
+                        on_result=None) -> List[AnalysisResult]:
+    """
+    Run the Agile Coach analysis over many stories with at most `concurrency`
+    LLM calls in flight. Results keep the input order; on_result(index, result)
+    is called as each one finishes. Calls run at batch priority, using the
+    capacity interactive traffic leaves (see ai.shared.scheduler).
+    """
+    semaphore = asyncio.Semaphore(max(1, min(concurrency, MAX_BATCH_CONCURRENCY)))
+
+    async def run(index: int, story: Story) -> AnalysisResult:
+        async with semaphore:
+            result = await analyzer.start_analysis_async(story)
+        if on_result:
+            on_result(index, result)
+        return result
+
+    # Tasks copy the context when gather creates them, so they inherit the batch class
+    with priority(BATCH):
+        return await asyncio.gather(*(run(i, story) for i, story in enumerate(stories)))
+
+
+@dataclass
+class BatchJob:
+    """Progress and results of a background batch analysis"""
+    total: int
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    status: str = 'running'
+    results: List[Optional[Dict[str, Any]]] = field(default_factory=list)
+    completed: int = 0
+    error: Optional[str] = None
+    created_at: str = field(default_factory=lambda: datetime.now().isoformat())
+
+    def __post_init__(self):
+        if not self.results:
+            self.results = [None] * self.total
+
+    def record(self, index: int, result: AnalysisResult) -> None:
+        self.results[index] = result.to_dict()
+        self.completed += 1
+
+    def to_dict(self, include_results: bool = True) -> Dict[str, Any]:
+        data = {
+            'job_id': self.id,
+            'status': self.status,
+            'total': self.total,
+            'completed': self.completed,
+            'created_at': self.created_at
+        }
+        if self.error:
+            data['error'] = self.error
+        if include_results:
+            data['results'] = self.results
+        return data
+
+
+class BatchJobRegistry:
+    """In-process registry of background batch jobs (most recent MAX_RETAINED_JOBS kept)"""
+
+    def __init__(self, max_jobs: int = MAX_RETAINED_JOBS):
+        self.max_jobs = max_jobs
+        self._jobs: "OrderedDict[str, BatchJob]" = OrderedDict()
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def start(self, analyzer: StoryAnalyzer, stories: List[Story], concurrency: int) -> BatchJob:
+        """Create a job and run it on the current event loop"""
+        job = BatchJob(total=len(stories))
+        self._jobs[job.id] = job
+        while len(self._jobs) > self.max_jobs:
+            old_id, _ = self._jobs.popitem(last=False)
+            self._tasks.pop(old_id, None)
+
+        async def run():
+            try:
+                await analyze_batch(analyzer, stories, concurrency, on_result=job.record)
+                job.status = 'complete'
+            except Exception as e:
+                logger.exception("Batch job %s failed: %s", job.id, e)
+                job.status = 'error'
+                job.error = str(e)
+            finally:
+                self._tasks.pop(job.id, None)
+
+        self._tasks[job.id] = asyncio.get_running_loop().create_task(run())
+        return job
+
+    def get(self, job_id: str) -> Optional[BatchJob]:
+        return self._jobs.get(job_id)
+
+    def cancel_all(self) -> None:
+        for task in list(self._tasks.values()):
+            task.cancel()
@@ -0,0 +1,111 @@
+"""
+Consensus-based early stopping for team estimation.
+
+Estimates arrive one persona at a time. Once a quorum of the team has
+answered and the estimates so far agree within a set dispersion, the
+remaining personas are skipped: calls that haven't started are cancelled,
+and calls already in flight finish in the background, unused.
+
+Dispersion is the coefficient of variation (population standard deviation
+divided by the mean) of the estimates received so far.
+
+ESTIMATION_CONSENSUS turns it on by default. ESTIMATION_QUORUM sets the
+quorum, as a share of the team or, if 1 or more, a number of personas.
+ESTIMATION_MAX_DISPERSION sets the agreement threshold.
+"""
+import os
+import math
+import statistics
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+from ai.shared.logging_utils import get_logger
+from ai.shared.metrics import get_metrics_registry
+
+logger = get_logger(__name__)
+
+SKIPPED_TOTAL = get_metrics_registry().counter(
+    'agilestories_estimation_skipped_total', 'Persona estimates skipped after the team reached consensus', ('persona',)
+)
+
+
+def consensus_enabled(consensus: Optional[bool] = None) -> bool:
+    if consensus is not None:
+        return consensus
+    return os.getenv('ESTIMATION_CONSENSUS', 'off').lower() in ('1', 'true', 'on', 'yes')
+
+
+def dispersion(estimates: Sequence[float]) -> float:
+    """Coefficient of variation; 0 for a single estimate, inf when it is undefined"""
+    if len(estimates) < 2:
+        return 0.0
+    mean = statistics.fmean(estimates)
+    if mean <= 0:
+        return math.inf
+    return statistics.pstdev(estimates) / mean
+
+
+@dataclass
+class ConsensusPolicy:
+    quorum: float = 0.75
+    max_dispersion: float = 0.25
+
+    @classmethod
+    def from_env(cls) -> "ConsensusPolicy":
+        return cls(
+            quorum=float(os.getenv('ESTIMATION_QUORUM', cls.quorum)),
+            max_dispersion=float(os.getenv('ESTIMATION_MAX_DISPERSION', cls.max_dispersion))
+        )
+
+    def quorum_size(self, team_size: int) -> int:
+        size = int(self.quorum) if self.quorum >= 1 else math.ceil(self.quorum * team_size)
+        return max(2, min(size, team_size))
+
+
+class ConsensusWatch:
+    """Fed each estimate as it arrives; says when the team has agreed closely enough to stop"""
+
+    def __init__(self, team: Sequence[Any], policy: Optional[ConsensusPolicy] = None):
+        self.policy = policy or ConsensusPolicy.from_env()
+        self.names = [member.name for member in team]
+        self.quorum = self.policy.quorum_size(len(self.names))
+        self.received: List[str] = []
+        self.estimates: List[float] = []
+        self.reached = False
+
+    def add(self, response: Dict[str, Any]) -> bool:
+        """Record one persona's response; True once the remaining personas can be skipped"""
+        self.received.append(response['name'])
+        if response.get('estimate') is not None:
+            self.estimates.append(response['estimate'])
+        if len(self.estimates) < self.quorum or len(self.received) == len(self.names):
+            return False
+        self.reached = dispersion(self.estimates) <= self.policy.max_dispersion
+        return self.reached
+
+    def result(self) -> Dict[str, Any]:
+        skipped = [name for name in self.names if name not in self.received] if self.reached else []
+        for name in skipped:
+            SKIPPED_TOTAL.inc(persona=name)
+        if skipped:
+            logger.info("Consensus after %d of %d estimates, skipped %s", len(self.received), len(self.names), skipped)
+        return {
+            'reached': self.reached,
+            'quorum': self.quorum,
+            'max_dispersion': self.policy.max_dispersion,
+            'dispersion': round(dispersion(self.estimates), 3) if self.estimates else None,
+            'skipped': skipped
+        }
+
+
+def collect_estimates(estimates: Iterator[Dict[str, Any]], watch: Optional[ConsensusWatch] = None) -> List[Dict[str, Any]]:
+    """Drain an estimate stream, stopping (and closing it) as soon as watch reports consensus"""
+    responses = []
+    try:
+        for entry in estimates:
+            responses.append(entry)
+            if watch is not None and watch.add(entry):
+                break
+    finally:
+        estimates.close()
+    return responses
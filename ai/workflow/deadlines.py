@@ -0,0 +1,187 @@
+"""
+Deadlines and hedged requests for the estimation fan-out.
+
+fan_out() runs one call per team member on an executor and yields each
+member's finished future as soon as it completes. It never waits past:
+- the per-persona deadline (ESTIMATION_PERSONA_TIMEOUT_S), counted from
+  when that persona's call starts running
+- the overall deadline (ESTIMATION_TIMEOUT_S), counted from the fan-out
+A member that misses its deadline is yielded with no future, so the caller
+can report it as timed out and return partial results.
+
+A call still running past the ESTIMATION_HEDGE_PERCENTILE latency of recent
+estimator calls gets one duplicate ("hedged") request. Whichever attempt
+finishes first wins. Hedging waits until ESTIMATION_HEDGE_MIN_SAMPLES
+latencies have been seen; ESTIMATION_HEDGE_PERCENTILE=0 turns it off.
+
+Threads can't be interrupted, so a call that misses its deadline keeps its
+worker until it returns. Estimators also pass the persona deadline to
+OpenAI as request_timeout so hung sockets are eventually released.
+"""
+import os
+import time
+import threading
+import contextvars
+import concurrent.futures
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from ai.shared.logging_utils import get_logger
+from ai.shared.metrics import get_metrics_registry
+
+logger = get_logger(__name__)
+
+TIMED_OUT = 'timed_out'
+
+_registry = get_metrics_registry()
+HEDGES_TOTAL = _registry.counter('agilestories_estimation_hedges_total',
+                                 'Duplicate estimator requests sent for slow personas', ('persona',))
+TIMEOUTS_TOTAL = _registry.counter('agilestories_estimation_timeouts_total',
+                                   'Persona estimates abandoned at a deadline', ('persona',))
+
+
+@dataclass
+class DeadlinePolicy:
+    persona_timeout: float = 30.0
+    overall_timeout: float = 60.0
+    hedge_percentile: float = 95.0
+    hedge_min_samples: int = 20
+
+    @classmethod
+    def from_env(cls) -> "DeadlinePolicy":
+        return cls(
+            persona_timeout=float(os.getenv('ESTIMATION_PERSONA_TIMEOUT_S', cls.persona_timeout)),
+            overall_timeout=float(os.getenv('ESTIMATION_TIMEOUT_S', cls.overall_timeout)),
+            hedge_percentile=float(os.getenv('ESTIMATION_HEDGE_PERCENTILE', cls.hedge_percentile)),
+            hedge_min_samples=int(os.getenv('ESTIMATION_HEDGE_MIN_SAMPLES', cls.hedge_min_samples))
+        )
+
+
+class LatencyWindow:
+    """The most recent call latencies, for percentile-based hedging thresholds"""
+
+    def __init__(self, size: int = 500):
+        self._samples: Deque[float] = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, p: float, min_samples: int = 1) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < max(min_samples, 1):
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * p / 100))]
+
+
+_windows: Dict[str, LatencyWindow] = {}
+_windows_lock = threading.Lock()
+
+
+def get_latency_window(name: str) -> LatencyWindow:
+    """Process-wide latency window per fan-out kind (e.g. 'days', 'points')"""
+    with _windows_lock:
+        return _windows.setdefault(name, LatencyWindow())
+
+
+def timed_out_entry(member: Any) -> Dict[str, Any]:
+    """Placeholder for a persona that missed its deadline, in the per-persona response shape"""
+    return {'name': member.name, 'role': member.role, 'estimate': None, 'justification': None, 'status': TIMED_OUT}
+
+
+class _Attempt:
+    __slots__ = ('index', 'started')
+
+    def __init__(self, index: int):
+        self.index = index
+        self.started: Optional[float] = None
+
+
+def _run_attempt(attempt: _Attempt, call: Callable[[Any], Any], member: Any, latencies: LatencyWindow) -> Any:
+    attempt.started = time.monotonic()
+    result = call(member)
+    latencies.observe(time.monotonic() - attempt.started)
+    return result
+
+
+def fan_out(team: Sequence[Any], call: Callable[[Any], Any], executor: concurrent.futures.Executor,
+            latencies: LatencyWindow, policy: Optional[DeadlinePolicy] = None
+            ) -> Iterator[Tuple[Any, Optional[concurrent.futures.Future]]]:
+    """
+    Yield (member, future) as each member's first attempt completes, or
+    (member, None) when the member misses its deadline
+    """
+    policy = policy or DeadlinePolicy.from_env()
+    started = time.monotonic()
+    overall_deadline = started + policy.overall_timeout
+    hedge_after = (latencies.percentile(policy.hedge_percentile, policy.hedge_min_samples)
+                   if policy.hedge_percentile > 0 else None)
+
+    attempts: Dict[concurrent.futures.Future, _Attempt] = {}
+    pending: Dict[int, List[concurrent.futures.Future]] = {i: [] for i in range(len(team))}
+    hedged = set()
+
+    def submit(i: int) -> None:
+        # Each attempt runs in a copy of the request context so logs and spans keep its labels
+        attempt = _Attempt(i)
+        future = executor.submit(contextvars.copy_context().run, _run_attempt, attempt, call, team[i], latencies)
+        attempts[future] = attempt
+        pending[i].append(future)
+
+    def drop(i: int) -> None:
+        for future in pending.pop(i):
+            future.cancel()
+
+    for i in range(len(team)):
+        submit(i)
+
+    try:
+        while pending:
+            now = time.monotonic()
+            wake = overall_deadline
+            for i in list(pending):
+                first_start = min((attempts[f].started for f in pending[i] if attempts[f].started), default=None)
+                deadline = overall_deadline
+                if first_start is not None:
+                    deadline = min(deadline, first_start + policy.persona_timeout)
+                if now >= deadline:
+                    logger.warning("Estimate from %s timed out after %.1fs", team[i].name, now - started)
+                    TIMEOUTS_TOTAL.inc(persona=team[i].name)
+                    drop(i)
+                    yield team[i], None
+                    continue
+                wake = min(wake, deadline)
+                if hedge_after is not None and first_start is not None and i not in hedged:
+                    hedge_at = first_start + hedge_after
+                    if now >= hedge_at:
+                        logger.info("Hedging estimate from %s after %.1fs", team[i].name, now - first_start)
+                        HEDGES_TOTAL.inc(persona=team[i].name)
+                        hedged.add(i)
+                        submit(i)
+                    else:
+                        wake = min(wake, hedge_at)
+            if not pending:
+                break
+
+            live = [f for futures in pending.values() for f in futures]
+            # Wake regularly to notice queued attempts that have started running
+            timeout = min(max(wake - time.monotonic(), 0), 0.25)
+            done, _ = concurrent.futures.wait(live, timeout=timeout, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                i = attempts[future].index
+                if i not in pending:
+                    continue
+                if future.exception() is not None and len(pending[i]) > 1:
+                    # Let the other attempt finish rather than report this failure
+                    pending[i].remove(future)
+                    continue
+                pending[i].remove(future)
+                drop(i)
+                yield team[i], future
+    finally:
+        # Consumer stopped early (consensus, client disconnected): drop calls that haven't started
+        for i in list(pending):
+            drop(i)
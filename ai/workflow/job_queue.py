@@ -0,0 +1,267 @@
+"""
+Durable job queue for long-running workflow stages.
+
+Team estimation makes one LLM call per persona and can take longer than
+proxies keep a request open. The job endpoints enqueue the work and return a
+job id straight away. Workers (ai.workflow.job_worker) run it, and clients
+poll or long-poll the job for its result.
+
+The queue is a SQLite table (db/schemas/jobs.sql) and needs no broker. Every
+worker process on the host opens the same file, so adding workers is a matter
+of starting more of them. A claimed job is invisible to other workers until
+its lease expires (JOB_VISIBILITY_TIMEOUT_S). Workers extend the lease while
+the job runs, so a job whose worker died is picked up again once the lease
+lapses. A job that fails is retried with exponential backoff
+(JOB_RETRY_BACKOFF_S) until it has been attempted JOB_MAX_ATTEMPTS times,
+unless the failure is one a retry can't fix, such as an unknown story.
+
+Configuration:
+- JOB_QUEUE_PATH: SQLite file, default db/jobs.sqlite3
+- JOB_RETENTION_S: how long finished jobs are kept (default 7 days)
+"""
+import os
+import json
+import time
+import uuid
+import asyncio
+import sqlite3
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, Optional
+
+from ai.shared.logging_utils import get_logger
+from ai.shared.metrics import get_metrics_registry
+
+logger = get_logger(__name__)
+
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+SCHEMA_PATH = os.path.join(project_root, 'db', 'schemas', 'jobs.sql')
+
+QUEUED = 'queued'
+RUNNING = 'running'
+COMPLETE = 'complete'
+FAILED = 'failed'
+FINISHED_STATUSES = (COMPLETE, FAILED)
+
+VISIBILITY_TIMEOUT_S = float(os.getenv('JOB_VISIBILITY_TIMEOUT_S', 120))
+MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', 3))
+RETRY_BACKOFF_S = float(os.getenv('JOB_RETRY_BACKOFF_S', 5))
+RETRY_BACKOFF_MAX_S = 300.0
+RETENTION_S = float(os.getenv('JOB_RETENTION_S', 7 * 24 * 60 * 60))
+POLL_INTERVAL_S = 0.25
+
+_registry = get_metrics_registry()
+JOBS_TOTAL = _registry.counter('agilestories_jobs_total', 'Job attempts by outcome', ('kind', 'outcome'))
+JOB_SECONDS = _registry.histogram('agilestories_job_duration_seconds', 'Time from claiming a job to finishing it',
+                                  ('kind',))
+
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    payload: Dict[str, Any]
+    status: str
+    attempts: int
+    max_attempts: int
+    visible_at: float
+    worker: Optional[str]
+    result: Optional[Dict[str, Any]]
+    error: Optional[str]
+    created_at: float
+    updated_at: float
+    finished_at: Optional[float] = None
+
+    @classmethod
+    def from_row(cls, row: sqlite3.Row) -> "Job":
+        data = dict(row)
+        data['payload'] = json.loads(data['payload'])
+        data['result'] = json.loads(data['result']) if data['result'] is not None else None
+        return cls(**data)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+    def to_dict(self) -> Dict[str, Any]:
+        """The API response shape; the payload is left out"""
+        return {
+            'job_id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'attempts': self.attempts,
+            'max_attempts': self.max_attempts,
+            'result': self.result,
+            'error': self.error,
+            'created_at': self.created_at,
+            'finished_at': self.finished_at
+        }
+
+
+def retry_backoff(attempts: int) -> float:
+    return min(RETRY_BACKOFF_MAX_S, RETRY_BACKOFF_S * 2 ** max(attempts - 1, 0))
+
+
+class JobQueue:
+    """A job table shared by every worker process that opens the same file"""
+
+    def __init__(self, path: str, schema_path: str = SCHEMA_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        if path != ':memory:':
+            self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA busy_timeout=5000')
+        with open(schema_path, 'r') as f:
+            self._conn.executescript(f.read())
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        # IMMEDIATE takes the write lock up front, so two processes can't claim the same job
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._conn.execute('COMMIT')
+
+    def enqueue(self, kind: str, payload: Dict[str, Any], max_attempts: int = MAX_ATTEMPTS) -> Job:
+        now = time.time()
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute(
+                'INSERT INTO jobs (id, kind, payload, status, attempts, max_attempts, visible_at, created_at, '
+                'updated_at) VALUES (?, ?, ?, ?, 0, ?, ?, ?, ?)',
+                (job_id, kind, json.dumps(payload), QUEUED, max(1, max_attempts), now, now, now)
+            )
+        logger.info("Queued %s job %s", kind, job_id)
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            row = self._conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return Job.from_row(row) if row else None
+
+    def claim(self, worker: str, visibility_timeout: float = VISIBILITY_TIMEOUT_S) -> Optional[Job]:
+        """
+        Lease the oldest visible job to worker: a queued job whose backoff has
+        passed, or a running one whose lease expired. Jobs that have used up
+        their attempts are failed instead of claimed.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            while True:
+                row = conn.execute(
+                    'SELECT * FROM jobs WHERE status IN (?, ?) AND visible_at <= ? ORDER BY created_at LIMIT 1',
+                    (QUEUED, RUNNING, now)
+                ).fetchone()
+                if row is None:
+                    return None
+                if row['attempts'] >= row['max_attempts']:
+                    logger.warning("Job %s lost its worker on its last attempt", row['id'])
+                    conn.execute(
+                        'UPDATE jobs SET status = ?, error = ?, updated_at = ?, finished_at = ? WHERE id = ?',
+                        (FAILED, row['error'] or 'worker lease expired', now, now, row['id'])
+                    )
+                    JOBS_TOTAL.inc(kind=row['kind'], outcome='lost')
+                    continue
+                if row['status'] == RUNNING:
+                    logger.warning("Reclaiming job %s from %s after its lease expired", row['id'], row['worker'])
+                    JOBS_TOTAL.inc(kind=row['kind'], outcome='lost')
+                conn.execute(
+                    'UPDATE jobs SET status = ?, attempts = attempts + 1, worker = ?, visible_at = ?, updated_at = ? '
+                    'WHERE id = ?',
+                    (RUNNING, worker, now + visibility_timeout, now, row['id'])
+                )
+                return Job.from_row(conn.execute('SELECT * FROM jobs WHERE id = ?', (row['id'],)).fetchone())
+
+    def _update_leased(self, job: Job, worker: str, sql: str, params: tuple) -> bool:
+        """Apply an update only while worker still holds the job's lease"""
+        with self._lock:
+            cursor = self._conn.execute(f'{sql} WHERE id = ? AND worker = ? AND status = ?',
+                                        (*params, job.id, worker, RUNNING))
+            return cursor.rowcount == 1
+
+    def extend(self, job: Job, worker: str, visibility_timeout: float = VISIBILITY_TIMEOUT_S) -> bool:
+        """Heartbeat: push the lease out; False if the job was reclaimed meanwhile"""
+        now = time.time()
+        return self._update_leased(job, worker, 'UPDATE jobs SET visible_at = ?, updated_at = ?',
+                                   (now + visibility_timeout, now))
+
+    def complete(self, job: Job, worker: str, result: Dict[str, Any]) -> bool:
+        now = time.time()
+        done = self._update_leased(job, worker,
+                                   'UPDATE jobs SET status = ?, result = ?, error = NULL, updated_at = ?, finished_at = ?',
+                                   (COMPLETE, json.dumps(result), now, now))
+        JOBS_TOTAL.inc(kind=job.kind, outcome=COMPLETE if done else 'superseded')
+        return done
+
+    def fail(self, job: Job, worker: str, error: str, retry: bool = True) -> bool:
+        """Requeue the job after a backoff, or fail it for good once out of attempts or if not retry"""
+        now = time.time()
+        if retry and job.attempts < job.max_attempts:
+            delay = retry_backoff(job.attempts)
+            logger.warning("Job %s attempt %d/%d failed (%s), retrying in %.0fs",
+                           job.id, job.attempts, job.max_attempts, error, delay)
+            JOBS_TOTAL.inc(kind=job.kind, outcome='retried')
+            return self._update_leased(job, worker,
+                                       'UPDATE jobs SET status = ?, error = ?, worker = NULL, visible_at = ?, '
+                                       'updated_at = ?', (QUEUED, error, now + delay, now))
+        logger.error("Job %s failed after %d attempt(s): %s", job.id, job.attempts, error)
+        JOBS_TOTAL.inc(kind=job.kind, outcome=FAILED)
+        return self._update_leased(job, worker,
+                                   'UPDATE jobs SET status = ?, error = ?, updated_at = ?, finished_at = ?',
+                                   (FAILED, error, now, now))
+
+    def wait(self, job_id: str, timeout: float) -> Optional[Job]:
+        """Poll until the job finishes or timeout passes; returns its latest state"""
+        deadline = time.monotonic() + timeout
+        job = self.get(job_id)
+        while job is not None and not job.finished and time.monotonic() < deadline:
+            time.sleep(min(POLL_INTERVAL_S, max(deadline - time.monotonic(), 0)))
+            job = self.get(job_id)
+        return job
+
+    async def await_job(self, job_id: str, timeout: float) -> Optional[Job]:
+        """Awaitable wait(), for long-poll endpoints"""
+        deadline = time.monotonic() + timeout
+        job = self.get(job_id)
+        while job is not None and not job.finished and time.monotonic() < deadline:
+            await asyncio.sleep(min(POLL_INTERVAL_S, max(deadline - time.monotonic(), 0)))
+            job = self.get(job_id)
+        return job
+
+    def purge_finished(self, older_than: float = RETENTION_S) -> int:
+        """Delete finished jobs older than older_than seconds and return how many were removed"""
+        with self._lock:
+            cursor = self._conn.execute('DELETE FROM jobs WHERE finished_at < ?', (time.time() - older_than,))
+            return cursor.rowcount
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute('SELECT status, COUNT(*) AS n FROM jobs GROUP BY status').fetchall()
+        return {row['status']: row['n'] for row in rows}
+
+
+_queue: Optional[JobQueue] = None
+_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = JobQueue(os.getenv('JOB_QUEUE_PATH', os.path.join(project_root, 'db', 'jobs.sqlite3')))
+    return _queue
+
+
+def set_job_queue(queue: JobQueue) -> None:
+    """Replace the process-wide queue (tests, benchmarks)"""
+    global _queue
+    with _queue_lock:
+        _queue = queue
@@ -0,0 +1,187 @@
+"""
+Worker pool for the job queue (ai.workflow.job_queue).
+
+Each API worker runs JOB_WORKERS threads that claim and run jobs (default 2;
+0 leaves the work to dedicated processes). To add capacity without more API
+workers, run standalone worker processes against the same queue file:
+
+    python -m ai.workflow.job_worker --workers 4
+
+While a job runs, its lease is extended every third of the visibility
+timeout. If the process dies, another worker picks the job up once the lease
+lapses.
+"""
+import os
+import sys
+import time
+import socket
+import signal
+import argparse
+import threading
+from typing import Any, Callable, Dict, Optional
+
+from ai.shared.logging_utils import get_logger, request_context
+from ai.shared.story_analyzer import AnalysisStatus
+from ai.workflow.job_queue import JOB_SECONDS, VISIBILITY_TIMEOUT_S, Job, JobQueue, get_job_queue
+from ai.workflow.story_handler_days import handle_story_workflow_days
+
+logger = get_logger(__name__)
+
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', 2))
+IDLE_POLL_S = 0.5
+PURGE_INTERVAL_S = 60 * 60
+
+STORY_WORKFLOW_DAYS = 'story_workflow_days'
+
+
+class JobFailed(Exception):
+    """
+    A job handler finished but produced an error result. retry=False fails the
+    job straight away, for errors another attempt can't fix (a bad request)
+    """
+
+    def __init__(self, message: str, retry: bool = True):
+        super().__init__(message)
+        self.retry = retry
+
+
+def run_story_workflow_days(payload: Dict[str, Any], resources) -> Dict[str, Any]:
+    """
+    One handle_story_workflow_days stage. Payload: story, step, action and
+    optionally mode, consensus, and story_id/version to store estimates under
+    """
+    result = handle_story_workflow_days(
+        story=payload['story'],
+        step=payload['step'],
+        action=payload.get('action', 'approve'),
+        resources=resources,
+        mode=payload.get('mode'),
+        consensus=payload.get('consensus')
+    )
+    if hasattr(result, 'to_dict'):
+        result = result.to_dict()
+    if 'error' in result or result.get('status') in ('error', AnalysisStatus.ERROR.value):
+        status_code = result.get('status_code') or 500
+        raise JobFailed(result.get('error') or result.get('message') or result.get('analysis') or 'stage failed',
+                        retry=not 400 <= status_code < 500)
+    store = resources.story_store
+    try:
+        if payload['step'] == 'start' and store is not None:
+            store.record_analysis(result, payload.get('story_id'))
+        if 'team_estimates' in result:
+            if result['total_estimates'] == 0:
+                raise JobFailed("No team member returned an estimate")
+            if store is not None and payload.get('story_id'):
+                result['story_id'] = payload['story_id']
+                result['estimate_run_id'] = store.record_estimates(result, payload['story_id'], payload['version'])
+    except KeyError as e:
+        # The story (or version) doesn't exist; retrying won't create it
+        raise JobFailed(str(e.args[0]), retry=False)
+    return result
+
+
+JOB_HANDLERS: Dict[str, Callable[[Dict[str, Any], Any], Dict[str, Any]]] = {
+    STORY_WORKFLOW_DAYS: run_story_workflow_days
+}
+
+
+class JobWorkerPool:
+    """Threads claiming jobs from queue and running them with resources (a WorkflowResources)"""
+
+    def __init__(self, queue: JobQueue, resources, workers: int = JOB_WORKERS,
+                 visibility_timeout: float = VISIBILITY_TIMEOUT_S):
+        self.queue = queue
+        self.resources = resources
+        self.workers = workers
+        self.visibility_timeout = visibility_timeout
+        self.name = f"{socket.gethostname()}:{os.getpid()}"
+        self._active: Dict[str, Job] = {}
+        self._active_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self) -> None:
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, args=(f"{self.name}:{i}",), name=f'job-worker-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        if self.workers:
+            heartbeat = threading.Thread(target=self._heartbeat, name='job-heartbeat', daemon=True)
+            heartbeat.start()
+            self._threads.append(heartbeat)
+            logger.info("Started %d job workers", self.workers)
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop claiming jobs; jobs in progress finish unless timeout passes first"""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _heartbeat(self) -> None:
+        while not self._stop.wait(self.visibility_timeout / 3):
+            with self._active_lock:
+                active = list(self._active.items())
+            for worker, job in active:
+                if not self.queue.extend(job, worker, self.visibility_timeout):
+                    logger.warning("Lost the lease on job %s", job.id)
+
+    def _run(self, worker: str) -> None:
+        last_purge = time.monotonic()
+        while not self._stop.is_set():
+            try:
+                job = self.queue.claim(worker, self.visibility_timeout)
+            except Exception as e:
+                logger.exception("Could not claim a job: %s", e)
+                job = None
+            if job is None:
+                if time.monotonic() - last_purge > PURGE_INTERVAL_S:
+                    self.queue.purge_finished()
+                    last_purge = time.monotonic()
+                self._stop.wait(IDLE_POLL_S)
+                continue
+            self.process(job, worker)
+
+    def process(self, job: Job, worker: str) -> None:
+        handler = JOB_HANDLERS.get(job.kind)
+        with self._active_lock:
+            self._active[worker] = job
+        started = time.monotonic()
+        # Log under the id of the request that queued the job
+        with request_context(job.payload.get('request_id') or job.id[:16]):
+            try:
+                if handler is None:
+                    raise JobFailed(f"Unknown job kind {job.kind}")
+                logger.info("Running %s job %s (attempt %d)", job.kind, job.id, job.attempts)
+                result = handler(job.payload, self.resources)
+                self.queue.complete(job, worker, result)
+            except Exception as e:
+                if not isinstance(e, JobFailed):
+                    logger.exception("Job %s raised: %s", job.id, e)
+                self.queue.fail(job, worker, str(e), retry=getattr(e, 'retry', True))
+            finally:
+                with self._active_lock:
+                    self._active.pop(worker, None)
+                JOB_SECONDS.observe(time.monotonic() - started, kind=job.kind)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Run job workers against the shared job queue")
+    parser.add_argument('--workers', type=int, default=max(JOB_WORKERS, 1), help="worker threads in this process")
+    args = parser.parse_args(argv)
+
+    from ai.workflow.resources import WorkflowResources
+    resources = WorkflowResources.create()
+    pool = JobWorkerPool(get_job_queue(), resources, workers=args.workers)
+    stopped = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stopped.set())
+    pool.start()
+    stopped.wait()
+    logger.info("Stopping job workers")
+    pool.stop()
+    resources.estimation_executor.shutdown(wait=False, cancel_futures=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,124 @@
+"""
+Single-call ("panel") team estimation.
+
+Instead of one request per persona, all personas are described in one prompt
+that carries the story, acceptance criteria and context once, and the model
+answers through a function call with one estimate per persona. Each persona's
+framing comes from its own get_prompt(), so the panel stays in step with the
+per-persona prompts. Results have the same {name, role, estimate,
+justification} shape as the per-persona fan-out.
+
+ESTIMATION_MODE (per_persona or panel) picks the default mode.
+"""
+import os
+import re
+from typing import Any, Dict, List, Optional, Type
+
+from ai.shared.llm_client import create_chat_completion
+from ai.shared.logging_utils import get_logger
+from ai.shared.metrics import traced
+from ai.shared.prompt_budget import compact_context
+from ai.shared.prompt_layout import split_persona_prompt
+from ai.shared.scheduler import ESTIMATION, priority
+from ai.shared.story_schema import EstimateOutput, panel_function, parse_panel_function_call
+
+logger = get_logger(__name__)
+
+PER_PERSONA = 'per_persona'
+PANEL = 'panel'
+ESTIMATION_MODES = (PER_PERSONA, PANEL)
+
+# Output tokens allowed per persona in the combined answer
+PANEL_TOKENS_PER_PERSONA = 300
+
+PANEL_PROMPT = """You are facilitating an estimation session for an Agile team.
+Each team member below estimates the same user story independently, from their own role, focus and experience.
+
+Story:
+{story}
+
+Acceptance Criteria:
+{acceptance_criteria}
+
+Context:
+{context}
+
+Team members:
+{personas}
+
+Give one estimate per team member in {unit}, reflecting that member's perspective and experience level.
+Use each member's name exactly as written above."""
+
+UNITS = {
+    'person_days': 'person-days',
+    'story_points': 'story points (Fibonacci: 1, 2, 3, 5, 8, 13, 21)',
+}
+
+_BULLET_RE = re.compile(r'^\s*-\s+(.+?)\s*$', re.MULTILINE)
+
+
+def resolve_estimation_mode(mode: Optional[str] = None) -> str:
+    mode = (mode or os.getenv('ESTIMATION_MODE', PER_PERSONA)).lower()
+    if mode not in ESTIMATION_MODES:
+        raise ValueError(f"Unknown estimation mode '{mode}', expected one of {ESTIMATION_MODES}")
+    return mode
+
+
+def persona_focus(member: Any) -> List[str]:
+    """The focus bullets of a persona's own prompt"""
+    return _BULLET_RE.findall(split_persona_prompt(member).instructions)
+
+
+def build_panel_request(team: List[Any], story_data: Dict[str, Any],
+                        output_cls: Type[EstimateOutput]) -> Dict[str, Any]:
+    unit_field = next(name for name in UNITS if name in output_cls.FUNCTION['parameters']['properties'])
+    personas = "\n\n".join(
+        f"### {member.name} ({member.role}, {member.experience_years} years)\nFocus on:\n"
+        + "\n".join(f"- {focus}" for focus in persona_focus(member))
+        for member in team
+    )
+    function = panel_function(output_cls)
+    return {
+        'model': "gpt-4",
+        'messages': [
+            {"role": "system", "content": "You are an experienced Agile estimation facilitator."},
+            {"role": "user", "content": PANEL_PROMPT.format(
+                story=story_data['text'],
+                acceptance_criteria="\n".join(f"- {ac}" for ac in story_data['acceptance_criteria']),
+                context=compact_context(story_data.get('context', '')),
+                personas=personas,
+                unit=UNITS[unit_field]
+            )}
+        ],
+        'temperature': 0.7,
+        'max_tokens': PANEL_TOKENS_PER_PERSONA * len(team),
+        'functions': [function],
+        'function_call': {'name': function['name']}
+    }
+
+
+@traced('estimate_panel', persona='panel', is_error=lambda responses: not responses)
+def panel_estimates(team: List[Any], story_data: Dict[str, Any],
+                    output_cls: Type[EstimateOutput]) -> List[Dict[str, Any]]:
+    """Estimates for the whole team from one completion, in per-persona response shape"""
+    try:
+        with priority(ESTIMATION):
+            response = create_chat_completion(**build_panel_request(team, story_data, output_cls))
+    except Exception as e:
+        logger.exception("Error in panel estimation: %s", e)
+        return []
+
+    estimates = parse_panel_function_call(response, output_cls)
+    results = []
+    for member in team:
+        structured = estimates.get(member.name)
+        if structured is None:
+            logger.warning("No panel estimate for %s", member.name)
+            continue
+        results.append({
+            'name': member.name,
+            'role': member.role,
+            'estimate': structured.estimate,
+            'justification': structured.to_text()
+        })
+    return results
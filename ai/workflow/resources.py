@@ -0,0 +1,131 @@
+import os
+import json
+import concurrent.futures
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+import openai
+from dotenv import load_dotenv
+
+from ai.shared.story_analyzer import StoryAnalyzer
+from ai.shared.logging_utils import get_logger
+from ai.shared.llm_client import get_aiosession, close_aiosession
+from ai.shared.llm_backend import get_llm_backend
+from ai.shared.http_pool import OpenAIConnectionPool, configure_http_pool
+from ai.shared.story_store import StoryStore, get_story_store
+from ai.agents.team.base_estimator import BaseTeamMember
+from ai.workflow.story_handler_days import build_day_team
+from ai.workflow.batch_analysis import BatchJobRegistry
+from ai.workflow.sessions import SessionManager
+from ai.workflow.job_queue import JobQueue, get_job_queue
+from ai.workflow.job_worker import JOB_WORKERS, JobWorkerPool
+
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+logger = get_logger(__name__)
+
+
+@dataclass
+class Credentials:
+    api_key: Optional[str] = None
+    organization: Optional[str] = None
+
+    @classmethod
+    def load(cls, root: str = project_root) -> "Credentials":
+        """Load OpenAI credentials from env.json, falling back to .env"""
+        env_json_path = os.path.join(root, 'env.json')
+        try:
+            with open(env_json_path, 'r') as f:
+                env_vars = json.load(f)
+                logger.info("Loaded credentials from env.json")
+                return cls(
+                    api_key=env_vars['SeniorDevFunction']['OPENAI_API_KEY'],
+                    organization=env_vars['SeniorDevFunction'].get('OPENAI_ORG_ID')
+                )
+        except Exception as e:
+            logger.info("Could not load from env.json: %s", e)
+
+        load_dotenv(os.path.join(root, '.env'))
+        return cls(api_key=os.getenv('OPENAI_API_KEY'), organization=os.getenv('OPENAI_ORG_ID'))
+
+    def apply(self) -> None:
+        """Configure the openai module with these credentials"""
+        openai.api_key = self.api_key
+        openai.organization = self.organization
+
+
+@dataclass
+class WorkflowResources:
+    """Long-lived objects shared by every request in one worker process"""
+    credentials: Credentials
+    analyzer: StoryAnalyzer
+    day_team: List[BaseTeamMember]
+    estimation_executor: concurrent.futures.ThreadPoolExecutor
+    http_pool: OpenAIConnectionPool
+    batch_jobs: BatchJobRegistry = field(default_factory=BatchJobRegistry)
+    story_store: Optional[StoryStore] = field(default_factory=get_story_store)
+    sessions: Optional[SessionManager] = None
+    job_queue: JobQueue = field(default_factory=get_job_queue)
+    job_workers: Optional[JobWorkerPool] = None
+    aiosession: Optional[object] = field(default=None, repr=False)
+
+    @classmethod
+    def create(cls, credentials: Optional[Credentials] = None) -> "WorkflowResources":
+        # StoryAnalyzer configures openai from the environment, so apply credentials after it
+        analyzer = StoryAnalyzer()
+        credentials = credentials or Credentials.load()
+        credentials.apply()
+        day_team = build_day_team()
+        workers = int(os.getenv('ESTIMATION_WORKERS', len(day_team) * 4))
+        resources = cls(
+            credentials=credentials,
+            analyzer=analyzer,
+            day_team=day_team,
+            estimation_executor=concurrent.futures.ThreadPoolExecutor(
+                max_workers=workers,
+                thread_name_prefix='estimator'
+            ),
+            # One keep-alive connection per estimator thread
+            http_pool=configure_http_pool(maxsize=workers)
+        )
+        if resources.story_store is not None:
+            resources.sessions = SessionManager(analyzer, resources.story_store)
+        return resources
+
+    async def start(self) -> None:
+        """Open resources bound to the running event loop"""
+        self.aiosession = get_aiosession()
+        if JOB_WORKERS > 0:
+            self.job_workers = JobWorkerPool(self.job_queue, self, workers=JOB_WORKERS)
+            self.job_workers.start()
+
+    async def aclose(self) -> None:
+        self.batch_jobs.cancel_all()
+        if self.job_workers is not None:
+            # Jobs still running are picked up by another worker once their lease lapses
+            self.job_workers.stop(timeout=0)
+        if self.sessions is not None:
+            self.sessions.cancel_all()
+        await close_aiosession()
+        self.estimation_executor.shutdown(wait=False, cancel_futures=True)
+
+
+def create_lifespan(require_credentials: bool = False):
+    """
+    Build a FastAPI lifespan that creates WorkflowResources once per worker
+    and exposes them as app.state.resources
+    """
+    @asynccontextmanager
+    async def lifespan(app):
+        resources = WorkflowResources.create()
+        if require_credentials and not resources.credentials.api_key and get_llm_backend().requires_credentials:
+            raise RuntimeError("Failed to load OpenAI credentials")
+        await resources.start()
+        app.state.resources = resources
+        try:
+            yield
+        finally:
+            await resources.aclose()
+
+    return lifespan
@@ -0,0 +1,246 @@
+"""
+Server-side workflow sessions.
+
+A session follows one story through the review workflow, so the client only
+sends the session id and an approve/reject decision. It never has to send the
+previous analysis back:
+
+    pending --story--> agile_review --> user_review_agile
+    user_review_agile --approve--> technical_review --> user_review_final
+    user_review_final --approve--> complete
+
+Rejecting with an edited story re-runs that stage on the edit, as a new
+story version. Rejecting without one returns the session to pending until a
+story is sent. agile_review and technical_review mean an LLM call is in
+progress. Sessions are kept in the story store (ai.shared.story_store), so
+every worker sees the same state.
+
+With WORKFLOW_PRECOMPUTE=on (off by default), the Senior Dev review of the
+suggested story is started in the background at batch priority while the
+user reviews the Agile Coach's suggestions. An approval picks up the result
+if it has finished. Otherwise the background call is cancelled and the
+review runs at the approval's own priority, so it doesn't queue behind batch
+work. Each precomputed review is a paid GPT-4 call, made even for
+suggestions that end up rejected.
+"""
+import os
+import time
+import uuid
+import asyncio
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+from ai.shared.logging_utils import get_logger
+from ai.shared.scheduler import BATCH, priority
+from ai.shared.story_analyzer import AnalysisResult, AnalysisStatus, Story, StoryAnalyzer
+from ai.shared.story_store import StoryStore, TECHNICAL_REVIEW
+
+logger = get_logger(__name__)
+
+PRECOMPUTE = os.getenv('WORKFLOW_PRECOMPUTE', 'off').lower() in ('1', 'true', 'on', 'yes')
+# A stage still running after this long is assumed lost (e.g. its worker restarted) and may be retried
+STAGE_TIMEOUT_S = float(os.getenv('WORKFLOW_STAGE_TIMEOUT_S', 300))
+MAX_PRECOMPUTED = 256
+
+RUNNING_STATUSES = (AnalysisStatus.AGILE_REVIEW, AnalysisStatus.TECHNICAL_REVIEW)
+
+
+class SessionConflict(Exception):
+    """The session is not in a state that accepts this decision"""
+
+
+@dataclass
+class WorkflowSession:
+    id: str
+    story_id: str
+    status: AnalysisStatus
+    version: int
+    analysis_id: Optional[str] = None
+    error: Optional[str] = None
+    created_at: str = ''
+    updated_at: str = ''
+
+    @classmethod
+    def from_row(cls, row: Dict[str, Any]) -> "WorkflowSession":
+        return cls(**{**row, 'status': AnalysisStatus(row['status'])})
+
+    @property
+    def stale(self) -> bool:
+        updated = datetime.fromisoformat(self.updated_at).timestamp()
+        return self.status in RUNNING_STATUSES and time.time() - updated > STAGE_TIMEOUT_S
+
+
+class SessionManager:
+    """Runs workflow stages for sessions kept in a StoryStore"""
+
+    def __init__(self, analyzer: StoryAnalyzer, store: StoryStore, precompute: bool = PRECOMPUTE):
+        self.analyzer = analyzer
+        self.store = store
+        self.precompute = precompute
+        # session id -> (story under review, background technical review)
+        self._precomputed: "OrderedDict[str, Tuple[Story, asyncio.Task]]" = OrderedDict()
+
+    def get(self, session_id: str) -> WorkflowSession:
+        row = self.store.get_session(session_id)
+        if row is None:
+            raise KeyError(f"Session {session_id} not found")
+        return WorkflowSession.from_row(row)
+
+    def view(self, session: WorkflowSession) -> Dict[str, Any]:
+        """The session and the analysis waiting for a decision, in the API response shape"""
+        return {
+            'session_id': session.id,
+            'story_id': session.story_id,
+            'status': session.status.value,
+            'version': session.version,
+            'error': session.error,
+            'analysis': self.store.load_analysis(session.analysis_id) if session.analysis_id else None,
+            'updated_at': session.updated_at
+        }
+
+    def _move(self, session: WorkflowSession, status: AnalysisStatus, **fields: Any) -> WorkflowSession:
+        """Advance the session from its current status, or raise if another request got there first"""
+        if not self.store.update_session(session.id, session.status.value, status=status.value, **fields):
+            raise SessionConflict(f"Session {session.id} changed while processing this decision")
+        return self.get(session.id)
+
+    async def start(self, story: Story) -> Dict[str, Any]:
+        """Store the story, open a session for it and run the Agile Coach review"""
+        story_id, version = self.store.save_story(story)
+        now = datetime.now().isoformat()
+        session_id = uuid.uuid4().hex
+        self.store.insert_session({
+            'id': session_id,
+            'story_id': story_id,
+            'status': AnalysisStatus.AGILE_REVIEW.value,
+            'version': version,
+            'analysis_id': None,
+            'error': None,
+            'created_at': now,
+            'updated_at': now
+        })
+        return self.view(await self._agile_review(self.get(session_id), story))
+
+    async def decide(self, session_id: str, approved: bool, story: Optional[Story] = None) -> Dict[str, Any]:
+        """
+        Apply the user's decision on the result awaiting review. story is an
+        edited story to re-run the current stage on (rejections and pending only)
+        """
+        session = self.get(session_id)
+        status = session.status
+        if status in RUNNING_STATUSES and session.stale:
+            logger.warning("Session %s stuck in %s, retrying", session.id, status.value)
+            session = self._move(session, AnalysisStatus.ERROR, error='stage timed out')
+            status = session.status
+
+        if status in RUNNING_STATUSES:
+            raise SessionConflict(f"Session {session_id} is still in {status.value}")
+        if status == AnalysisStatus.COMPLETE:
+            raise SessionConflict(f"Session {session_id} is already complete")
+
+        if status in (AnalysisStatus.PENDING, AnalysisStatus.ERROR):
+            if story is None and status == AnalysisStatus.PENDING:
+                raise ValueError("A story is required to resume a pending session")
+            return self.view(await self._resubmit(session, story, AnalysisStatus.AGILE_REVIEW))
+
+        if status == AnalysisStatus.USER_REVIEW_AGILE:
+            if approved:
+                review_story = self._suggested_story(session)
+                session = self._move(session, AnalysisStatus.TECHNICAL_REVIEW, error=None)
+                return self.view(await self._technical_review(session, review_story, AnalysisStatus.USER_REVIEW_AGILE))
+            self._drop_precomputed(session.id)
+            if story is None:
+                return self.view(self._move(session, AnalysisStatus.PENDING))
+            return self.view(await self._resubmit(session, story, AnalysisStatus.AGILE_REVIEW))
+
+        # USER_REVIEW_FINAL
+        if approved:
+            final = self._suggested_story(session)
+            session = self._move(session, AnalysisStatus.COMPLETE, version=final.version)
+            self.store.set_status(session.story_id, AnalysisStatus.COMPLETE.value)
+            return self.view(session)
+        if story is None:
+            return self.view(self._move(session, AnalysisStatus.PENDING))
+        return self.view(await self._resubmit(session, story, AnalysisStatus.TECHNICAL_REVIEW))
+
+    def _suggested_story(self, session: WorkflowSession) -> Story:
+        """The reviewed result's rewrite of the story, or the reviewed version if it had none"""
+        analysis = self.store.get_analysis(session.analysis_id)
+        version = analysis['improved_version'] or analysis['version']
+        return self.store.get_story(session.story_id, version)
+
+    async def _resubmit(self, session: WorkflowSession, story: Optional[Story],
+                        stage: AnalysisStatus) -> WorkflowSession:
+        """Re-run a stage on an edited story (stored as a new version), or on the current version"""
+        if story is None:
+            story = self.store.get_story(session.story_id, session.version)
+        else:
+            _, story.version = self.store.save_story(story, session.story_id)
+        previous = session.status
+        session = self._move(session, stage, version=story.version, error=None)
+        if stage == AnalysisStatus.AGILE_REVIEW:
+            return await self._agile_review(session, story)
+        return await self._technical_review(session, story, previous)
+
+    async def _agile_review(self, session: WorkflowSession, story: Story) -> WorkflowSession:
+        result = await self.analyzer.start_analysis_async(story)
+        if result.status == AnalysisStatus.ERROR:
+            return self._move(session, AnalysisStatus.ERROR, error=result.analysis)
+        self.store.record_analysis(result, session.story_id)
+        session = self._move(session, AnalysisStatus.USER_REVIEW_AGILE,
+                             version=result.original_story.version, analysis_id=result.analysis_id)
+        self._start_precompute(session.id, result.improved_story or result.original_story)
+        return session
+
+    async def _technical_review(self, session: WorkflowSession, story: Story,
+                                previous: AnalysisStatus) -> WorkflowSession:
+        result = await self._precomputed_review(session.id, story)
+        if result is None:
+            result = await self.analyzer.technical_review_async(story)
+        if result.status == AnalysisStatus.ERROR:
+            # Back to the previous review so the same decision can be retried
+            return self._move(session, previous, error=result.analysis)
+        self.store.record_analysis(result, session.story_id, stage=TECHNICAL_REVIEW)
+        return self._move(session, AnalysisStatus.USER_REVIEW_FINAL,
+                          version=result.original_story.version, analysis_id=result.analysis_id)
+
+    def _start_precompute(self, session_id: str, story: Story) -> None:
+        if not self.precompute:
+            return
+        self._drop_precomputed(session_id)
+        # Speculative work: run it below estimation so it never delays a user-facing call
+        with priority(BATCH):
+            task = asyncio.get_running_loop().create_task(self.analyzer.technical_review_async(story))
+        self._precomputed[session_id] = (story, task)
+        while len(self._precomputed) > MAX_PRECOMPUTED:
+            _, (_, oldest) = self._precomputed.popitem(last=False)
+            oldest.cancel()
+
+    async def _precomputed_review(self, session_id: str, story: Story) -> Optional[AnalysisResult]:
+        """The background review for this session, if it was of the same story, has finished and didn't fail"""
+        entry = self._precomputed.pop(session_id, None)
+        if entry is None:
+            return None
+        reviewed, task = entry
+        if reviewed.to_dict() != story.to_dict() or not task.done():
+            # Awaiting an unfinished review would leave the user's approval waiting at batch priority
+            task.cancel()
+            return None
+        try:
+            result = await task
+        except asyncio.CancelledError:
+            return None
+        logger.info("Using precomputed technical review for session %s", session_id)
+        return result if result.status != AnalysisStatus.ERROR else None
+
+    def _drop_precomputed(self, session_id: str) -> None:
+        entry = self._precomputed.pop(session_id, None)
+        if entry is not None:
+            entry[1].cancel()
+
+    def cancel_all(self) -> None:
+        for _, task in self._precomputed.values():
+            task.cancel()
+        self._precomputed.clear()
@@ -3,13 +3,24 @@ import sys
 import json
 import openai
 import concurrent.futures
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional, Iterator
 
 # Add the project root to Python path
 project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 sys.path.append(project_root)
 
-from ai.shared.story_analyzer import StoryAnalyzer
+from ai.shared.story_analyzer import StoryAnalyzer, Story
+from ai.shared.response_parser import parse_response
+from ai.shared.logging_utils import get_logger
+from ai.shared.metrics import traced
+from ai.shared.usage import tracks_usage
+from ai.shared.story_schema import DayEstimateOutput
+from ai.workflow.panel_estimation import PANEL, panel_estimates, resolve_estimation_mode
+from ai.workflow.consensus import ConsensusWatch, collect_estimates, consensus_enabled
+from ai.workflow.deadlines import TIMED_OUT, fan_out, get_latency_window, timed_out_entry
+from ai.shared.scheduler import ESTIMATION, priority
+from ai.shared.llm_backend import get_llm_backend
+from ai.agents.team.base_estimator import BaseTeamMember
 from ai.agents.team.senior_dev_lead import SeniorDevLead
 from ai.agents.team.senior_dev import SeniorDev
 from ai.agents.team.mid_dev import MidDev
@@ -19,22 +30,11 @@ from ai.agents.team.senior_qa import SeniorQA
 from ai.agents.team.junior_qa import JuniorQA
 from ai.agents.team.ux_designer import UXDesigner
 
-def get_team_day_estimates(story_data: Dict[str, Any]) -> Dict[str, Any]:
-    """Get person-day estimates from all team members and calculate average"""
-    print("Starting team estimation...")  # Debug
-    
-    # Set up OpenAI credentials from project root
-    project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-    env_json_path = os.path.join(project_root, 'env.json')
-    print(f"Looking for env.json at: {env_json_path}")  # Debug
-    
-    with open(env_json_path, 'r') as f:
-        env_vars = json.load(f)
-        openai.api_key = env_vars['SeniorDevFunction']['OPENAI_API_KEY']
-        openai.organization = env_vars['SeniorDevFunction']['OPENAI_ORG_ID']
-    
-    # Create team members
-    team = [
+logger = get_logger(__name__)
+
+def build_day_team() -> List[BaseTeamMember]:
+    """Create one of each person-day estimator"""
+    return [
         SeniorDevLead(),
         SeniorDev(),
         MidDev(),
@@ -44,6 +44,64 @@ def get_team_day_estimates(story_data: Dict[str, Any]) -> Dict[str, Any]:
         JuniorQA(),
         UXDesigner()
     ]
+
+@traced('load_credentials')
+def load_openai_credentials() -> None:
+    """Set up OpenAI credentials from env.json in the project root"""
+    env_json_path = os.path.join(project_root, 'env.json')
+    logger.debug("Looking for env.json at: %s", env_json_path)
+    
+    with open(env_json_path, 'r') as f:
+        env_vars = json.load(f)
+        openai.api_key = env_vars['SeniorDevFunction']['OPENAI_API_KEY']
+        openai.organization = env_vars['SeniorDevFunction']['OPENAI_ORG_ID']
+
+@traced('get_team_day_estimates', is_error=lambda summary: summary['total_estimates'] == 0)
+@tracks_usage
+def get_team_day_estimates(story_data: Dict[str, Any],
+                           team: Optional[List[BaseTeamMember]] = None,
+                           executor: Optional[concurrent.futures.Executor] = None,
+                           mode: Optional[str] = None,
+                           consensus: Optional[bool] = None) -> Dict[str, Any]:
+    """
+    Get person-day estimates from all team members and calculate average.
+    Pass a prebuilt team and executor (see ai.workflow.resources) to skip
+    per-call credential loading and thread pool setup. mode 'panel' asks for
+    all personas in one call (see ai.workflow.panel_estimation). consensus
+    stops once a quorum agrees (see ai.workflow.consensus).
+    """
+    logger.info("Starting team estimation")
+    
+    team = team or default_day_team()
+    watch = None
+    if consensus_enabled(consensus) and resolve_estimation_mode(mode) != PANEL:
+        watch = ConsensusWatch(team)
+    responses = collect_estimates(iter_team_day_estimates(story_data, team, executor, mode), watch)
+    summary = summarize_day_estimates(responses)
+    if watch is not None:
+        summary['consensus'] = watch.result()
+    return summary
+
+def default_day_team() -> List[BaseTeamMember]:
+    """A fresh team, loading credentials from env.json when the backend needs them"""
+    if get_llm_backend().requires_credentials:
+        load_openai_credentials()
+    return build_day_team()
+
+def iter_team_day_estimates(story_data: Dict[str, Any],
+                            team: Optional[List[BaseTeamMember]] = None,
+                            executor: Optional[concurrent.futures.Executor] = None,
+                            mode: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Yield each team member's {name, role, estimate, justification} as soon as
+    their call completes, instead of waiting for the slowest estimator
+    """
+    if team is None:
+        team = default_day_team()
+    
+    if resolve_estimation_mode(mode) == PANEL:
+        yield from panel_estimates(team, story_data, DayEstimateOutput)
+        return
     
     # Format event for estimation
     test_event = {
@@ -55,66 +113,89 @@ def get_team_day_estimates(story_data: Dict[str, Any]) -> Dict[str, Any]:
     }
     
     # Get estimates in parallel
-    with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
-        # Start all estimation tasks
-        future_to_member = {
-            executor.submit(member.estimate_effort, test_event): member 
-            for member in team
-        }
-        
+    if executor is None:
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=len(team))
+        try:
+            yield from _iter_estimates(team, test_event, executor)
+        finally:
+            # Don't wait for calls the consumer stopped waiting for (early stop, disconnect)
+            executor.shutdown(wait=False, cancel_futures=True)
+    else:
+        yield from _iter_estimates(team, test_event, executor)
+
+def summarize_day_estimates(responses: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Aggregate individual estimates into the team response shape"""
+    estimates = [r['estimate'] for r in responses if r['estimate'] is not None]
+    average = sum(estimates) / len(estimates) if estimates else 0
+    
+    return {
+        'team_estimates': responses,
+        'average': round(average, 1),
+        'total_estimates': len(estimates),
+        'timed_out': [r['name'] for r in responses if r.get('status') == TIMED_OUT]
+    }
+
+def _estimate(member: BaseTeamMember, event: Dict[str, Any]) -> Dict[str, Any]:
+    """One persona's estimate, dispatched at estimation priority"""
+    with priority(ESTIMATION):
+        return member.estimate_effort(event)
+
+def _iter_estimates(team: List[BaseTeamMember], event: Dict[str, Any],
+                    executor: concurrent.futures.Executor) -> Iterator[Dict[str, Any]]:
+    """
+    Fan the estimation event out to the team and yield responses as they complete.
+    Personas that miss their deadline are yielded as timed out (see ai.workflow.deadlines)
+    """
+    estimates = fan_out(team, lambda member: _estimate(member, event), executor, get_latency_window('days'))
+    try:
         # Process responses as they complete
-        responses = []
-        for future in concurrent.futures.as_completed(future_to_member):
-            member = future_to_member[future]
+        for member, future in estimates:
+            if future is None:
+                yield timed_out_entry(member)
+                continue
             try:
                 response = future.result()
                 if response['statusCode'] == 200:
                     body = json.loads(response['body'])
-                    responses.append({
+                    yield {
                         'name': member.name,
                         'role': member.role,
-                        'estimate': extract_day_estimate(body['analysis']),
+                        'estimate': body['structured']['person_days'] if body.get('structured') else extract_day_estimate(body['analysis']),
                         'justification': body['analysis']
-                    })
+                    }
+                else:
+                    logger.warning("No estimate from %s (status %s)", member.name, response['statusCode'])
             except Exception as e:
-                print(f"\nError getting estimate from {member.name}: {e}")
-    
-    # Calculate average
-    estimates = [r['estimate'] for r in responses if r['estimate'] is not None]
-    average = sum(estimates) / len(estimates) if estimates else 0
-    
-    return {
-        'team_estimates': responses,
-        'average': round(average, 1),
-        'total_estimates': len(estimates)
-    }
+                logger.error("Error getting estimate from %s: %s", member.name, e)
+    finally:
+        estimates.close()
 
 def extract_day_estimate(analysis: str) -> float:
     """Extract person-days estimate from analysis text"""
-    for line in analysis.split('\n'):
-        if 'Person-days:' in line:
-            try:
-                return float(line.split(':')[1].strip())
-            except Exception:
-                pass
-    return None
+    return parse_response(analysis).person_days
 
-def handle_story_workflow_days(story: Dict[str, Any], step: str, action: str) -> Dict[str, Any]:
+def handle_story_workflow_days(story: Dict[str, Any], step: str, action: str, resources=None,
+                               mode: Optional[str] = None, consensus: Optional[bool] = None) -> Dict[str, Any]:
     """
     Handle the story workflow steps with person-day estimates:
     - Initial Analysis (Agile Coach)
     - Technical Review
     - Team Day Estimation
+    resources: optional WorkflowResources to reuse the worker's analyzer, team and executor
+    mode: estimation mode, per_persona (default) or panel
+    consensus: stop estimating once a quorum agrees (default from ESTIMATION_CONSENSUS)
     """
-    analyzer = StoryAnalyzer()
+    analyzer = resources.analyzer if resources else StoryAnalyzer()
     
     if step == "start":
-        return analyzer.start_analysis(story)
+        return analyzer.start_analysis(Story(**story) if isinstance(story, dict) else story)
     
     elif step == "agile_feedback":
         return analyzer.process_user_feedback(story, action == "approve")
         
     elif step == "technical_feedback" and action == "approve":
-        return get_team_day_estimates(story)
+        if resources:
+            return get_team_day_estimates(story, resources.day_team, resources.estimation_executor, mode, consensus)
+        return get_team_day_estimates(story, mode=mode, consensus=consensus)
     
     return {"error": "Invalid step or action"} 
\ No newline at end of file
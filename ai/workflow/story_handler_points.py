@@ -0,0 +1,142 @@
+import os
+import sys
+import json
+import concurrent.futures
+from typing import Dict, List, Any, Optional, Iterator
+
+# Add the project root to Python path
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(project_root)
+
+from ai.shared.response_parser import parse_response
+from ai.shared.logging_utils import get_logger
+from ai.shared.metrics import traced
+from ai.shared.usage import tracks_usage
+from ai.shared.story_schema import PointEstimateOutput
+from ai.workflow.panel_estimation import PANEL, panel_estimates, resolve_estimation_mode
+from ai.workflow.consensus import ConsensusWatch, collect_estimates, consensus_enabled
+from ai.workflow.deadlines import TIMED_OUT, fan_out, get_latency_window, timed_out_entry
+from ai.shared.scheduler import ESTIMATION, priority
+from ai.agents.team_points.base_estimator import BaseTeamMemberPoints
+from ai.agents.team_points.senior_dev_lead import SeniorDevLeadPoints
+from ai.agents.team_points.senior_dev import SeniorDevPoints
+from ai.agents.team_points.mid_dev import MidDevPoints
+from ai.agents.team_points.junior_dev import JuniorDevPoints
+from ai.agents.team_points.grad_dev import GradDevPoints
+from ai.agents.team_points.senior_qa import SeniorQAPoints
+from ai.agents.team_points.junior_qa import JuniorQAPoints
+
+logger = get_logger(__name__)
+
+FIBONACCI_POINTS = [1, 2, 3, 5, 8, 13, 21]  # Standard Fibonacci sequence for story points
+
+def build_points_team() -> List[BaseTeamMemberPoints]:
+    """Create one of each story point estimator"""
+    return [
+        SeniorDevLeadPoints(),
+        SeniorDevPoints(),
+        MidDevPoints(),
+        JuniorDevPoints(),
+        GradDevPoints(),
+        SeniorQAPoints(),
+        JuniorQAPoints()
+    ]
+
+@traced('get_team_point_estimates', is_error=lambda summary: summary['total_estimates'] == 0)
+@tracks_usage
+def get_team_point_estimates(story_data: Dict[str, Any],
+                             team: Optional[List[BaseTeamMemberPoints]] = None,
+                             executor: Optional[concurrent.futures.Executor] = None,
+                             mode: Optional[str] = None,
+                             consensus: Optional[bool] = None) -> Dict[str, Any]:
+    """
+    Get story point estimates from all team members and round the average to Fibonacci.
+    consensus stops once a quorum agrees (see ai.workflow.consensus)
+    """
+    team = team or build_points_team()
+    watch = None
+    if consensus_enabled(consensus) and resolve_estimation_mode(mode) != PANEL:
+        watch = ConsensusWatch(team)
+    responses = collect_estimates(iter_team_point_estimates(story_data, team, executor, mode), watch)
+    summary = summarize_point_estimates(responses)
+    if watch is not None:
+        summary['consensus'] = watch.result()
+    return summary
+
+def iter_team_point_estimates(story_data: Dict[str, Any],
+                              team: Optional[List[BaseTeamMemberPoints]] = None,
+                              executor: Optional[concurrent.futures.Executor] = None,
+                              mode: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """Yield each team member's {name, role, estimate, justification} as soon as it completes"""
+    if team is None:
+        team = build_points_team()
+
+    if resolve_estimation_mode(mode) == PANEL:
+        yield from panel_estimates(team, story_data, PointEstimateOutput)
+        return
+
+    event = {
+        'body': {
+            'story': story_data['text'],
+            'acceptance_criteria': story_data['acceptance_criteria'],
+            'context': story_data.get('context', '')
+        }
+    }
+
+    if executor is None:
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=len(team))
+        try:
+            yield from _iter_estimates(team, event, executor)
+        finally:
+            # Don't wait for calls the consumer stopped waiting for (early stop, disconnect)
+            executor.shutdown(wait=False, cancel_futures=True)
+    else:
+        yield from _iter_estimates(team, event, executor)
+
+def summarize_point_estimates(responses: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Aggregate individual estimates; 'points' is the Fibonacci number closest to the average"""
+    estimates = [r['estimate'] for r in responses if r['estimate'] is not None]
+    average = sum(estimates) / len(estimates) if estimates else 0
+
+    return {
+        'team_estimates': responses,
+        'average': round(average, 1),
+        'points': min(FIBONACCI_POINTS, key=lambda x: abs(x - average)) if estimates else None,
+        'total_estimates': len(estimates),
+        'timed_out': [r['name'] for r in responses if r.get('status') == TIMED_OUT]
+    }
+
+def _estimate(member: BaseTeamMemberPoints, event: Dict[str, Any]) -> Dict[str, Any]:
+    """One persona's estimate, dispatched at estimation priority"""
+    with priority(ESTIMATION):
+        return member.estimate_effort(event)
+
+def _iter_estimates(team: List[BaseTeamMemberPoints], event: Dict[str, Any],
+                    executor: concurrent.futures.Executor) -> Iterator[Dict[str, Any]]:
+    """Fan the estimation event out to the team and yield responses (or timed-out markers) as they complete"""
+    estimates = fan_out(team, lambda member: _estimate(member, event), executor, get_latency_window('points'))
+    try:
+        for member, future in estimates:
+            if future is None:
+                yield timed_out_entry(member)
+                continue
+            try:
+                response = future.result()
+                if response['statusCode'] == 200:
+                    body = json.loads(response['body'])
+                    yield {
+                        'name': member.name,
+                        'role': member.role,
+                        'estimate': body['structured']['story_points'] if body.get('structured') else extract_point_estimate(body['analysis']),
+                        'justification': body['analysis']
+                    }
+                else:
+                    logger.warning("No estimate from %s (status %s)", member.name, response['statusCode'])
+            except Exception as e:
+                logger.error("Error getting estimate from %s: %s", member.name, e)
+    finally:
+        estimates.close()
+
+def extract_point_estimate(analysis: str) -> float:
+    """Extract story points estimate from analysis text"""
+    return parse_response(analysis).story_points
@@ -1,17 +1,19 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Depends, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
 
-print("Attempting to import story_handler_days...")
 from ai.workflow.story_handler_days import handle_story_workflow_days
-print("Successfully imported story_handler_days")
+from ai.shared.story_analyzer import Story as AnalysisStory
+from ai.shared.logging_utils import RequestIdMiddleware, get_request_id
+from ai.workflow.resources import WorkflowResources, create_lifespan
+from ai.workflow.sessions import SessionConflict
+from ai.workflow.job_worker import STORY_WORKFLOW_DAYS
+from ai.shared.story_store import TECHNICAL_REVIEW
+from backend.app.routers.story import EstimationRequest, estimation_mode, estimation_story, record_estimates
 
-print("Attempting to import story_analyzer...")
-from ai.shared.story_analyzer import StoryAnalyzer
-print("Successfully imported story_analyzer")
-
-app = FastAPI()
+app = FastAPI(lifespan=create_lifespan())
 
 # Enable CORS
 app.add_middleware(
@@ -21,6 +23,11 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(RequestIdMiddleware)
+
+def get_resources(request: Request) -> WorkflowResources:
+    """Per-worker resources created by the app lifespan"""
+    return request.app.state.resources
 
 class Story(BaseModel):
     text: str
@@ -29,41 +36,117 @@ class Story(BaseModel):
     version: int
 
 class AnalysisFeedback(BaseModel):
-    analysis_result: Dict[str, Any]
+    analysis_result: Optional[Dict[str, Any]] = None
+    analysis_id: Optional[str] = None  # a stored analysis (see ai.shared.story_store)
     approved: bool
 
-class EstimationRequest(BaseModel):
-    story: Story
+class SessionDecision(BaseModel):
+    approved: bool
+    story: Optional[Story] = None  # an edited story to re-run the current stage on
 
 @app.post("/api/analyze")
-async def analyze_story(story: Story):
+async def analyze_story(story: Story, resources: WorkflowResources = Depends(get_resources)):
     try:
-        analyzer = StoryAnalyzer()
-        result = analyzer.start_analysis(story.dict())
-        return result
+        result = await resources.analyzer.start_analysis_async(AnalysisStory(**story.dict()))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    if result.status_code == 413:
+        raise HTTPException(status_code=413, detail=result.analysis)
+    if resources.story_store is not None:
+        resources.story_store.record_analysis(result, None)
+    return result
 
 @app.post("/api/analyze/feedback")
-async def process_feedback(feedback: AnalysisFeedback):
+async def process_feedback(feedback: AnalysisFeedback, resources: WorkflowResources = Depends(get_resources)):
+    analysis = feedback.analysis_result
+    if analysis is None:
+        if feedback.analysis_id is None or resources.story_store is None:
+            raise HTTPException(status_code=400, detail="analysis_result is required")
+        analysis = resources.story_store.load_analysis(feedback.analysis_id)
+        if analysis is None:
+            raise HTTPException(status_code=404, detail=f"Analysis {feedback.analysis_id} not found")
     try:
-        analyzer = StoryAnalyzer()
-        result = analyzer.process_user_feedback(
-            feedback.analysis_result,
+        result = await resources.analyzer.process_user_feedback_async(
+            analysis,
             feedback.approved
         )
-        return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    if result.get('status_code') == 413:
+        raise HTTPException(status_code=413, detail=result.get('message'))
+    if resources.story_store is not None:
+        resources.story_store.record_analysis(result, analysis.get('story_id'), stage=TECHNICAL_REVIEW)
+    return result
+
+@app.post("/api/sessions")
+async def start_session(story: Story, resources: WorkflowResources = Depends(get_resources)):
+    if resources.sessions is None:
+        raise HTTPException(status_code=400, detail="Workflow sessions need story storage")
+    return await resources.sessions.start(AnalysisStory(**story.dict()))
+
+@app.get("/api/sessions/{session_id}")
+async def get_session(session_id: str, resources: WorkflowResources = Depends(get_resources)):
+    if resources.sessions is None:
+        raise HTTPException(status_code=400, detail="Workflow sessions need story storage")
+    try:
+        return resources.sessions.view(resources.sessions.get(session_id))
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e.args[0]))
+
+@app.post("/api/sessions/{session_id}/decision")
+async def decide_session(session_id: str, decision: SessionDecision, resources: WorkflowResources = Depends(get_resources)):
+    if resources.sessions is None:
+        raise HTTPException(status_code=400, detail="Workflow sessions need story storage")
+    story = AnalysisStory(**decision.story.dict()) if decision.story else None
+    try:
+        return await resources.sessions.decide(session_id, decision.approved, story)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e.args[0]))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except SessionConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
 
 @app.post("/api/estimate/days")
-async def estimate_days(request: EstimationRequest):
+async def estimate_days(request: EstimationRequest, resources: WorkflowResources = Depends(get_resources)):
+    mode = estimation_mode(request)
+    story, story_id, version = estimation_story(request, resources)
     try:
-        result = handle_story_workflow_days(
-            story=request.story.dict(),
+        result = await run_in_threadpool(
+            handle_story_workflow_days,
+            story=story,
             step="technical_feedback",
-            action="approve"
+            action="approve",
+            resources=resources,
+            mode=mode,
+            consensus=request.consensus
         )
+        record_estimates(resources, result, story_id, version)
         return result
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/jobs/estimate/days", status_code=202)
+async def queue_day_estimation(request: EstimationRequest, resources: WorkflowResources = Depends(get_resources)):
+    """Queue team day estimation instead of holding the connection; poll /api/jobs/{job_id}"""
+    mode = estimation_mode(request)
+    story, story_id, version = estimation_story(request, resources)
+    job = resources.job_queue.enqueue(STORY_WORKFLOW_DAYS, {
+        'story': story,
+        'step': 'technical_feedback',
+        'action': 'approve',
+        'mode': mode,
+        'consensus': request.consensus,
+        'story_id': story_id,
+        'version': version,
+        'request_id': get_request_id()
+    })
+    return job.to_dict()
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str, wait: float = 0, resources: WorkflowResources = Depends(get_resources)):
+    """Job status and result; wait long-polls up to that many seconds (max 60)"""
+    job = await resources.job_queue.await_job(job_id, min(max(wait, 0), 60.0))
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job.to_dict()
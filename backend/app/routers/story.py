@@ -1,64 +1,339 @@
-from fastapi import APIRouter, HTTPException
-from ai.shared.story_analyzer import StoryAnalyzer, Story, AnalysisResult
+from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from ai.shared.story_analyzer import Story, AnalysisResult
 from pydantic import BaseModel
-from typing import Dict, Any
-from ai.workflow.story_handler_days import handle_story_workflow_days
+from typing import Dict, Any, List, Optional, Tuple
+import json
+from ai.workflow.story_handler_days import handle_story_workflow_days, iter_team_day_estimates, summarize_day_estimates
+from ai.workflow.resources import WorkflowResources
+from ai.workflow.sessions import SessionConflict, SessionManager
+from ai.workflow.job_worker import STORY_WORKFLOW_DAYS
+from ai.workflow.panel_estimation import PANEL, resolve_estimation_mode
+from ai.workflow.consensus import ConsensusWatch, consensus_enabled
+from ai.workflow.batch_analysis import analyze_batch, BATCH_SYNC_LIMIT, DEFAULT_BATCH_CONCURRENCY
+from ai.shared.llm_cache import get_llm_cache
+from ai.shared.story_store import StoryStore, TECHNICAL_REVIEW
+from ai.shared.usage import get_usage_totals
+from ai.shared.logging_utils import get_logger, get_request_id, Payload
+
+logger = get_logger(__name__)
 
 router = APIRouter()
 
+def get_resources(request: Request) -> WorkflowResources:
+    """Per-worker resources created by the app lifespan"""
+    return request.app.state.resources
+
+def sse_event(event: str, data: Any) -> str:
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+SSE_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+MAX_JOB_WAIT_S = 60.0
+
 class FeedbackRequest(BaseModel):
-    analysis_result: Dict[str, Any]
+    analysis_result: Optional[Dict[str, Any]] = None
+    analysis_id: Optional[str] = None  # a stored analysis, instead of sending analysis_result back
     approved: bool
 
 class EstimationRequest(BaseModel):
-    story: Story  # Using the Story model from story_analyzer
+    story: Optional[Story] = None  # Using the Story model from story_analyzer
+    story_id: Optional[str] = None  # a stored story; without story, its version (default: current) is estimated
+    version: Optional[int] = None
+    mode: Optional[str] = None  # per_persona or panel; default from ESTIMATION_MODE
+    consensus: Optional[bool] = None  # stop once a quorum agrees; default from ESTIMATION_CONSENSUS
+
+def estimation_mode(request: EstimationRequest) -> str:
+    try:
+        return resolve_estimation_mode(request.mode)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def require_store(resources: WorkflowResources) -> StoryStore:
+    if resources.story_store is None:
+        raise HTTPException(status_code=400, detail="Story storage is disabled (STORY_STORE=off)")
+    return resources.story_store
+
+def reject_oversized(status_code: Optional[int], detail: str) -> None:
+    """A story rejected by the prompt budget is the client's error: answer 413, not a 200 error result"""
+    if status_code == 413:
+        raise HTTPException(status_code=413, detail=detail)
+
+def feedback_analysis(request: FeedbackRequest, resources: WorkflowResources) -> Dict[str, Any]:
+    """The analysis being approved or rejected: sent inline, or loaded by analysis_id"""
+    if request.analysis_result is not None:
+        return request.analysis_result
+    if request.analysis_id is None:
+        raise HTTPException(status_code=400, detail="Either analysis_result or analysis_id is required")
+    analysis = require_store(resources).load_analysis(request.analysis_id)
+    if analysis is None:
+        raise HTTPException(status_code=404, detail=f"Analysis {request.analysis_id} not found")
+    return analysis
+
+def estimation_story(request: EstimationRequest, resources: WorkflowResources) -> Tuple[Dict[str, Any], Optional[str], int]:
+    """
+    The story to estimate as (story dict, story_id, version). An inline story
+    is stored (as a version of story_id, if given) so its estimates can be kept
+    """
+    store = resources.story_store
+    if request.story is not None:
+        story_id, version = request.story_id, request.story.version
+        if store is not None:
+            try:
+                story_id, version = store.save_story(request.story, story_id)
+            except KeyError as e:
+                raise HTTPException(status_code=404, detail=str(e.args[0]))
+        return {**request.story.to_dict(), 'version': version}, story_id, version
+    if request.story_id is None:
+        raise HTTPException(status_code=400, detail="Either story or story_id is required")
+    story = require_store(resources).get_story(request.story_id, request.version)
+    if story is None:
+        raise HTTPException(status_code=404, detail=f"Story {request.story_id} version {request.version} not found")
+    return story.to_dict(), request.story_id, story.version
+
+def record_estimates(resources: WorkflowResources, summary: Dict[str, Any], story_id: Optional[str], version: int) -> None:
+    if resources.story_store is not None and story_id is not None:
+        summary['story_id'] = story_id
+        summary['estimate_run_id'] = resources.story_store.record_estimates(summary, story_id, version, unit='days')
+
+class DecisionRequest(BaseModel):
+    approved: bool
+    story: Optional[Story] = None  # an edited story to re-run the current stage on
+
+def require_sessions(resources: WorkflowResources) -> SessionManager:
+    if resources.sessions is None:
+        raise HTTPException(status_code=400, detail="Workflow sessions need story storage (STORY_STORE=off)")
+    return resources.sessions
+
+class BatchAnalysisRequest(BaseModel):
+    stories: List[Story]
+    concurrency: int = DEFAULT_BATCH_CONCURRENCY
+    background: Optional[bool] = None  # default: background only for large batches
 
 @router.post("/analyze")
-async def analyze_story(story: Story) -> AnalysisResult:
+async def analyze_story(story: Story, story_id: Optional[str] = None,
+                        resources: WorkflowResources = Depends(get_resources)) -> AnalysisResult:
+    """Analyze a story; with story_id it is stored as a new version of that story"""
+    if story_id is not None and require_store(resources).get_status(story_id) is None:
+        raise HTTPException(status_code=404, detail=f"Story {story_id} not found")
     try:
-        analyzer = StoryAnalyzer()
-        result = analyzer.start_analysis(story)
-        return result
+        result = await resources.analyzer.start_analysis_async(story)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    reject_oversized(result.status_code, result.analysis)
+    if resources.story_store is not None:
+        resources.story_store.record_analysis(result, story_id)
+    return result
+
+@router.post("/analyze/stream")
+async def analyze_story_stream(story: Story, story_id: Optional[str] = None,
+                               resources: WorkflowResources = Depends(get_resources)):
+    """
+    Agile Coach analysis as Server-Sent Events: a 'token' event per generated
+    fragment, then a 'result' event carrying the parsed AnalysisResult
+    """
+    if story_id is not None and require_store(resources).get_status(story_id) is None:
+        raise HTTPException(status_code=404, detail=f"Story {story_id} not found")
+    
+    async def events():
+        async for kind, payload in resources.analyzer.stream_analysis(story):
+            if kind == 'token':
+                yield sse_event('token', {'text': payload})
+            else:
+                if resources.story_store is not None:
+                    resources.story_store.record_analysis(payload, story_id)
+                yield sse_event('result', payload.to_dict())
+    
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+@router.post("/analyze/batch")
+async def analyze_batch_stories(request: BatchAnalysisRequest, resources: WorkflowResources = Depends(get_resources)) -> Dict[str, Any]:
+    """
+    Analyze many stories with bounded concurrency. Small batches return results
+    inline; large ones return a job handle to poll at /analyze/batch/{job_id}
+    """
+    background = request.background
+    if background is None:
+        background = len(request.stories) > BATCH_SYNC_LIMIT
+    
+    if background:
+        job = resources.batch_jobs.start(resources.analyzer, request.stories, request.concurrency)
+        return job.to_dict(include_results=False)
+    
+    try:
+        results = await analyze_batch(resources.analyzer, request.stories, request.concurrency)
+        return {
+            'status': 'complete',
+            'total': len(results),
+            'results': [result.to_dict() for result in results]
+        }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/analyze/batch/{job_id}")
+async def get_batch_job(job_id: str, resources: WorkflowResources = Depends(get_resources)) -> Dict[str, Any]:
+    job = resources.batch_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Batch job {job_id} not found")
+    return job.to_dict()
+
 @router.post("/analyze/feedback")
-async def process_feedback(request: FeedbackRequest) -> Dict[str, Any]:
+async def process_feedback(request: FeedbackRequest, resources: WorkflowResources = Depends(get_resources)) -> Dict[str, Any]:
+    analysis = feedback_analysis(request, resources)
     try:
-        analyzer = StoryAnalyzer()
-        result = analyzer.process_user_feedback(
-            request.analysis_result,
+        result = await resources.analyzer.process_user_feedback_async(
+            analysis,
             request.approved
         )
-        return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    reject_oversized(result.get('status_code'), result.get('message'))
+    if resources.story_store is not None:
+        resources.story_store.record_analysis(result, analysis.get('story_id'), stage=TECHNICAL_REVIEW)
+    return result
 
 @router.post("/estimate/days")
-async def estimate_days(request: EstimationRequest):
+async def estimate_days(request: EstimationRequest, resources: WorkflowResources = Depends(get_resources)):
+    mode = estimation_mode(request)
+    story_dict, story_id, version = estimation_story(request, resources)
     try:
-        print(f"Received story: {request.story}")  # Debug
-        print(f"Story type: {type(request.story)}")  # Debug
+        logger.debug("Estimating story: %s", Payload(story_dict))
         
-        # Try both ways:
-        try:
-            story_dict = request.story.dict()
-            print(f"Using .dict(): {story_dict}")  # Debug
-        except:
-            story_dict = {
-                "text": request.story.text,
-                "acceptance_criteria": request.story.acceptance_criteria,
-                "context": request.story.context,
-                "version": request.story.version
-            }
-            print(f"Using manual dict: {story_dict}")  # Debug
-        
-        result = handle_story_workflow_days(
+        result = await run_in_threadpool(
+            handle_story_workflow_days,
             story=story_dict,
             step="technical_feedback",
-            action="approve"
+            action="approve",
+            resources=resources,
+            mode=mode,
+            consensus=request.consensus
         )
+        record_estimates(resources, result, story_id, version)
         return result
     except Exception as e:
-        print(f"Error in estimate_days: {str(e)}")  # Debug
-        raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+        logger.exception("Error in estimate_days: %s", e)
+        raise HTTPException(status_code=500, detail=str(e)) 
+
+@router.post("/estimate/days/stream")
+async def estimate_days_stream(request: EstimationRequest, resources: WorkflowResources = Depends(get_resources)):
+    """
+    Person-day estimation as Server-Sent Events: an 'estimate' event per team
+    member as they finish (with the running average), then a 'complete' event
+    with the same shape as /estimate/days
+    """
+    mode = estimation_mode(request)
+    story_dict, story_id, version = estimation_story(request, resources)
+    team = resources.day_team
+    watch = ConsensusWatch(team) if consensus_enabled(request.consensus) and mode != PANEL else None
+    
+    # Sync generator: StreamingResponse iterates it in the threadpool
+    def events():
+        responses = []
+        estimates = iter_team_day_estimates(story_dict, team, resources.estimation_executor, mode)
+        try:
+            for entry in estimates:
+                responses.append(entry)
+                summary = summarize_day_estimates(responses)
+                yield sse_event('estimate', {
+                    **entry,
+                    'running_average': summary['average'],
+                    'completed': len(responses),
+                    'team_size': len(team)
+                })
+                if watch is not None and watch.add(entry):
+                    break
+        finally:
+            estimates.close()
+        summary = summarize_day_estimates(responses)
+        if watch is not None:
+            summary['consensus'] = watch.result()
+        record_estimates(resources, summary, story_id, version)
+        yield sse_event('complete', summary)
+    
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+@router.post("/sessions")
+async def start_session(story: Story, resources: WorkflowResources = Depends(get_resources)) -> Dict[str, Any]:
+    """Open a workflow session for a story and run the Agile Coach review"""
+    return await require_sessions(resources).start(story)
+
+@router.get("/sessions/{session_id}")
+async def get_session(session_id: str, resources: WorkflowResources = Depends(get_resources)) -> Dict[str, Any]:
+    sessions = require_sessions(resources)
+    try:
+        return sessions.view(sessions.get(session_id))
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e.args[0]))
+
+@router.post("/sessions/{session_id}/decision")
+async def decide_session(session_id: str, request: DecisionRequest,
+                         resources: WorkflowResources = Depends(get_resources)) -> Dict[str, Any]:
+    """Approve or reject the result awaiting review and run the next stage"""
+    try:
+        return await require_sessions(resources).decide(session_id, request.approved, request.story)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e.args[0]))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except SessionConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@router.post("/jobs/analyze", status_code=202)
+async def queue_analysis(story: Story, story_id: Optional[str] = None,
+                         resources: WorkflowResources = Depends(get_resources)) -> Dict[str, Any]:
+    """Queue the Agile Coach analysis; poll /jobs/{job_id} for the AnalysisResult"""
+    if story_id is not None and require_store(resources).get_status(story_id) is None:
+        raise HTTPException(status_code=404, detail=f"Story {story_id} not found")
+    job = resources.job_queue.enqueue(STORY_WORKFLOW_DAYS, {
+        'story': story.to_dict(),
+        'step': 'start',
+        'story_id': story_id,
+        'request_id': get_request_id()
+    })
+    return job.to_dict()
+
+@router.post("/jobs/estimate/days", status_code=202)
+async def queue_day_estimation(request: EstimationRequest, resources: WorkflowResources = Depends(get_resources)) -> Dict[str, Any]:
+    """Queue team day estimation; poll /jobs/{job_id} for the /estimate/days response"""
+    mode = estimation_mode(request)
+    story_dict, story_id, version = estimation_story(request, resources)
+    job = resources.job_queue.enqueue(STORY_WORKFLOW_DAYS, {
+        'story': story_dict,
+        'step': 'technical_feedback',
+        'action': 'approve',
+        'mode': mode,
+        'consensus': request.consensus,
+        'story_id': story_id,
+        'version': version,
+        'request_id': get_request_id()
+    })
+    return job.to_dict()
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str, wait: float = 0, resources: WorkflowResources = Depends(get_resources)) -> Dict[str, Any]:
+    """Job status and result; with wait, long-poll up to that many seconds (max 60) for it to finish"""
+    job = await resources.job_queue.await_job(job_id, min(max(wait, 0), MAX_JOB_WAIT_S))
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job.to_dict()
+
+@router.get("/stories/{story_id}")
+async def get_story_history(story_id: str, resources: WorkflowResources = Depends(get_resources)) -> Dict[str, Any]:
+    """A stored story's current version and status, with its analyses and estimates"""
+    history = require_store(resources).history(story_id)
+    if history is None:
+        raise HTTPException(status_code=404, detail=f"Story {story_id} not found")
+    return history
+
+@router.get("/stats")
+async def get_stats(resources: WorkflowResources = Depends(get_resources)) -> Dict[str, Any]:
+    """Connection pool, LLM cache and token usage counters"""
+    cache = get_llm_cache()
+    return {
+        'http_pool': resources.http_pool.stats(),
+        'llm_cache': cache.stats() if cache else None,
+        'llm_usage': get_usage_totals().summary(),
+        'jobs': resources.job_queue.stats()
+    }
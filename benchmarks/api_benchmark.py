@@ -0,0 +1,266 @@
+"""
+End-to-end latency and throughput benchmark for the FastAPI backend.
+
+Starts backend/app/main.py under uvicorn with the offline fake LLM backend,
+drives /api/analyze, /api/analyze/feedback and /api/estimate/days at
+increasing concurrency, and reports p50/p95/p99 latency, requests/sec, peak
+RSS and thread count of the server process. Results are written as JSON to
+benchmarks/output/ (named by commit) for comparison across commits.
+
+Usage:
+    python benchmarks/api_benchmark.py [--concurrency 1,4,16] [--requests 40] [--latency-ms 200]
+"""
+import os
+import sys
+import json
+import time
+import socket
+import tempfile
+import asyncio
+import argparse
+import threading
+import subprocess
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
+import aiohttp
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+OUTPUT_DIR = os.path.join(project_root, 'benchmarks', 'output')
+
+STORY = {
+    'text': "As a unified platform user, I want to set up a daily schedule that reoccurs every 1 to 6 days so that I can manage my tasks efficiently.",
+    'acceptance_criteria': [
+        "The user can select 'Daily' as the 'Interval' when creating or editing a schedule.",
+        "The user can set 'Recur Every' to a number between '1' and '6'.",
+        "The user receives an error message for values outside '1' to '6'."
+    ],
+    'context': "Scheduling service with a schedules table",
+    'version': 1
+}
+
+ENDPOINTS = {
+    'analyze': ('/api/analyze', STORY),
+    'feedback': ('/api/analyze/feedback', {
+        'analysis_result': {
+            'original_story': STORY,
+            'improved_story': None,
+            'analysis': "INVEST Analysis:\n- Independent: Yes",
+            'suggestions': {},
+            'status': 'agile_review'
+        },
+        'approved': True
+    }),
+    'estimate_days': ('/api/estimate/days', {'story': STORY}),
+}
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=project_root, text=True).strip()
+    except Exception:
+        return 'unknown'
+
+
+class ProcessSampler:
+    """Samples RSS and thread count of a process in the background"""
+
+    def __init__(self, pid: int, interval: float = 0.1):
+        self.pid = pid
+        self.interval = interval
+        self.peak_rss_bytes = 0
+        self.max_threads = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        try:
+            import psutil
+            self._process = psutil.Process(pid)
+        except ImportError:
+            self._process = None
+
+    def _read(self):
+        if self._process is not None:
+            return self._process.memory_info().rss, self._process.num_threads()
+        rss = threads = None
+        with open(f'/proc/{self.pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    rss = int(line.split()[1]) * 1024
+                elif line.startswith('Threads:'):
+                    threads = int(line.split()[1])
+        return rss, threads
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                rss, threads = self._read()
+            except (OSError, ValueError):
+                return  # no psutil and no /proc: resource stats unavailable
+            self.peak_rss_bytes = max(self.peak_rss_bytes, rss or 0)
+            self.max_threads = max(self.max_threads, threads or 0)
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(port: int, latency_ms: float) -> subprocess.Popen:
+    env = dict(os.environ)
+    env.update({
+        'LLM_BACKEND': 'fake',
+        'LLM_CACHE': 'off',  # every request must reach the (simulated) LLM
+        'STORY_STORE': 'memory',  # keep benchmark stories out of the real store and job queue
+        'JOB_QUEUE_PATH': os.path.join(tempfile.mkdtemp(prefix='api-benchmark-'), 'jobs.sqlite3'),
+        'FAKE_LLM_LATENCY_MS': str(latency_ms),
+        'FAKE_LLM_JITTER_MS': str(latency_ms / 2),
+    })
+    # Measure the API itself unless a rate limit is asked for explicitly
+    env.setdefault('LLM_RPM_LIMIT', '0')
+    env.setdefault('LLM_TPM_LIMIT', '0')
+    return subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'app.main:app', '--app-dir', 'backend',
+         '--port', str(port), '--log-level', 'warning'],
+        cwd=project_root, env=env
+    )
+
+
+async def wait_ready(base_url: str, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            try:
+                async with session.get(f"{base_url}/docs") as resp:
+                    if resp.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError("Server did not start in time")
+
+
+async def run_level(base_url: str, path: str, payload: Dict[str, Any], concurrency: int, total: int) -> Dict[str, Any]:
+    """Send `total` requests with `concurrency` in flight and collect latencies"""
+    latencies: List[float] = []
+    errors = 0
+    queue: asyncio.Queue = asyncio.Queue()
+    for _ in range(total):
+        queue.put_nowait(None)
+
+    async def worker(session: aiohttp.ClientSession):
+        nonlocal errors
+        while True:
+            try:
+                queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            started = time.perf_counter()
+            try:
+                async with session.post(f"{base_url}{path}", json=payload) as resp:
+                    await resp.read()
+                    if resp.status != 200:
+                        errors += 1
+            except aiohttp.ClientError:
+                errors += 1
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    timeout = aiohttp.ClientTimeout(total=600)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(session) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        'requests': total,
+        'errors': errors,
+        'p50_ms': round(percentile(latencies, 50), 1),
+        'p95_ms': round(percentile(latencies, 95), 1),
+        'p99_ms': round(percentile(latencies, 99), 1),
+        'requests_per_sec': round(total / elapsed, 2),
+        'elapsed_s': round(elapsed, 2)
+    }
+
+
+async def run(args) -> Dict[str, Any]:
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    server = start_server(port, args.latency_ms)
+    results = []
+    try:
+        await wait_ready(base_url)
+        for name in args.endpoints:
+            path, payload = ENDPOINTS[name]
+            for concurrency in args.concurrency:
+                total = max(args.requests, concurrency)
+                with ProcessSampler(server.pid) as sampler:
+                    stats = await run_level(base_url, path, payload, concurrency, total)
+                stats.update({
+                    'endpoint': path,
+                    'concurrency': concurrency,
+                    'peak_rss_mb': round(sampler.peak_rss_bytes / 2**20, 1) if sampler.peak_rss_bytes else None,
+                    'max_threads': sampler.max_threads or None
+                })
+                results.append(stats)
+                print(f"{path:<24} c={concurrency:<4} p50={stats['p50_ms']:>8}ms p95={stats['p95_ms']:>8}ms "
+                      f"p99={stats['p99_ms']:>8}ms rps={stats['requests_per_sec']:>7} errors={stats['errors']} "
+                      f"rss={stats['peak_rss_mb']}MB threads={stats['max_threads']}")
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+    return {
+        'commit': git_commit(),
+        'timestamp': datetime.now().isoformat(),
+        'config': {
+            'fake_latency_ms': args.latency_ms,
+            'requests_per_level': args.requests,
+            'concurrency': args.concurrency
+        },
+        'results': results
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the API against the simulated LLM")
+    parser.add_argument('--concurrency', default='1,2,4,8,16', help="Comma-separated concurrency levels")
+    parser.add_argument('--requests', type=int, default=40, help="Requests per endpoint and level")
+    parser.add_argument('--latency-ms', type=float, default=200, help="Median simulated LLM latency")
+    parser.add_argument('--endpoints', default=','.join(ENDPOINTS), help=f"Subset of {','.join(ENDPOINTS)}")
+    args = parser.parse_args()
+    args.concurrency = [int(c) for c in args.concurrency.split(',') if c.strip()]
+    args.endpoints = [e.strip() for e in args.endpoints.split(',') if e.strip()]
+    unknown = set(args.endpoints) - set(ENDPOINTS)
+    if unknown:
+        parser.error(f"Unknown endpoints: {', '.join(sorted(unknown))}")
+
+    report = asyncio.run(run(args))
+
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    path = os.path.join(OUTPUT_DIR, f"api_benchmark_{report['commit']}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Parse cost and parse-failure benchmark for LLM response parsing.
+
+Runs the shared single-pass parser (ai.shared.response_parser) and the
+previous per-consumer parsers over the recorded responses in
+benchmarks/corpus/responses.jsonl. Reports the mean cost per parse and how
+many responses each parser failed to extract the expected fields from.
+
+Usage:
+    python benchmarks/parse_benchmark.py [--repeat 2000] [--json results.json]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from typing import Dict, Any, List, Optional, Callable
+
+# Add the project root to Python path
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+from ai.shared.response_parser import parse_response
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpus', 'responses.jsonl')
+
+
+# --- Previous parsers, kept here (without their debug printing) as the baseline ---
+
+def legacy_extract_improved_story(analysis: str) -> Dict[str, Any]:
+    """StoryAnalyzer._extract_improved_story before the shared parser"""
+    possible_markers = ["\nImproved Story:\n", "Improved Story:", "\nImproved User Story:\n",
+                        "\nEnhanced Story:\n", "\nIMPROVED STORY:\n"]
+    story_start = -1
+    for marker in possible_markers:
+        story_start = analysis.find(marker)
+        if story_start != -1:
+            story_start += len(marker)
+            break
+    if story_start == -1:
+        return {'improved_story': False, 'acceptance_criteria': 0}
+
+    possible_ac_markers = ["\nEnhanced Acceptance Criteria:\n", "\nAcceptance Criteria:\n",
+                           "Enhanced Acceptance Criteria:", "Acceptance Criteria:", "\nACCEPTANCE CRITERIA:\n"]
+    story_end = -1
+    for marker in possible_ac_markers:
+        story_end = analysis.find(marker, story_start)
+        if story_end != -1:
+            break
+    if story_end == -1:
+        story_end = len(analysis)
+    story_text = analysis[story_start:story_end].strip()
+
+    ac_start = -1
+    for marker in possible_ac_markers:
+        ac_start = analysis.find(marker)
+        if ac_start != -1:
+            ac_start += len(marker)
+            break
+    acceptance_criteria = []
+    if ac_start != -1:
+        ac_end = analysis.find("\nAdditional Suggestions:", ac_start)
+        if ac_end == -1:
+            ac_end = len(analysis)
+        ac_text = analysis[ac_start:ac_end].strip()
+        acceptance_criteria = [c.strip('- ').strip() for c in ac_text.split('\n') if c.strip('- ').strip()]
+
+    found = bool(story_text and acceptance_criteria)
+    return {'improved_story': found, 'acceptance_criteria': len(acceptance_criteria) if found else 0}
+
+
+def legacy_line_value(label: str) -> Callable[[str], Optional[float]]:
+    """extract_day_estimate and the points scripts' line splitting"""
+    def extract(analysis: str) -> Optional[float]:
+        for line in analysis.split('\n'):
+            if label in line:
+                try:
+                    return float(line.split(':')[1].strip())
+                except Exception:
+                    pass
+        return None
+    return extract
+
+
+legacy_day_estimate = legacy_line_value('Person-days:')
+legacy_point_estimate = legacy_line_value('Story Points:')
+
+
+# --- Field extraction per response kind ---
+
+def shared_fields(kind: str, text: str) -> Dict[str, Any]:
+    parsed = parse_response(text)
+    if kind == 'agile':
+        found = bool(parsed.improved_story and parsed.acceptance_criteria)
+        return {'improved_story': found, 'acceptance_criteria': len(parsed.acceptance_criteria) if found else 0}
+    if kind == 'technical':
+        return {'feasibility': parsed.feasibility, 'complexity': parsed.complexity}
+    if kind == 'days':
+        return {'person_days': parsed.person_days}
+    return {'story_points': parsed.story_points}
+
+
+def legacy_fields(kind: str, text: str) -> Optional[Dict[str, Any]]:
+    if kind == 'agile':
+        return legacy_extract_improved_story(text)
+    if kind == 'days':
+        return {'person_days': legacy_day_estimate(text)}
+    if kind == 'points':
+        return {'story_points': legacy_point_estimate(text)}
+    return None  # technical fields were never parsed before
+
+
+def load_corpus(path: str = CORPUS_PATH) -> List[Dict[str, Any]]:
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def run(parser: Callable, corpus: List[Dict[str, Any]], repeat: int) -> Dict[str, Dict[str, Any]]:
+    """Time `parser` over each kind of response and count mismatches against the expectations"""
+    results: Dict[str, Dict[str, Any]] = {}
+    for kind in sorted({entry['kind'] for entry in corpus}):
+        entries = [entry for entry in corpus if entry['kind'] == kind]
+        if parser(kind, entries[0]['text']) is None:
+            continue
+        failures = sum(1 for entry in entries if parser(kind, entry['text']) != entry['expected'])
+        started = time.perf_counter()
+        for _ in range(repeat):
+            for entry in entries:
+                parser(kind, entry['text'])
+        elapsed = time.perf_counter() - started
+        results[kind] = {
+            'responses': len(entries),
+            'failures': failures,
+            'failure_rate': round(failures / len(entries), 3),
+            'mean_us_per_parse': round(elapsed / (repeat * len(entries)) * 1e6, 2)
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark LLM response parsing")
+    parser.add_argument('--repeat', type=int, default=2000, help="Passes over the corpus for timing")
+    parser.add_argument('--corpus', default=CORPUS_PATH)
+    parser.add_argument('--json', dest='json_path', help="Also write results to this JSON file")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    report = {
+        'corpus': os.path.relpath(args.corpus, project_root),
+        'repeat': args.repeat,
+        'shared_parser': run(shared_fields, corpus, args.repeat),
+        'legacy_parsers': run(legacy_fields, corpus, args.repeat)
+    }
+
+    print(f"{'kind':<10} {'parser':<8} {'responses':>9} {'failures':>8} {'us/parse':>9}")
+    for name, key in (('shared', 'shared_parser'), ('legacy', 'legacy_parsers')):
+        for kind, stats in report[key].items():
+            print(f"{kind:<10} {name:<8} {stats['responses']:>9} {stats['failures']:>8} {stats['mean_us_per_parse']:>9}")
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,22 @@
+-- Durable job queue for long-running workflow stages (ai/workflow/job_queue.py).
+-- Written for SQLite; payload and result are JSON TEXT. Times are Unix
+-- seconds so visibility checks are plain comparisons.
+
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,                 -- queued, running, complete or failed
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    visible_at REAL NOT NULL,             -- claimable from then; a running job's lease expiry
+    worker TEXT,                          -- holder of the current lease
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    finished_at REAL
+);
+
+CREATE INDEX IF NOT EXISTS idx_jobs_claim ON jobs (status, visible_at);
+CREATE INDEX IF NOT EXISTS idx_jobs_finished ON jobs (finished_at);
@@ -0,0 +1,78 @@
+-- Stories, their versions, and the results of each workflow stage.
+-- Written for SQLite (the default store, ai/shared/story_store.py); JSON
+-- columns are TEXT. Every statement is idempotent so the store can apply
+-- this file on startup.
+
+CREATE TABLE IF NOT EXISTS stories (
+    id TEXT PRIMARY KEY,
+    current_version INTEGER NOT NULL,
+    status TEXT NOT NULL,                 -- AnalysisStatus value, or 'input' after a rejection
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_stories_status ON stories (status);
+
+-- One row per version of a story: the original and each accepted rewrite
+CREATE TABLE IF NOT EXISTS story_versions (
+    story_id TEXT NOT NULL REFERENCES stories (id),
+    version INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    acceptance_criteria TEXT NOT NULL,    -- JSON array of strings
+    context TEXT NOT NULL DEFAULT '',
+    created_at TEXT NOT NULL,
+    PRIMARY KEY (story_id, version)
+);
+
+-- Agile Coach analyses (stage 'agile_review') and Senior Dev technical
+-- reviews (stage 'technical_review') of one story version
+CREATE TABLE IF NOT EXISTS analysis_results (
+    id TEXT PRIMARY KEY,
+    story_id TEXT NOT NULL REFERENCES stories (id),
+    version INTEGER NOT NULL,             -- the version that was analysed
+    stage TEXT NOT NULL,
+    status TEXT NOT NULL,
+    improved_version INTEGER,             -- story_versions row holding the suggested rewrite
+    analysis TEXT NOT NULL DEFAULT '',
+    suggestions TEXT NOT NULL DEFAULT '{}',  -- JSON object
+    usage TEXT,                           -- JSON token/cost summary
+    created_at TEXT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_analysis_results_story ON analysis_results (story_id, version);
+CREATE INDEX IF NOT EXISTS idx_analysis_results_status ON analysis_results (status);
+
+-- One row per persona per estimation run
+CREATE TABLE IF NOT EXISTS estimates (
+    id TEXT PRIMARY KEY,
+    run_id TEXT NOT NULL,                 -- groups the personas of one team estimation
+    story_id TEXT NOT NULL REFERENCES stories (id),
+    version INTEGER NOT NULL,
+    unit TEXT NOT NULL,                   -- 'days' or 'points'
+    persona TEXT NOT NULL,
+    role TEXT NOT NULL,
+    estimate REAL,                        -- NULL when the persona failed or timed out
+    justification TEXT,
+    status TEXT NOT NULL,                 -- 'complete', 'error' or 'timed_out'
+    created_at TEXT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_estimates_story ON estimates (story_id, version);
+CREATE INDEX IF NOT EXISTS idx_estimates_run ON estimates (run_id);
+CREATE INDEX IF NOT EXISTS idx_estimates_status ON estimates (status);
+
+-- Server-side workflow sessions (ai/workflow/sessions.py): where each story
+-- is in the review workflow, so clients only send a session id and a decision
+CREATE TABLE IF NOT EXISTS workflow_sessions (
+    id TEXT PRIMARY KEY,
+    story_id TEXT NOT NULL REFERENCES stories (id),
+    status TEXT NOT NULL,                 -- AnalysisStatus value
+    version INTEGER NOT NULL,             -- the story version under review
+    analysis_id TEXT REFERENCES analysis_results (id),  -- the result awaiting a decision
+    error TEXT,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_workflow_sessions_story ON workflow_sessions (story_id);
+CREATE INDEX IF NOT EXISTS idx_workflow_sessions_status ON workflow_sessions (status);
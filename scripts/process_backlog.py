@@ -0,0 +1,241 @@
+"""
+Batch backlog processor.
+
+Streams stories from a CSV or JSONL file through the selected pipeline stages
+and appends one JSON line per completed (story, stage) to the output file.
+The output file doubles as the checkpoint: on restart, stages already recorded
+as successful are skipped and their results reused as input to later stages,
+so no paid LLM call is repeated. Failed stages are logged but retried next run.
+
+Usage:
+    python scripts/process_backlog.py backlog.csv -o results.jsonl --stages agile,technical,days
+"""
+import os
+import sys
+import csv
+import json
+import time
+import hashlib
+import argparse
+import threading
+import concurrent.futures
+from datetime import datetime
+from typing import Dict, Any, Iterator, List, Set
+
+# Add the project root to Python path
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+from ai.shared.story_analyzer import StoryAnalyzer, Story, AnalysisStatus
+from ai.shared.http_pool import configure_http_pool
+from ai.workflow.resources import Credentials
+from ai.workflow.story_handler_days import build_day_team, get_team_day_estimates
+from ai.workflow.story_handler_points import build_points_team, get_team_point_estimates
+
+STAGES = ['agile', 'technical', 'days', 'points']
+
+
+def story_id(record: Dict[str, Any]) -> str:
+    """Use the record's id, or a stable hash of its content"""
+    if record.get('id'):
+        return str(record['id'])
+    content = json.dumps([record['text'], record['acceptance_criteria']], ensure_ascii=False)
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()[:16]
+
+
+def parse_acceptance_criteria(value: Any) -> List[str]:
+    """Accept a list, or a string with one criterion per line or separated by '|'"""
+    if isinstance(value, list):
+        return [str(ac).strip() for ac in value if str(ac).strip()]
+    if not value:
+        return []
+    separator = '\n' if '\n' in value else '|'
+    return [ac.strip().lstrip('- ').strip() for ac in value.split(separator) if ac.strip()]
+
+
+def read_stories(path: str) -> Iterator[Dict[str, Any]]:
+    """Stream story records from a .csv or .jsonl file without loading it all"""
+    with open(path, newline='', encoding='utf-8') as f:
+        if path.endswith('.csv'):
+            rows = csv.DictReader(f)
+        else:
+            rows = (json.loads(line) for line in f if line.strip())
+        for row in rows:
+            text = row.get('text') or row.get('story') or ''
+            if not text.strip():
+                continue
+            record = {
+                'id': row.get('id'),
+                'text': text.strip(),
+                'acceptance_criteria': parse_acceptance_criteria(row.get('acceptance_criteria')),
+                'context': row.get('context') or ''
+            }
+            record['id'] = story_id(record)
+            yield record
+
+
+def load_checkpoint(path: str) -> Dict[str, Dict[str, Any]]:
+    """Read successful stage results from a previous run's output"""
+    done: Dict[str, Dict[str, Any]] = {}
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # partial line from an interrupted write
+            if entry.get('status') == 'success':
+                done.setdefault(entry['id'], {})[entry['stage']] = entry['result']
+    return done
+
+
+class BacklogProcessor:
+    """Runs the pipeline stages for each story and appends results to the output"""
+
+    def __init__(self, output_path: str, stages: List[str], workers: int):
+        self.stages = stages
+        self.output_path = output_path
+        self.done = load_checkpoint(output_path)
+        self.analyzer = StoryAnalyzer()
+        self.day_team = build_day_team() if 'days' in stages else []
+        self.points_team = build_points_team() if 'points' in stages else []
+        fan_out = workers * max(len(self.day_team), len(self.points_team), 1)
+        configure_http_pool(maxsize=fan_out)
+        self.estimation_executor = concurrent.futures.ThreadPoolExecutor(max_workers=fan_out, thread_name_prefix='estimator')
+        self._output = open(output_path, 'a', encoding='utf-8')
+        self._lock = threading.Lock()
+        self.counts = {'success': 0, 'error': 0, 'skipped': 0}
+
+    def close(self) -> None:
+        self.estimation_executor.shutdown(wait=False, cancel_futures=True)
+        self._output.close()
+
+    def _record(self, record_id: str, stage: str, result: Any, ok: bool) -> None:
+        entry = {
+            'id': record_id,
+            'stage': stage,
+            'status': 'success' if ok else 'error',
+            'result': result,
+            'timestamp': datetime.now().isoformat()
+        }
+        line = json.dumps(entry, ensure_ascii=False) + '\n'
+        with self._lock:
+            self._output.write(line)
+            self._output.flush()
+            os.fsync(self._output.fileno())
+            self.counts['success' if ok else 'error'] += 1
+        print(f"{record_id} {stage}: {entry['status']}")
+
+    def _run_stage(self, record_id: str, stage: str, run) -> Any:
+        """Return the checkpointed result for a stage, or run it and record the outcome"""
+        previous = self.done.get(record_id, {})
+        if stage in previous:
+            with self._lock:
+                self.counts['skipped'] += 1
+            return previous[stage]
+        result, ok = run()
+        self._record(record_id, stage, result, ok)
+        return result if ok else None
+
+    def process(self, record: Dict[str, Any]) -> None:
+        record_id = record['id']
+        story = Story(
+            text=record['text'],
+            acceptance_criteria=record['acceptance_criteria'],
+            context=record['context']
+        )
+        estimation_context = story.context
+
+        if 'agile' in self.stages:
+            def agile():
+                result = self.analyzer.start_analysis(story)
+                return result.to_dict(), result.status != AnalysisStatus.ERROR
+            agile_result = self._run_stage(record_id, 'agile', agile)
+            if agile_result is None:
+                return
+            if agile_result.get('improved_story'):
+                story = Story(**agile_result['improved_story'])
+
+        if 'technical' in self.stages:
+            def technical():
+                result = self.analyzer.technical_review(story)
+                return result.to_dict(), result.status != AnalysisStatus.ERROR
+            technical_result = self._run_stage(record_id, 'technical', technical)
+            if technical_result is None:
+                return
+            # Estimators work from the Senior Dev analysis, as in the interactive workflow
+            estimation_context = technical_result.get('analysis') or estimation_context
+
+        story_data = {
+            'text': story.text,
+            'acceptance_criteria': story.acceptance_criteria,
+            'context': estimation_context
+        }
+
+        if 'days' in self.stages:
+            def days():
+                result = get_team_day_estimates(story_data, self.day_team, self.estimation_executor)
+                return result, result['total_estimates'] > 0
+            if self._run_stage(record_id, 'days', days) is None:
+                return
+
+        if 'points' in self.stages:
+            def points():
+                result = get_team_point_estimates(story_data, self.points_team, self.estimation_executor)
+                return result, result['total_estimates'] > 0
+            self._run_stage(record_id, 'points', points)
+
+    def is_complete(self, record_id: str) -> bool:
+        return all(stage in self.done.get(record_id, {}) for stage in self.stages)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Process a story backlog through the analysis pipeline")
+    parser.add_argument('input', help="Stories as .csv (id,text,acceptance_criteria,context) or .jsonl")
+    parser.add_argument('-o', '--output', default='backlog_results.jsonl', help="Append-only JSONL results/checkpoint file")
+    parser.add_argument('--stages', default='agile,technical,days', help=f"Comma-separated subset of {','.join(STAGES)}")
+    parser.add_argument('--workers', type=int, default=4, help="Stories processed in parallel")
+    args = parser.parse_args()
+
+    stages = [s.strip() for s in args.stages.split(',') if s.strip()]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f"Unknown stages: {', '.join(sorted(unknown))}")
+    stages = [s for s in STAGES if s in stages]
+
+    Credentials.load().apply()
+    processor = BacklogProcessor(args.output, stages, args.workers)
+    print(f"Resuming with {len(processor.done)} stories already in {args.output}")
+
+    started = time.time()
+    in_flight: Set[concurrent.futures.Future] = set()
+    total = 0
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix='story') as executor:
+            for record in read_stories(args.input):
+                if processor.is_complete(record['id']):
+                    continue
+                total += 1
+                # Keep a bounded window of stories in flight so the input is streamed
+                if len(in_flight) >= args.workers * 2:
+                    finished, in_flight = concurrent.futures.wait(in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in finished:
+                        if future.exception():
+                            print(f"Error processing story: {future.exception()}")
+                in_flight.add(executor.submit(processor.process, record))
+            for future in concurrent.futures.as_completed(in_flight):
+                if future.exception():
+                    print(f"Error processing story: {future.exception()}")
+    except KeyboardInterrupt:
+        print("\nInterrupted; completed stages are saved and will be skipped on the next run")
+    finally:
+        processor.close()
+
+    print(f"\nProcessed {total} stories in {time.time() - started:.1f}s")
+    print(f"Stages succeeded: {processor.counts['success']}, failed: {processor.counts['error']}, "
+          f"reused from checkpoint: {processor.counts['skipped']}")
+
+
+if __name__ == "__main__":
+    main()
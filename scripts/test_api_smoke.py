@@ -0,0 +1,75 @@
+"""
+Smoke test for the backend API against the offline fake LLM backend.
+
+Posts each request shape once and fails on any unexpected status code. No
+OpenAI key is needed, and nothing is written to the real LLM cache, story
+store or job queue.
+
+    python scripts/test_api_smoke.py
+"""
+import os
+import sys
+import tempfile
+
+# Add the project root (and backend/, for app.main) to Python path
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+sys.path.append(os.path.join(project_root, 'backend'))
+
+os.environ.update({
+    'LLM_BACKEND': 'fake',
+    'LLM_CACHE': 'off',
+    'FAKE_LLM_LATENCY_MS': '5',
+    'FAKE_LLM_JITTER_MS': '0',
+    'LLM_RPM_LIMIT': '0',
+    'LLM_TPM_LIMIT': '0',
+    'STORY_STORE': 'memory',
+    'JOB_QUEUE_PATH': os.path.join(tempfile.mkdtemp(), 'jobs.sqlite3'),
+})
+
+from fastapi.testclient import TestClient
+from app.main import app
+
+STORY = {
+    'text': 'As a user, I want to reset my password so that I can regain access to my account',
+    'acceptance_criteria': ['A reset link is emailed', 'The link expires after 24 hours'],
+    'context': 'Web application',
+    'version': 1
+}
+
+
+def check(response, expected: int, label: str):
+    if response.status_code != expected:
+        raise AssertionError(f"{label}: expected {expected}, got {response.status_code}: {response.text[:500]}")
+    print(f"ok  {label}")
+    return response
+
+
+def run_smoke_test():
+    with TestClient(app) as client:
+        analysis = check(client.post('/api/analyze', json=STORY), 200, 'analyze').json()
+        story_id = analysis['story_id']
+        check(client.post('/api/analyze', json={**STORY, 'text': 'x ' * 100000}), 413, 'analyze oversized story')
+        check(client.post('/api/analyze/feedback', json={'analysis_id': analysis['analysis_id'], 'approved': True}),
+              200, 'approve stored analysis')
+
+        check(client.post('/api/estimate/days', json={'story': STORY}), 200, 'estimate inline story')
+        check(client.post('/api/estimate/days', json={'story_id': story_id}), 200, 'estimate stored story')
+        check(client.post('/api/estimate/days', json={}), 400, 'estimate without a story')
+        check(client.post('/api/estimate/days', json={'story': STORY, 'story_id': 'missing'}), 404,
+              'estimate inline story for an unknown story_id')
+
+        stream = check(client.post('/api/estimate/days/stream', json={'story': STORY}), 200, 'stream estimates')
+        events = [line[len('event: '):] for line in stream.text.splitlines() if line.startswith('event: ')]
+        if not events or events[-1] != 'complete' or 'estimate' not in events:
+            raise AssertionError(f"unexpected stream events: {events}")
+
+        check(client.post('/api/jobs/analyze', params={'story_id': 'missing'}, json=STORY), 404, 'queue unknown story')
+        job = check(client.post('/api/jobs/estimate/days', json={'story': STORY}), 202, 'queue inline story').json()
+        job = check(client.get(f"/api/jobs/{job['job_id']}", params={'wait': 30}), 200, 'poll job').json()
+        if job['status'] != 'complete':
+            raise AssertionError(f"job ended {job['status']}: {job['error']}")
+
+
+if __name__ == "__main__":
+    run_smoke_test()
@@ -30,6 +30,7 @@ def load_env_vars():
             print("Failed to load OpenAI credentials")
             sys.exit(1)
 
+from ai.shared.response_parser import parse_response
 from ai.agents.team.senior_dev_lead import SeniorDevLead
 from ai.agents.team.senior_dev import SeniorDev
 from ai.agents.team.mid_dev import MidDev
@@ -62,14 +63,11 @@ def calculate_average_estimate(responses):
             analysis = body['analysis']
             
             # Extract person-days from the analysis
-            for line in analysis.split('\n'):
-                if 'Person-days:' in line:
-                    try:
-                        estimate = float(line.split(':')[1].strip())
-                        estimates.append(estimate)
-                        break
-                    except Exception as e:
-                        print(f"Error parsing estimate from {member['name']}: {e}")
+            estimate = parse_response(analysis).person_days
+            if estimate is not None:
+                estimates.append(estimate)
+            else:
+                print(f"Error parsing estimate from {member['name']}: no Person-days value found")
             
     if estimates:
         avg = sum(estimates) / len(estimates)
@@ -40,6 +40,7 @@ def load_env_vars():
             print("Failed to load OpenAI credentials")
             sys.exit(1)
 
+from ai.shared.response_parser import parse_response
 from ai.agents.team_points.senior_dev_lead import SeniorDevLeadPoints
 from ai.agents.team_points.senior_dev import SeniorDevPoints
 from ai.agents.team_points.mid_dev import MidDevPoints
@@ -73,14 +74,11 @@ def calculate_average_estimate(responses):
             analysis = body['analysis']
             
             # Extract story points from the analysis
-            for line in analysis.split('\n'):
-                if 'Story Points:' in line:
-                    try:
-                        estimate = float(line.split(':')[1].strip())
-                        estimates.append(estimate)
-                        break
-                    except Exception as e:
-                        print(f"Error parsing estimate from {member['name']}: {e}")
+            estimate = parse_response(analysis).story_points
+            if estimate is not None:
+                estimates.append(estimate)
+            else:
+                print(f"Error parsing estimate from {member['name']}: no Story Points value found")
     
     if estimates:
         # Calculate raw average